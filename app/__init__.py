@@ -1,11 +1,21 @@
 """Application factory for KJB chat community."""
 from flask import Flask
-from sqlalchemy import inspect, text
+from werkzeug.local import LocalProxy
+from .archive import init_message_archive, start_message_compactor
+from .backpressure import init_backpressure
 from .extensions import db, migrate, socketio
+from .cli import kjb_cli
+from .jobs import start_scheduler
+from .media import asset_url
+from .metrics import init_metrics
+from .profiling import install_profile_signal, scoped_views, start_hub_monitor
+from .push import register_push_listeners
+from .query_audit import init_query_audit
+from .read_state import start_read_flusher
 from .routes import views
+from .schema import ensure_schema
 from .sockets import register_socket_handlers
-from .utils import init_session, get_current_user, media_url, resolve_channel_permissions
-from .models import Channel
+from .utils import init_session, get_current_user, get_visible_channels, media_url
 
 
 def create_app(config_object="config.Config"):
@@ -13,44 +23,41 @@ def create_app(config_object="config.Config"):
     app.config.from_object(config_object)
 
     db.init_app(app)
+    init_message_archive(app)
     migrate.init_app(app, db)
     socketio.init_app(app)
     init_session(app)
+    init_metrics(app, socketio)
+    init_backpressure(app, socketio)
+    init_query_audit(app)
 
     app.register_blueprint(views.bp)
+    scoped_views(app)
+    app.cli.add_command(kjb_cli)
 
     @app.context_processor
     def inject_globals():
-        current_user = get_current_user()
-        channels = Channel.query.order_by(Channel.priority.desc(), Channel.name.asc()).all()
-        if current_user and not current_user.is_admin:
-            channels = [
-                channel
-                for channel in channels
-                if resolve_channel_permissions(current_user, channel)["can_view"]
-            ]
+        # Only pages that iterate ``channels`` pay for loading them.
         return {
-            "current_user": current_user,
-            "channels": channels,
+            "current_user": get_current_user(),
+            "channels": LocalProxy(get_visible_channels),
         }
 
     @app.template_filter("media")
-    def media_filter(value):
-        return media_url(value)
+    def media_filter(value, variant=None):
+        return media_url(value, variant)
+
+    app.add_template_global(asset_url, "asset_url")
 
     with app.app_context():
-        db.create_all()
-        inspector = inspect(db.engine)
-        emoji_columns = {column["name"] for column in inspector.get_columns("emojis")}
-        if "is_public" not in emoji_columns:
-            db.session.execute(
-                text("ALTER TABLE emojis ADD COLUMN is_public BOOLEAN NOT NULL DEFAULT 0")
-            )
-            db.session.commit()
-        if not Channel.query.first():
-            db.session.add(Channel(slug="general", name="# general", description="기본 채널"))
-            db.session.commit()
+        ensure_schema(provision=app.config["SCHEMA_AUTO_PROVISION"])
 
     register_socket_handlers(socketio)
+    register_push_listeners()
+    start_read_flusher(app, socketio)
+    start_message_compactor(app, socketio)
+    start_scheduler(app, socketio)
+    start_hub_monitor(app, socketio)
+    install_profile_signal(app)
 
     return app
@@ -0,0 +1,170 @@
+"""Hot/cold message tiers.
+
+``messages`` keeps the last ``MESSAGE_HOT_DAYS`` of history. A background loop
+(the ``compact_messages`` job with ``JOBS_ENABLED``, and ``flask kjb
+compact-messages``) moves older rows, oldest first and in
+batches, to ``message_archive``: same columns and ids, stored in the main
+database or, with ``MESSAGE_ARCHIVE_DATABASE``, in a separate SQLite file
+attached to every connection as ``archive``.
+
+Message ids come from an AUTOINCREMENT sequence that ``provision_schema`` keeps
+above the archive, so they are never reused, even after deletes empty the hot
+table. Compaction moves the lowest ids first, so every archived id is below
+every hot id. Readers go to the hot tier first and only touch the archive when
+it comes up short: a chat window of a quiet channel, unread state of a channel
+with no recent message, search hits and replies to old messages, moderation
+deletes.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import visitors
+
+from .extensions import db
+from .models import Message, MessageArchive
+
+
+_compactor_state = {"started": False}
+
+
+def init_message_archive(app):
+    """Attach ``MESSAGE_ARCHIVE_DATABASE`` to every new connection of the app's engine."""
+    path = app.config["MESSAGE_ARCHIVE_DATABASE"]
+    if not path:
+        return
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("MESSAGE_ARCHIVE_DATABASE needs an SQLite main database")
+
+    def attach(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ? AS archive", (path,))
+
+    event.listen(engine, "connect", attach)
+
+
+def on_archive(criterion):
+    """Rewrite a ``Message`` criterion to the same columns of ``message_archive``."""
+    messages = Message.__table__
+    archive = MessageArchive.__table__
+
+    def replace(element):
+        if getattr(element, "table", None) is messages:
+            return archive.c[element.name]
+        return None
+
+    return visitors.replacement_traverse(criterion, {}, replace)
+
+
+def latest_message_ids(channel_ids):
+    """Highest non-deleted message id per channel, across both tiers."""
+    latest = {}
+    missing = list(channel_ids)
+    for table in (Message.__table__, MessageArchive.__table__):
+        if not missing:
+            break
+        rows = db.session.execute(
+            select(table.c.channel_id, func.max(table.c.id))
+            .where(table.c.channel_id.in_(missing), table.c.is_deleted.is_(False))
+            .group_by(table.c.channel_id)
+        ).all()
+        latest.update((channel_id, max_id) for channel_id, max_id in rows if max_id)
+        missing = [channel_id for channel_id in missing if channel_id not in latest]
+    return latest
+
+
+def archived_message(message_id):
+    table = MessageArchive.__table__
+    return db.session.execute(select(table).where(table.c.id == message_id)).first()
+
+
+def mark_archived_deleted(message_id, content):
+    table = MessageArchive.__table__
+    db.session.execute(
+        table.update().where(table.c.id == message_id).values(is_deleted=True, content=content)
+    )
+
+
+def update_archived_content(message_id, content):
+    table = MessageArchive.__table__
+    db.session.execute(
+        table.update().where(table.c.id == message_id).values(content=content, updated_at=datetime.utcnow())
+    )
+
+
+def delete_archived_messages(channel_id=None, user_id=None):
+    table = MessageArchive.__table__
+    if channel_id is not None:
+        db.session.execute(table.delete().where(table.c.channel_id == channel_id))
+    if user_id is not None:
+        db.session.execute(table.delete().where(table.c.user_id == user_id))
+
+
+def compact_messages(cutoff=None, batch_size=None, pause=None):
+    """Move messages created before ``cutoff`` to the archive; returns the moved count.
+
+    Each batch commits on its own; ``pause`` runs between batches so a long
+    first compaction does not hold the hub or the SQLite write lock.
+    """
+    config = current_app.config
+    if cutoff is None:
+        cutoff = datetime.utcnow() - timedelta(days=config["MESSAGE_HOT_DAYS"])
+    batch_size = batch_size or config["MESSAGE_COMPACT_BATCH_SIZE"]
+    messages = Message.__table__
+    archive = MessageArchive.__table__
+    names = [column.name for column in archive.columns]
+    moved = 0
+    while True:
+        # Walk the primary key from the oldest row instead of scanning for
+        # created_at: ids grow with time, so the first young row ends the run.
+        rows = db.session.execute(
+            select(messages.c.id, messages.c.created_at).order_by(messages.c.id).limit(batch_size)
+        ).all()
+        ids = []
+        for message_id, created_at in rows:
+            if created_at is not None and created_at >= cutoff:
+                break
+            ids.append(message_id)
+        if not ids:
+            break
+        db.session.execute(
+            archive.insert().from_select(
+                names, select(*[messages.c[name] for name in names]).where(messages.c.id.in_(ids))
+            )
+        )
+        db.session.execute(messages.delete().where(messages.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        if len(ids) < len(rows):
+            break
+        if pause:
+            pause()
+    return moved
+
+
+def _compact_loop(app, socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        with app.app_context():
+            try:
+                moved = compact_messages(pause=lambda: socketio.sleep(0.1))
+            except SQLAlchemyError:
+                # Usually another worker compacting the same rows; it retries next round.
+                db.session.rollback()
+                app.logger.exception("Message compaction failed")
+                continue
+            if moved:
+                app.logger.info("Archived %d message(s)", moved)
+
+
+def start_message_compactor(app, socketio):
+    """Compact every ``MESSAGE_COMPACT_INTERVAL`` seconds unless ``MESSAGE_HOT_DAYS`` is 0."""
+    if _compactor_state["started"] or app.config["MESSAGE_HOT_DAYS"] <= 0:
+        return
+    if app.config["JOBS_ENABLED"]:
+        # The job scheduler runs compaction on one worker instead (see .jobs).
+        return
+    _compactor_state["started"] = True
+    socketio.start_background_task(_compact_loop, app, socketio, app.config["MESSAGE_COMPACT_INTERVAL"])
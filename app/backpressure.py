@@ -0,0 +1,125 @@
+"""Per-client outbound queue limits for Socket.IO.
+
+Every frame for a client waits in its Engine.IO queue until the transport
+writes it, so one client on a stalled connection can pin an unbounded number
+of broadcast frames in the worker. Frames are accounted per client at send
+time:
+
+* Events in ``OUTBOUND_COALESCE_EVENTS`` carry full state, so a client keeps at
+  most one pending frame per event and channel; a newer frame replaces the
+  queued one in place.
+* A client with ``OUTBOUND_MAX_QUEUE`` frames still pending is evicted: its
+  queue is dropped and the transport aborted. The browser reconnects on its
+  own and ``join`` replays what it missed from the resume buffer (or answers
+  ``resume_reset``), so nothing is lost beyond what a flaky network loses.
+"""
+import threading
+from functools import wraps
+
+from .metrics import FRAMES_COALESCED, FRAMES_DROPPED, SLOW_CONSUMER_EVICTIONS
+
+
+_emit_context = threading.local()
+_evicting = set()
+_backpressure_state = {"servers": set()}
+
+
+def _coalesce_key(event_name, data):
+    if isinstance(data, dict) and "channel" in data:
+        return event_name, data["channel"]
+    return event_name, None
+
+
+def _replace_pending(queue, key, pkt):
+    """Swap a still-queued frame with the same coalesce key for ``pkt``."""
+    pending = queue.queue
+    lock = getattr(queue, "mutex", None)
+    if lock is not None:
+        lock.acquire()
+    try:
+        for index in range(len(pending) - 1, -1, -1):
+            if getattr(pending[index], "coalesce_key", None) == key:
+                pending[index] = pkt
+                return True
+        return False
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def _evict(eio, socket):
+    _evicting.add(socket.sid)
+    queue_empty = eio.get_queue_empty_exception()
+    dropped = 0
+    while True:
+        try:
+            socket.queue.get(block=False)
+        except queue_empty:
+            break
+        socket.queue.task_done()
+        dropped += 1
+    FRAMES_DROPPED.inc((), dropped)
+    SLOW_CONSUMER_EVICTIONS.inc()
+    eio.logger.warning("Evicting slow Socket.IO client %s with %d frames pending", socket.sid, dropped)
+
+    def close():
+        try:
+            socket.close(wait=False, abort=True)
+        finally:
+            _evicting.discard(socket.sid)
+
+    # Closing runs the disconnect handlers, which must not happen mid-broadcast.
+    eio.start_background_task(close)
+
+
+def _wrap_send_packet(eio, max_queue):
+    original_send_packet = eio.send_packet
+
+    @wraps(original_send_packet)
+    def send_packet(sid, pkt):
+        if sid in _evicting:
+            FRAMES_DROPPED.inc()
+            return None
+        socket = eio.sockets.get(sid)
+        if socket is None or socket.closed:
+            return original_send_packet(sid, pkt)
+        depth = socket.queue.qsize()
+        key = getattr(_emit_context, "coalesce_key", None)
+        if key is not None:
+            pkt.coalesce_key = key
+            if depth and _replace_pending(socket.queue, key, pkt):
+                FRAMES_COALESCED.inc((key[0],))
+                return None
+        if max_queue and depth >= max_queue:
+            FRAMES_DROPPED.inc()
+            _evict(eio, socket)
+            return None
+        return original_send_packet(sid, pkt)
+
+    eio.send_packet = send_packet
+
+
+def _wrap_manager_emit(manager, coalesce_events):
+    original_emit = manager.emit
+
+    @wraps(original_emit)
+    def emit(event_name, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if event_name not in coalesce_events or callback is not None:
+            return original_emit(event_name, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs)
+        _emit_context.coalesce_key = _coalesce_key(event_name, data)
+        try:
+            return original_emit(event_name, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs)
+        finally:
+            _emit_context.coalesce_key = None
+
+    manager.emit = emit
+
+
+def init_backpressure(app, socketio):
+    server = socketio.server
+    if server is None or id(server) in _backpressure_state["servers"]:
+        return
+    _backpressure_state["servers"].add(id(server))
+    _wrap_send_packet(server.eio, app.config["OUTBOUND_MAX_QUEUE"])
+    _wrap_manager_emit(server.manager, frozenset(app.config["OUTBOUND_COALESCE_EVENTS"]))
+
@@ -0,0 +1,306 @@
+"""Streaming channel export and bulk import as gzip-compressed NDJSON.
+
+An export is one JSON object per line:
+
+* ``{"type": "channel", "format": 1, "slug": ..., ...}`` - channel settings
+* ``{"type": "user", "id": ..., "email": ..., ...}`` - each author, before
+  their first message
+* ``{"type": "message", "id": ..., "user_id": ..., "reply_to_id": ...,
+  "is_deleted": ..., "created_at": ..., "updated_at": ...}`` - oldest first,
+  archived tier included
+* ``{"type": "end", "messages": N}`` - lets the importer reject truncated files
+
+Messages are read with ``yield_per`` and compressed batch by batch, so memory
+stays flat however long the channel is. The importer inserts batches with
+``executemany``; ids in the file are only references, and are remapped
+through two sorted arrays (16 bytes per message) instead of a dict.
+"""
+import gzip
+import json
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from sqlalchemy import insert, select, text
+
+from .extensions import db
+from .models import Channel, Message, MessageArchive, User
+from .schema import ensure_schema
+from .search import index_rows
+
+
+FORMAT_VERSION = 1
+EXPORT_BATCH_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+CHANNEL_FIELDS = (
+    "slug",
+    "name",
+    "description",
+    "priority",
+    "default_can_view",
+    "default_can_read",
+    "default_can_send",
+    "slow_mode_seconds",
+)
+# Imported authors that do not exist yet get an account nobody can sign in to.
+UNUSABLE_PASSWORD = "!"
+
+
+class ChannelImportError(Exception):
+    pass
+
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _export_rows(table, channel_id):
+    users = User.__table__
+    stmt = (
+        select(
+            table.c.id,
+            table.c.user_id,
+            table.c.content,
+            table.c.reply_to_id,
+            table.c.is_deleted,
+            table.c.created_at,
+            table.c.updated_at,
+            users.c.email,
+            users.c.email_prefix,
+            users.c.name,
+            users.c.username,
+        )
+        .outerjoin(users, users.c.id == table.c.user_id)
+        .where(table.c.channel_id == channel_id)
+        .order_by(table.c.id)
+    )
+    result = db.session.execute(stmt, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+    yield from result.partitions()
+
+
+def iter_channel_export(channel):
+    """Yield NDJSON text chunks (one per batch) for ``channel``."""
+    header = {"type": "channel", "format": FORMAT_VERSION, "exported_at": _timestamp(datetime.utcnow())}
+    header.update((field, getattr(channel, field)) for field in CHANNEL_FIELDS)
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+    seen_users = set()
+    count = 0
+    # Every archived id is older than every hot one, so this is id order overall.
+    for table in (MessageArchive.__table__, Message.__table__):
+        for rows in _export_rows(table, channel.id):
+            lines = []
+            for row in rows:
+                if row.user_id not in seen_users:
+                    seen_users.add(row.user_id)
+                    lines.append(
+                        {
+                            "type": "user",
+                            "id": row.user_id,
+                            "email": row.email,
+                            "email_prefix": row.email_prefix,
+                            "name": row.name,
+                            "username": row.username,
+                        }
+                    )
+                lines.append(
+                    {
+                        "type": "message",
+                        "id": row.id,
+                        "user_id": row.user_id,
+                        "content": row.content,
+                        "reply_to_id": row.reply_to_id,
+                        "is_deleted": bool(row.is_deleted),
+                        "created_at": _timestamp(row.created_at),
+                        "updated_at": _timestamp(row.updated_at),
+                    }
+                )
+            count += len(rows)
+            yield "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+    yield json.dumps({"type": "end", "messages": count}) + "\n"
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip a stream of text chunks without buffering the whole output."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_channel(channel, path):
+    """Write ``channel`` to ``path`` as .ndjson.gz; returns the byte count written."""
+    written = 0
+    with open(path, "wb") as handle:
+        for data in iter_gzip(iter_channel_export(channel)):
+            handle.write(data)
+            written += len(data)
+    return written
+
+
+class _IdMap:
+    """Old message id -> new id; old ids arrive in ascending order."""
+
+    def __init__(self):
+        self.old_ids = array("q")
+        self.new_ids = array("q")
+
+    def add(self, old_id, new_id):
+        if self.old_ids and old_id <= self.old_ids[-1]:
+            raise ChannelImportError(f"message ids are not ascending at {old_id}")
+        self.old_ids.append(old_id)
+        self.new_ids.append(new_id)
+
+    def get(self, old_id):
+        if old_id is None:
+            return None
+        index = bisect_left(self.old_ids, old_id)
+        if index < len(self.old_ids) and self.old_ids[index] == old_id:
+            return self.new_ids[index]
+        return None
+
+
+def _unique_value(column, value, suffix):
+    if not User.query.filter(column == value).first():
+        return value
+    return f"{value}-{suffix}"
+
+
+def _import_user(record):
+    user = User.query.filter_by(email=record["email"]).first() if record.get("email") else None
+    if user:
+        return user.id
+    suffix = f"imported{record['id']}"
+    user = User(
+        email=record.get("email") or f"{suffix}@import.invalid",
+        email_prefix=_unique_value(User.email_prefix, record.get("email_prefix") or suffix, suffix),
+        name=record.get("name") or suffix,
+        username=_unique_value(User.username, record.get("username") or suffix, suffix),
+        password_hash=UNUSABLE_PASSWORD,
+    )
+    db.session.add(user)
+    db.session.flush()
+    return user.id
+
+
+def _import_channel(header, slug, append):
+    slug = slug or header["slug"]
+    channel = Channel.query.filter_by(slug=slug).first()
+    if channel and not append:
+        raise ChannelImportError(f"channel {slug!r} already exists")
+    if not channel:
+        channel = Channel(**{field: header.get(field) for field in CHANNEL_FIELDS if field in header})
+        channel.slug = slug
+        db.session.add(channel)
+        db.session.flush()
+    return channel
+
+
+def _insert_batch(rows, id_map, old_ids):
+    """Insert ``rows`` in one transaction with consecutive ids; returns them."""
+    table = Message.__table__
+    postgresql = db.engine.dialect.name == "postgresql"
+    if postgresql:
+        db.session.execute(text("LOCK TABLE messages IN EXCLUSIVE MODE"))
+    # ``reply_to_id`` still holds the exported id; the first row can only
+    # reply to an earlier batch, the others also to a row before them here.
+    rows[0]["reply_to_id"] = id_map.get(rows[0]["reply_to_id"])
+    # The first row draws its id from the messages sequence (AUTOINCREMENT on
+    # SQLite, SERIAL on PostgreSQL), which is never reused and stays above the
+    # archive, so the batch lands above every id either tier ever held. On
+    # SQLite that insert also takes the write lock, so the ids after it stay
+    # free until commit even while the chat keeps writing.
+    first_id = db.session.execute(insert(table).values(rows[0])).inserted_primary_key[0]
+    for offset, (old_id, row) in enumerate(zip(old_ids, rows)):
+        row["id"] = first_id + offset
+        id_map.add(old_id, row["id"])
+    for row in rows[1:]:
+        row["reply_to_id"] = id_map.get(row["reply_to_id"])
+    if len(rows) > 1:
+        db.session.execute(insert(table), rows[1:])
+    if postgresql:
+        db.session.execute(
+            text("SELECT setval(pg_get_serial_sequence('messages', 'id'), :last_id)"),
+            {"last_id": rows[-1]["id"]},
+        )
+    index_rows([row for row in rows if not row["is_deleted"]])
+    db.session.commit()
+    return rows
+
+
+def import_channel(lines, slug=None, append=False, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Import an export from an iterable of NDJSON lines; returns the message count.
+
+    ``slug`` renames the channel; ``append`` adds to an existing channel of
+    that slug instead of refusing. Batches are committed as they go, so a
+    failed import leaves the batches before the failure in place.
+    """
+    lines = iter(lines)
+    try:
+        header = json.loads(next(lines))
+    except StopIteration:
+        raise ChannelImportError("empty export") from None
+    if header.get("type") != "channel" or header.get("format") != FORMAT_VERSION:
+        raise ChannelImportError("not a channel export of a supported format")
+    if not ensure_schema():
+        # Before schema 10 SQLite could hand out ids the archive still holds.
+        raise ChannelImportError("database schema is outdated; run `flask kjb init` first")
+    channel = _import_channel(header, slug, append)
+    channel_id = channel.id
+    db.session.commit()
+
+    user_map = {}
+    id_map = _IdMap()
+    rows, old_ids = [], []
+    imported = 0
+    expected = None
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.get("type")
+        if kind == "user":
+            user_map[record["id"]] = _import_user(record)
+        elif kind == "message":
+            if record["user_id"] not in user_map:
+                raise ChannelImportError(f"message {record['id']} has no author record")
+            rows.append(
+                {
+                    "channel_id": channel_id,
+                    "user_id": user_map[record["user_id"]],
+                    "content": record["content"],
+                    "reply_to_id": record.get("reply_to_id"),
+                    "is_deleted": bool(record.get("is_deleted")),
+                    "created_at": _parse_timestamp(record.get("created_at")),
+                    "updated_at": _parse_timestamp(record.get("updated_at")),
+                    "client_id": None,
+                }
+            )
+            old_ids.append(record["id"])
+            if len(rows) >= batch_size:
+                imported += len(_insert_batch(rows, id_map, old_ids))
+                rows, old_ids = [], []
+                if progress:
+                    progress(imported)
+        elif kind == "end":
+            expected = record.get("messages")
+    if rows:
+        imported += len(_insert_batch(rows, id_map, old_ids))
+    db.session.commit()
+    if expected is None:
+        raise ChannelImportError(f"export is truncated; imported {imported} message(s)")
+    if expected != imported:
+        raise ChannelImportError(f"export lists {expected} message(s) but {imported} were imported")
+    return imported
+
+
+def import_channel_file(path, **kwargs):
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return import_channel(handle, **kwargs)
+
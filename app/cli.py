@@ -0,0 +1,124 @@
+"""`flask kjb ...` maintenance commands."""
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .archive import compact_messages
+from .channel_transfer import IMPORT_BATCH_SIZE, ChannelImportError, export_channel, import_channel_file
+from .media import generate_derivatives, precompress_static
+from .models import Accessory, Channel, Emoji, User
+from .schema import SCHEMA_VERSION, current_schema_version, provision_schema
+from .search import rebuild_search_index
+from .shop import AUTO_APPROVE_BATCH_SIZE, process_pending_requests
+from .storage import collect_garbage, referenced_uploads
+
+
+kjb_cli = AppGroup("kjb", help="KJB maintenance commands.")
+
+
+@kjb_cli.command("init")
+def init_schema():
+    """Create tables, apply column upgrades and seed the default channel."""
+    previous = current_schema_version()
+    provision_schema()
+    click.echo(f"Schema at version {SCHEMA_VERSION} (was {previous}).")
+
+
+@kjb_cli.command("assets")
+def build_assets():
+    """Precompress static assets (gzip, and brotli when installed)."""
+    written = precompress_static(current_app.static_folder)
+    click.echo(f"Precompressed {len(written)} file(s).")
+
+
+@kjb_cli.command("thumbnails")
+def build_thumbnails():
+    """Generate missing avatar, emoji and accessory derivatives for existing uploads."""
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    sources = [
+        ("avatar", User.query.with_entities(User.avatar_url)),
+        ("emoji", Emoji.query.with_entities(Emoji.image_url)),
+        ("accessory", Accessory.query.with_entities(Accessory.image_url)),
+    ]
+    written = 0
+    for kind, rows in sources:
+        for (filename,) in rows:
+            if not filename or filename.startswith(("http://", "https://", "/")):
+                continue
+            try:
+                written += len(generate_derivatives(upload_folder, filename, kind))
+            except OSError as exc:
+                click.echo(f"Skipped {filename}: {exc}", err=True)
+    click.echo(f"Generated {written} derivative(s).")
+
+
+@kjb_cli.command("gc-uploads")
+@click.option("--grace", default=3600, show_default=True, help="Keep files younger than this many seconds.")
+@click.option("--dry-run", is_flag=True, help="List unreferenced files without deleting them.")
+def gc_uploads(grace, dry_run):
+    """Delete uploads no user, emoji, accessory or shop item references."""
+    removed = collect_garbage(
+        current_app.config["UPLOAD_FOLDER"], referenced_uploads(), grace_seconds=grace, dry_run=dry_run
+    )
+    for name in removed:
+        click.echo(name)
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {len(removed)} file(s).")
+
+
+@kjb_cli.command("reindex-search")
+def reindex_search():
+    """Rebuild the full-text message search index from the messages table."""
+    indexed = rebuild_search_index()
+    click.echo(f"Indexed {indexed} message(s).")
+
+
+@kjb_cli.command("compact-messages")
+@click.option("--days", type=int, help="Archive messages older than this (default MESSAGE_HOT_DAYS).")
+def compact_messages_command(days):
+    """Move aged messages from the hot table to the message archive."""
+    days = current_app.config["MESSAGE_HOT_DAYS"] if days is None else days
+    moved = compact_messages(cutoff=datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Archived {moved} message(s) older than {days} day(s).")
+
+
+@kjb_cli.command("export-channel")
+@click.argument("slug")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="Output file (default SLUG.ndjson.gz).")
+def export_channel_command(slug, output):
+    """Write a channel's settings, authors and full history as .ndjson.gz."""
+    channel = Channel.query.filter_by(slug=slug).first()
+    if channel is None:
+        raise click.ClickException(f"No channel {slug!r}.")
+    output = output or f"{slug}.ndjson.gz"
+    written = export_channel(channel, output)
+    click.echo(f"Wrote {written} byte(s) to {output}.")
+
+
+@kjb_cli.command("import-channel")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--slug", help="Import under this slug instead of the exported one.")
+@click.option("--append", is_flag=True, help="Add to an existing channel with the same slug.")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+def import_channel_command(path, slug, append, batch_size):
+    """Bulk-load a channel exported with export-channel."""
+    try:
+        imported = import_channel_file(
+            path,
+            slug=slug,
+            append=append,
+            batch_size=batch_size,
+            progress=lambda count: click.echo(f"  {count} message(s)...", err=True),
+        )
+    except ChannelImportError as exc:
+        raise click.ClickException(str(exc)) from None
+    click.echo(f"Imported {imported} message(s).")
+
+
+@kjb_cli.command("shop-approve")
+@click.option("--batch-size", default=AUTO_APPROVE_BATCH_SIZE, show_default=True)
+def shop_approve(batch_size):
+    """Approve pending shop requests oldest-first through the KC ledger."""
+    counts = process_pending_requests(batch_size=batch_size)
+    click.echo(f"Approved {counts['approved']}, denied {counts['denied']}.")
@@ -0,0 +1,379 @@
+"""Durable background jobs run by an in-process scheduler.
+
+Jobs are registered by name with :func:`register_job` and stored as rows of
+``jobs``, so a deferred run survives restarts. :func:`enqueue` adds a run to
+the caller's session, so it is only scheduled if the caller commits.
+
+With ``JOBS_ENABLED`` every worker runs a scheduler greenlet that wakes
+every ``JOB_POLL_INTERVAL`` seconds, claims due rows with a conditional
+``UPDATE`` and runs them one after another.
+
+* A failed run is retried ``JOB_MAX_ATTEMPTS`` times with exponential
+  backoff from ``JOB_RETRY_DELAY``; the traceback is kept in ``last_error``.
+* Workers compete for the ``scheduler`` row of ``job_leases`` (renewed
+  every poll, expiring after ``JOB_LEASE_SECONDS``). Only the holder runs
+  singleton jobs. It also schedules periodic jobs and requeues runs whose
+  worker died past ``JOB_TIMEOUT``.
+* While a job runs, a heartbeat greenlet pushes its ``locked_until`` and the
+  worker's lease forward every third of ``JOB_LEASE_SECONDS``, so a long run
+  is neither requeued nor joined by a second leader. A job that never yields
+  to the hub starves its heartbeat like it starves the chat.
+
+Per-worker state, such as the read-state buffer, keeps its own loop: a
+job row cannot pick which worker's memory it flushes.
+"""
+import atexit
+import json
+import os
+import secrets
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from .archive import compact_messages
+from .extensions import db, socketio
+from .metrics import JOB_DURATION, JOB_RUNS
+from .models import Job, JobLease, Notification
+from .profiling import run_in_scope
+from .storage import collect_garbage, referenced_uploads
+
+
+LEADER_LEASE = "scheduler"
+ACTIVE_STATUSES = ("pending", "running")
+FINISHED_STATUSES = ("done", "failed")
+CLAIM_CANDIDATES = 5
+ERROR_MAX_LENGTH = 4000
+
+JOB_REGISTRY = {}
+_scheduler_state = {"started": False}
+
+
+class JobSpec:
+    def __init__(self, name, func, interval=None, singleton=False, max_attempts=None, retry_delay=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.singleton = singleton
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+
+def register_job(name, func, interval=None, singleton=False, max_attempts=None, retry_delay=None):
+    """Register ``func(**payload)`` as job ``name``.
+
+    ``interval`` (seconds) makes it periodic, measured from the end of the
+    previous run; periodic jobs are always singletons. Attempts and retry
+    delay default to ``JOB_MAX_ATTEMPTS`` and ``JOB_RETRY_DELAY``.
+    """
+    JOB_REGISTRY[name] = JobSpec(
+        name,
+        func,
+        interval=interval,
+        singleton=singleton or bool(interval),
+        max_attempts=max_attempts,
+        retry_delay=retry_delay,
+    )
+    return func
+
+
+def enqueue(name, delay=0, **payload):
+    """Add a run of job ``name`` to the session; it is scheduled when the caller commits."""
+    spec = JOB_REGISTRY.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown job {name!r}")
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        max_attempts=spec.max_attempts or current_app.config["JOB_MAX_ATTEMPTS"],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+def retry_job(job_id):
+    """Put a failed run back in the queue with fresh attempts; returns True if it was failed."""
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "failed")
+        .values(status="pending", attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    )
+    return result.rowcount == 1
+
+
+def recent_jobs(limit=50):
+    return Job.query.order_by(Job.id.desc()).limit(limit).all()
+
+
+def current_leader():
+    """``(holder, expires_at)`` of the scheduler lease, or None."""
+    lease = db.session.get(JobLease, LEADER_LEASE)
+    if lease is None or lease.expires_at < time.time():
+        return None
+    return lease.holder, datetime.utcfromtimestamp(lease.expires_at)
+
+
+def _lease_upsert(holder, now, expires_at):
+    table = JobLease.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table)
+    elif dialect == "postgresql":
+        stmt = postgresql_insert(table)
+    else:
+        raise RuntimeError(f"Job leader election does not support {dialect}")
+    return (
+        stmt.values(name=LEADER_LEASE, holder=holder, expires_at=expires_at)
+        .on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"holder": holder, "expires_at": expires_at},
+            where=(table.c.holder == holder) | (table.c.expires_at < now),
+        )
+        .returning(table.c.holder)
+    )
+
+
+class Scheduler:
+    def __init__(self, app, sleep):
+        config = app.config
+        self.app = app
+        self.sleep = sleep
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.poll_interval = config["JOB_POLL_INTERVAL"]
+        self.lease_seconds = config["JOB_LEASE_SECONDS"]
+        self.timeout = config["JOB_TIMEOUT"]
+        self.max_attempts = config["JOB_MAX_ATTEMPTS"]
+        self.retry_delay = config["JOB_RETRY_DELAY"]
+        self.is_leader = False
+        self.running_job = None
+
+    def run(self):
+        while True:
+            self.sleep(self.poll_interval)
+            with self.app.app_context():
+                try:
+                    self.tick()
+                except SQLAlchemyError:
+                    db.session.rollback()
+                    self.app.logger.exception("Job scheduler tick failed")
+
+    def tick(self):
+        """Renew the lease, do the leader's bookkeeping, then run every due job."""
+        self.is_leader = self._renew_lease()
+        if self.is_leader:
+            self._requeue_stale()
+            self._schedule_periodic()
+        while True:
+            job = self._claim()
+            if job is None:
+                break
+            self._execute(job)
+            # Let chat traffic through between back-to-back jobs.
+            self.sleep(0)
+
+    def _renew_lease(self):
+        now = time.time()
+        # Own connection, like the database rate-limit store: the session may be mid-transaction.
+        with db.engine.begin() as connection:
+            row = connection.execute(_lease_upsert(self.worker_id, now, now + self.lease_seconds)).first()
+        return row is not None
+
+    def _heartbeat(self, job_id):
+        interval = min(self.lease_seconds, self.timeout) / 3
+        while True:
+            self.sleep(interval)
+            if self.running_job != job_id:
+                return
+            with self.app.app_context():
+                try:
+                    self._beat(job_id)
+                except SQLAlchemyError:
+                    self.app.logger.exception("Job heartbeat failed")
+
+    def _beat(self, job_id):
+        now = time.time()
+        held = True
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.locked_by == self.worker_id, Job.status == "running")
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=self.timeout))
+            )
+            if self.is_leader:
+                lease = _lease_upsert(self.worker_id, now, now + self.lease_seconds)
+                held = connection.execute(lease).first() is not None
+        if not held:
+            self.is_leader = False
+            self.app.logger.warning("Lost the scheduler lease while running job #%s", job_id)
+
+    def release_lease(self):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(
+                    delete(JobLease).where(JobLease.name == LEADER_LEASE, JobLease.holder == self.worker_id)
+                )
+
+    def _requeue_stale(self):
+        now = datetime.utcnow()
+        stale = (Job.status == "running", Job.locked_until < now)
+        db.session.execute(
+            update(Job)
+            .where(*stale, Job.attempts >= Job.max_attempts)
+            .values(status="failed", finished_at=now, last_error="Timed out: worker stopped responding")
+        )
+        db.session.execute(update(Job).where(*stale).values(status="pending", run_at=now, locked_by=None))
+        db.session.commit()
+
+    def _schedule_periodic(self):
+        periodic = {name: spec for name, spec in JOB_REGISTRY.items() if spec.interval}
+        if not periodic:
+            return
+        active = set(
+            db.session.execute(
+                select(Job.name).where(Job.name.in_(periodic), Job.status.in_(ACTIVE_STATUSES)).distinct()
+            ).scalars()
+        )
+        last_finished = dict(
+            db.session.execute(
+                select(Job.name, func.max(Job.finished_at))
+                .where(Job.name.in_(periodic), Job.status.in_(FINISHED_STATUSES))
+                .group_by(Job.name)
+            ).all()
+        )
+        now = datetime.utcnow()
+        for name, spec in periodic.items():
+            if name in active:
+                continue
+            finished_at = last_finished.get(name)
+            run_at = max(now, finished_at + timedelta(seconds=spec.interval)) if finished_at else now
+            db.session.add(
+                Job(name=name, run_at=run_at, max_attempts=spec.max_attempts or self.max_attempts)
+            )
+        db.session.commit()
+
+    def _claim(self):
+        names = [name for name, spec in JOB_REGISTRY.items() if self.is_leader or not spec.singleton]
+        if not names:
+            return None
+        now = datetime.utcnow()
+        candidates = db.session.execute(
+            select(Job.id)
+            .where(Job.status == "pending", Job.run_at <= now, Job.name.in_(names))
+            .order_by(Job.run_at, Job.id)
+            .limit(CLAIM_CANDIDATES)
+        ).scalars().all()
+        for job_id in candidates:
+            claimed = db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "pending")
+                .values(
+                    status="running",
+                    attempts=Job.attempts + 1,
+                    locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=self.timeout),
+                )
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id, populate_existing=True)
+        return None
+
+    def _execute(self, job):
+        spec = JOB_REGISTRY[job.name]
+        job_id, name, attempts, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+        payload = json.loads(job.payload or "{}")
+        started = time.perf_counter()
+        self.running_job = job_id
+        socketio.start_background_task(self._heartbeat, job_id)
+        try:
+            run_in_scope(f"job:{name}", spec.func, **payload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc()[-ERROR_MAX_LENGTH:]
+            if attempts < max_attempts:
+                outcome = "retry"
+                retry_delay = self.retry_delay if spec.retry_delay is None else spec.retry_delay
+                delay = retry_delay * 2 ** (attempts - 1)
+                values = {"status": "pending", "run_at": datetime.utcnow() + timedelta(seconds=delay)}
+                self.app.logger.warning("Job %s #%s failed (attempt %d of %d)", name, job_id, attempts, max_attempts)
+            else:
+                outcome = "failed"
+                values = {"status": "failed", "finished_at": datetime.utcnow()}
+                self.app.logger.error("Job %s #%s failed for good:\n%s", name, job_id, error)
+            values["last_error"] = error
+        else:
+            outcome = "done"
+            values = {"status": "done", "finished_at": datetime.utcnow()}
+        finally:
+            self.running_job = None
+            JOB_DURATION.observe(time.perf_counter() - started, (name,))
+        JOB_RUNS.inc((name, outcome))
+        # A run whose heartbeat starved past JOB_TIMEOUT may have been requeued; leave that row alone.
+        db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.locked_by == self.worker_id, Job.status == "running")
+            .values(locked_by=None, locked_until=None, **values)
+        )
+        db.session.commit()
+
+
+def _yield_to_hub():
+    socketio.sleep(0.1)
+
+
+def _compact_messages_job():
+    moved = compact_messages(pause=_yield_to_hub)
+    if moved:
+        current_app.logger.info("Archived %d message(s)", moved)
+
+
+def _prune_notifications_job():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config["NOTIFICATION_RETENTION_DAYS"])
+    db.session.execute(delete(Notification).where(Notification.is_read.is_(True), Notification.created_at < cutoff))
+
+
+def _collect_uploads_job():
+    config = current_app.config
+    removed = collect_garbage(config["UPLOAD_FOLDER"], referenced_uploads(), grace_seconds=config["UPLOAD_GC_GRACE"])
+    if removed:
+        current_app.logger.info("Removed %d unreferenced upload(s)", len(removed))
+
+
+def _prune_jobs_job():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config["JOB_RETENTION_DAYS"])
+    # Keep each periodic job's latest run: it is what schedules the next one.
+    latest = select(func.max(Job.id)).where(Job.status.in_(FINISHED_STATUSES)).group_by(Job.name)
+    db.session.execute(
+        delete(Job).where(Job.status.in_(FINISHED_STATUSES), Job.finished_at < cutoff, Job.id.not_in(latest))
+    )
+
+
+def register_builtin_jobs(app):
+    config = app.config
+    if config["MESSAGE_HOT_DAYS"] > 0:
+        register_job("compact_messages", _compact_messages_job, interval=config["MESSAGE_COMPACT_INTERVAL"])
+    if config["NOTIFICATION_RETENTION_DAYS"] > 0:
+        register_job("prune_notifications", _prune_notifications_job, interval=3600)
+    if config["UPLOAD_GC_INTERVAL"] > 0:
+        register_job("gc_uploads", _collect_uploads_job, interval=config["UPLOAD_GC_INTERVAL"])
+    register_job("prune_jobs", _prune_jobs_job, interval=3600)
+
+
+def start_scheduler(app, socketio):
+    """Register the built-in jobs and, with ``JOBS_ENABLED``, start this worker's scheduler."""
+    register_builtin_jobs(app)
+    if not app.config["JOBS_ENABLED"] or _scheduler_state["started"]:
+        return
+    _scheduler_state["started"] = True
+    scheduler = Scheduler(app, socketio.sleep)
+    socketio.start_background_task(scheduler.run)
+    # Hand leadership over right away instead of after the lease runs out.
+    atexit.register(scheduler.release_lease)
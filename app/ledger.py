@@ -0,0 +1,106 @@
+"""KC ledger: atomic SQL-side balance updates with double-entry ``KCLog`` rows.
+
+Balances are changed with ``UPDATE users SET kc_points = kc_points + :delta``
+so concurrent rewards, transfers and purchases never lose updates; debits that
+must not overdraw add ``WHERE kc_points + :delta >= :floor`` and fail cleanly
+instead of checking the balance first.
+"""
+import uuid
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .extensions import db
+from .models import KCLog, Notification, User
+from .push import queue_user_push
+
+
+class InsufficientKCError(Exception):
+    """A conditional debit would have taken a balance below its floor."""
+
+    def __init__(self, user_id):
+        super().__init__(f"insufficient KC for user {user_id}")
+        self.user_id = user_id
+
+
+def _sync_loaded_balance(user_id, balance):
+    loaded = db.session.identity_map.get(db.session.identity_key(User, user_id))
+    if loaded is not None:
+        set_committed_value(loaded, "kc_points", balance)
+
+
+def _update_balance(user_id, delta, min_balance=None):
+    users = User.__table__
+    new_balance = func.coalesce(users.c.kc_points, 0) + delta
+    stmt = update(users).where(users.c.id == user_id).values(kc_points=new_balance)
+    if min_balance is not None:
+        stmt = stmt.where(new_balance >= min_balance)
+    if db.engine.dialect.update_returning:
+        balance = db.session.execute(stmt.returning(users.c.kc_points)).scalar()
+        if balance is None:
+            raise InsufficientKCError(user_id)
+    else:
+        if db.session.execute(stmt).rowcount == 0:
+            raise InsufficientKCError(user_id)
+        balance = db.session.execute(
+            select(users.c.kc_points).where(users.c.id == user_id)
+        ).scalar()
+    _sync_loaded_balance(user_id, balance)
+    return balance
+
+
+def _record_entry(user_id, delta, reason, balance, transfer_id=None, counterparty_id=None, notify=True):
+    db.session.add(
+        KCLog(
+            user_id=user_id,
+            delta=delta,
+            reason=reason,
+            transfer_id=transfer_id,
+            counterparty_id=counterparty_id,
+        )
+    )
+    queue_user_push(user_id, "kc_balance", {"kc_points": balance}, coalesce=True)
+    if notify:
+        title, body = "KC 변동", f"{reason} ({delta:+d} KC)"
+        db.session.add(Notification(user_id=user_id, title=title, body=body))
+        queue_user_push(user_id, "notification", {"title": title, "body": body})
+
+
+def apply_kc_delta(user_id, delta, reason, min_balance=None, notify=True):
+    """Change one balance against the system account; returns the new balance.
+
+    With ``min_balance`` the update only applies if the result stays at or
+    above it, otherwise :class:`InsufficientKCError` is raised.
+    """
+    balance = _update_balance(user_id, delta, min_balance)
+    _record_entry(user_id, delta, reason, balance, notify=notify)
+    return balance
+
+
+def transfer_kc(sender_id, recipient_id, amount, debit_reason, credit_reason, notify=True):
+    """Move ``amount`` KC between two users; the sender may not go below zero."""
+    return apply_transfers([(sender_id, recipient_id, amount, debit_reason, credit_reason)], notify)[0]
+
+
+def apply_transfers(transfers, notify=True):
+    """Apply ``(sender_id, recipient_id, amount, debit_reason, credit_reason)`` tuples.
+
+    All transfers run in the caller's transaction: if any debit fails the
+    exception propagates and the caller's rollback undoes the whole batch.
+    Returns the transfer ids in order.
+    """
+    transfer_ids = []
+    for sender_id, recipient_id, amount, debit_reason, credit_reason in transfers:
+        if amount <= 0:
+            raise ValueError("transfer amount must be positive")
+        transfer_id = uuid.uuid4().hex
+        sender_balance = _update_balance(sender_id, -amount, min_balance=0)
+        recipient_balance = _update_balance(recipient_id, amount)
+        _record_entry(
+            sender_id, -amount, debit_reason, sender_balance, transfer_id, recipient_id, notify
+        )
+        _record_entry(
+            recipient_id, amount, credit_reason, recipient_balance, transfer_id, sender_id, notify
+        )
+        transfer_ids.append(transfer_id)
+    return transfer_ids
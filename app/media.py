@@ -0,0 +1,345 @@
+"""Cache-friendly delivery of uploaded media and bundled static assets."""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, request, send_file, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from .extensions import socketio
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+IMMUTABLE_MEDIA_PATTERN = re.compile(r"^[0-9a-f]{32,64}(\.[a-z]+[0-9]+)?\.[a-z0-9]+$")
+PRECOMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg"}
+DERIVATIVE_SOURCE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
+DERIVATIVE_SIZES = {
+    "avatar": (64, 128),
+    "emoji": (32, 80),
+    "accessory": (32,),
+}
+DERIVATIVE_MISS_TTL = 30
+DERIVATIVE_CACHE_SIZE = 4096
+
+
+def _native_lock():
+    # Taken both by request greenlets on the hub and by tpool's native
+    # threads; an eventlet green lock cannot be handed between the two.
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return threading.Lock()
+    return patcher.original("threading").Lock()
+
+
+_asset_digest_cache = {}
+# derivative name -> monotonic time it was found missing, or None once it exists
+_derivative_lookups = OrderedDict()
+_derivative_lookups_lock = _native_lock()
+_derivative_executor = None
+_derivative_executor_lock = threading.Lock()
+_derivative_slot_state = {"semaphore": None}
+_pillow_state = {}
+
+
+def _apply_cache_headers(response, max_age, immutable):
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 0
+        response.cache_control.no_cache = True
+    return response
+
+
+def is_immutable_media(filename):
+    return bool(IMMUTABLE_MEDIA_PATTERN.match(os.path.basename(filename)))
+
+
+def send_media(filename):
+    config = current_app.config
+    upload_folder = config["UPLOAD_FOLDER"]
+    max_age = config["MEDIA_CACHE_MAX_AGE"]
+    immutable = is_immutable_media(filename)
+    accel_prefix = config.get("MEDIA_ACCEL_REDIRECT_PREFIX")
+
+    if accel_prefix:
+        path = safe_join(upload_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        stat = os.stat(path)
+        response = current_app.response_class()
+        response.headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{filename}"
+        response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        response.last_modified = int(stat.st_mtime)
+        _apply_cache_headers(response, max_age, immutable)
+        return response.make_conditional(request)
+
+    response = send_from_directory(
+        upload_folder, filename, max_age=max_age, conditional=True, etag=True
+    )
+    return _apply_cache_headers(response, max_age, immutable)
+
+
+def asset_digest(path):
+    stat = os.stat(path)
+    cached = _asset_digest_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(65536), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()[:12]
+    _asset_digest_cache[path] = (stat.st_mtime_ns, value)
+    return value
+
+
+def asset_url(filename):
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return url_for("static", filename=filename)
+    return url_for("views.asset", digest=asset_digest(path), filename=filename)
+
+
+def _replace_atomically(target, write):
+    """Call ``write(handle)`` on a private temp file next to ``target``, then swap it in."""
+    directory, name = os.path.split(target)
+    handle = tempfile.NamedTemporaryFile(dir=directory, prefix=f".{name}.", suffix=".tmp", delete=False)
+    try:
+        with handle:
+            write(handle)
+        os.replace(handle.name, target)
+    except BaseException:
+        try:
+            os.unlink(handle.name)
+        except OSError:
+            pass
+        raise
+
+
+def _write_compressed(path, target, compress):
+    with open(path, "rb") as handle:
+        data = compress(handle.read())
+    _replace_atomically(target, lambda handle: handle.write(data))
+
+
+def _compressors():
+    compressors = [("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ("br", ".br", lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def _is_fresh(target, source_mtime):
+    try:
+        return os.stat(target).st_mtime_ns >= source_mtime
+    except OSError:
+        return False
+
+
+def precompress_file(path):
+    written = []
+    source_mtime = os.stat(path).st_mtime_ns
+    for _, suffix, compress in _compressors():
+        target = path + suffix
+        if _is_fresh(target, source_mtime):
+            continue
+        try:
+            _write_compressed(path, target, compress)
+        except OSError:
+            continue
+        written.append(target)
+    return written
+
+
+def precompress_static(static_folder):
+    written = []
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1] in PRECOMPRESSIBLE_EXTENSIONS:
+                written.extend(precompress_file(os.path.join(root, name)))
+    return written
+
+
+def send_static_asset(digest, filename):
+    static_folder = current_app.static_folder
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    max_age = current_app.config["MEDIA_CACHE_MAX_AGE"]
+    immutable = digest == asset_digest(path)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    response = None
+    if os.path.splitext(filename)[1] in PRECOMPRESSIBLE_EXTENSIONS:
+        # Variants come from `flask kjb assets`; a missing or stale one falls back to identity.
+        source_mtime = os.stat(path).st_mtime_ns
+        for encoding, suffix, _ in _compressors():
+            compressed_path = path + suffix
+            if request.accept_encodings[encoding] and _is_fresh(compressed_path, source_mtime):
+                response = send_file(
+                    compressed_path, mimetype=mimetype, max_age=max_age, conditional=True, etag=True
+                )
+                response.content_encoding = encoding
+                break
+        if response is None:
+            response = send_file(path, mimetype=mimetype, max_age=max_age, conditional=True, etag=True)
+        response.vary.add("Accept-Encoding")
+    else:
+        response = send_file(path, mimetype=mimetype, max_age=max_age, conditional=True, etag=True)
+    return _apply_cache_headers(response, max_age, immutable)
+
+
+def derivative_name(filename, variant):
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}.{variant}.{_derivative_format()[1]}"
+
+
+def _pillow():
+    """Import Pillow on first use; workers that never touch images skip the cost."""
+    if "modules" not in _pillow_state:
+        try:
+            from PIL import Image, ImageOps, features
+        except ImportError:  # without Pillow, originals are served as-is
+            _pillow_state["modules"] = None
+        else:
+            _pillow_state["modules"] = (Image, ImageOps, features)
+    return _pillow_state["modules"]
+
+
+def _derivative_format():
+    pillow = _pillow()
+    if pillow is not None and pillow[2].check("webp"):
+        return "WEBP", "webp"
+    return "PNG", "png"
+
+
+def supports_derivatives(filename):
+    if _pillow() is None or "." not in filename:
+        return False
+    return filename.rsplit(".", 1)[1].lower() in DERIVATIVE_SOURCE_EXTENSIONS
+
+
+def resolve_derivative(filename, variant):
+    """Return the derivative file name for ``variant`` if it has been generated."""
+    if not variant or not supports_derivatives(filename):
+        return filename
+    name = derivative_name(filename, variant)
+    now = time.monotonic()
+    with _derivative_lookups_lock:
+        cached = name in _derivative_lookups
+        missed_at = _derivative_lookups.get(name)
+    if cached and missed_at is None:
+        return name
+    if cached and now - missed_at < DERIVATIVE_MISS_TTL:
+        return filename
+    try:
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+    except RuntimeError:
+        return filename
+    if os.path.isfile(os.path.join(upload_folder, name)):
+        _remember_derivative(name, None)
+        return name
+    _remember_derivative(name, now)
+    return filename
+
+
+def _remember_derivative(name, missed_at):
+    with _derivative_lookups_lock:
+        _derivative_lookups[name] = missed_at
+        _derivative_lookups.move_to_end(name)
+        while len(_derivative_lookups) > DERIVATIVE_CACHE_SIZE:
+            _derivative_lookups.popitem(last=False)
+
+
+def generate_derivatives(upload_folder, filename, kind):
+    if not supports_derivatives(filename):
+        return []
+    Image, ImageOps, _ = _pillow()
+    image_format, _ = _derivative_format()
+    written = []
+    with Image.open(os.path.join(upload_folder, filename)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA")
+        for size in DERIVATIVE_SIZES[kind]:
+            name = derivative_name(filename, f"{kind}{size}")
+            target = os.path.join(upload_folder, name)
+            if os.path.isfile(target):
+                _remember_derivative(name, None)
+                continue
+            thumbnail = ImageOps.fit(source, (size, size), method=Image.Resampling.LANCZOS)
+            _replace_atomically(target, lambda handle: thumbnail.save(handle, format=image_format))
+            _remember_derivative(name, None)
+            written.append(name)
+    return written
+
+
+def _get_derivative_executor():
+    global _derivative_executor
+    with _derivative_executor_lock:
+        if _derivative_executor is None:
+            max_workers = current_app.config.get("MEDIA_DERIVATIVE_WORKERS", 2)
+            _derivative_executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="kjb-derivatives"
+            )
+        return _derivative_executor
+
+
+def _generate_derivatives_safely(logger, upload_folder, filename, kind):
+    try:
+        return generate_derivatives(upload_folder, filename, kind)
+    except Exception:
+        logger.exception("Failed to generate %s derivatives for %s", kind, filename)
+        return []
+
+
+def _derivative_slots(size):
+    from eventlet.semaphore import Semaphore
+
+    if _derivative_slot_state["semaphore"] is None:
+        _derivative_slot_state["semaphore"] = Semaphore(size)
+    return _derivative_slot_state["semaphore"]
+
+
+def _generate_derivatives_in_tpool(slots, logger, upload_folder, filename, kind):
+    from eventlet import tpool
+
+    # Runs as a greenlet; Pillow itself runs on one of eventlet's native threads.
+    with slots:
+        try:
+            return tpool.execute(generate_derivatives, upload_folder, filename, kind)
+        except Exception:
+            logger.exception("Failed to generate %s derivatives for %s", kind, filename)
+            return []
+
+
+def queue_derivatives(upload_folder, filename, kind):
+    """Generate derivatives in the background, off the eventlet hub when it runs."""
+    if kind not in DERIVATIVE_SIZES or not supports_derivatives(filename):
+        return None
+    logger = current_app.logger
+    if socketio.async_mode == "eventlet":
+        # A ThreadPoolExecutor would run green threads under monkey_patch() and
+        # resize images on the hub.
+        slots = _derivative_slots(current_app.config["MEDIA_DERIVATIVE_WORKERS"])
+        return socketio.start_background_task(
+            _generate_derivatives_in_tpool, slots, logger, upload_folder, filename, kind
+        )
+    return _get_derivative_executor().submit(
+        _generate_derivatives_safely, logger, upload_folder, filename, kind
+    )
@@ -0,0 +1,313 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Records latency and SQL statement histograms for every HTTP view and every
+Socket.IO event handler, statement durations from SQLAlchemy engine events,
+and emitted frames per event. Room sizes and outbound queue depths are
+read from the Socket.IO server when ``/metrics`` is scraped. Values are per
+worker process, like the rest of the in-memory state.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .profiling import run_in_scope
+from .query_audit import begin_audit, finish_audit
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+_metrics_lock = threading.Lock()
+_instrument_state = {"engine": False, "managers": set()}
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        with _metrics_lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with _metrics_lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, label_values=()):
+        with _metrics_lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with _metrics_lock:
+            values = {key: (list(series[0]), series[1], series[2]) for key, series in self.values.items()}
+        for label_values, (counts, total, count) in sorted(values.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_bucket", dict(labels, le="+Inf"), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+REQUEST_DURATION = Histogram(
+    "kjb_http_request_duration_seconds", "HTTP view latency.", ("endpoint", "method", "status")
+)
+REQUEST_STATEMENTS = Histogram(
+    "kjb_http_request_sql_statements",
+    "SQL statements issued per HTTP request.",
+    ("endpoint",),
+    STATEMENT_COUNT_BUCKETS,
+)
+EVENT_DURATION = Histogram(
+    "kjb_socket_event_duration_seconds", "Socket.IO handler latency.", ("event",)
+)
+EVENT_STATEMENTS = Histogram(
+    "kjb_socket_event_sql_statements",
+    "SQL statements issued per Socket.IO event.",
+    ("event",),
+    STATEMENT_COUNT_BUCKETS,
+)
+EVENT_ERRORS = Counter(
+    "kjb_socket_event_errors_total", "Socket.IO handlers that raised.", ("event",)
+)
+SQL_DURATION = Histogram(
+    "kjb_sql_statement_duration_seconds", "SQL statement execution time.", ("operation",)
+)
+EMITS = Counter("kjb_socket_emits_total", "Socket.IO emit calls.", ("event",))
+EMITTED_FRAMES = Counter(
+    "kjb_socket_emitted_frames_total", "Socket.IO frames queued to recipients.", ("event",)
+)
+FRAMES_COALESCED = Counter(
+    "kjb_socket_frames_coalesced_total",
+    "Queued frames replaced by a newer frame of the same event.",
+    ("event",),
+)
+FRAMES_DROPPED = Counter(
+    "kjb_socket_frames_dropped_total", "Frames discarded for evicted slow clients."
+)
+SLOW_CONSUMER_EVICTIONS = Counter(
+    "kjb_socket_slow_consumer_evictions_total", "Clients disconnected for falling behind."
+)
+JOB_RUNS = Counter("kjb_job_runs_total", "Background job runs by outcome.", ("job", "outcome"))
+JOB_DURATION = Histogram("kjb_job_duration_seconds", "Background job run time.", ("job",))
+
+METRICS = (
+    REQUEST_DURATION,
+    REQUEST_STATEMENTS,
+    EVENT_DURATION,
+    EVENT_STATEMENTS,
+    EVENT_ERRORS,
+    SQL_DURATION,
+    EMITS,
+    EMITTED_FRAMES,
+    FRAMES_COALESCED,
+    FRAMES_DROPPED,
+    SLOW_CONSUMER_EVICTIONS,
+    JOB_RUNS,
+    JOB_DURATION,
+)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else f"{value:.1f}"
+    return str(value)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        rendered = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def _begin_scope():
+    g.metrics_sql_statements = 0
+
+
+def _scope_statements():
+    return g.get("metrics_sql_statements", 0)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    SQL_DURATION.observe(elapsed, (operation if operation in SQL_OPERATIONS else "OTHER",))
+    if has_app_context() and "metrics_sql_statements" in g:
+        g.metrics_sql_statements += 1
+
+
+def _recipient_count(manager, namespace, room, skip_sid):
+    rooms = manager.rooms.get(namespace, {})
+    names = room if isinstance(room, (list, tuple)) else [room]
+    total = sum(len(rooms.get(name, ())) for name in names)
+    skipped = skip_sid if isinstance(skip_sid, (list, tuple)) else [skip_sid]
+    return max(0, total - sum(1 for sid in skipped if sid is not None))
+
+
+def _instrument_manager(manager):
+    if id(manager) in _instrument_state["managers"]:
+        return
+    _instrument_state["managers"].add(id(manager))
+    original_emit = manager.emit
+
+    @wraps(original_emit)
+    def emit(event_name, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        EMITS.inc((event_name,))
+        EMITTED_FRAMES.inc((event_name,), _recipient_count(manager, namespace, room, skip_sid))
+        return original_emit(event_name, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs)
+
+    manager.emit = emit
+
+
+def instrumented_on(socketio):
+    """``socketio.on`` that also records handler latency, errors and SQL counts.
+
+    Handlers are audited and profiled as ``socket:<event>`` scopes (see
+    :mod:`.query_audit` and :mod:`.profiling`).
+    """
+
+    def on(event_name, namespace=None):
+        def decorator(handler):
+            @wraps(handler)
+            def wrapper(*args, **kwargs):
+                _begin_scope()
+                begin_audit(f"socket:{event_name}")
+                started = time.perf_counter()
+                try:
+                    result = run_in_scope(f"socket:{event_name}", handler, *args, **kwargs)
+                    finish_audit()
+                    return result
+                except Exception:
+                    EVENT_ERRORS.inc((event_name,))
+                    raise
+                finally:
+                    EVENT_DURATION.observe(time.perf_counter() - started, (event_name,))
+                    EVENT_STATEMENTS.observe(_scope_statements(), (event_name,))
+
+            return socketio.on(event_name, namespace)(wrapper)
+
+        return decorator
+
+    return on
+
+
+def init_metrics(app, socketio):
+    """Time every view, count SQL per request and hook emits on ``socketio``."""
+    if not app.config["METRICS_ENABLED"]:
+        return
+    if not _instrument_state["engine"]:
+        _instrument_state["engine"] = True
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    if socketio.server is not None:
+        _instrument_manager(socketio.server.manager)
+
+    @app.before_request
+    def start_request_metrics():
+        _begin_scope()
+        g.metrics_request_started = time.perf_counter()
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        started = g.get("metrics_request_started")
+        if started is None:
+            return
+        endpoint = request.endpoint or "unmatched"
+        status = g.get("metrics_status", 500)
+        REQUEST_DURATION.observe(time.perf_counter() - started, (endpoint, request.method, str(status)))
+        REQUEST_STATEMENTS.observe(_scope_statements(), (endpoint,))
+
+
+def _room_gauges(socketio):
+    lines = [
+        "# HELP kjb_socket_connections Connected Socket.IO clients.",
+        "# TYPE kjb_socket_connections gauge",
+    ]
+    manager = socketio.server.manager if socketio.server is not None else None
+    rooms = dict(manager.rooms.get("/", {})) if manager is not None else {}
+    connected = rooms.get(None, {})
+    lines.append(_format_sample("kjb_socket_connections", {}, len(connected)))
+    lines += [
+        "# HELP kjb_socket_room_members Clients joined to each channel room.",
+        "# TYPE kjb_socket_room_members gauge",
+    ]
+    for room, members in sorted((name, members) for name, members in rooms.items() if name is not None):
+        # Every sid has a private room and every user a push room; only channels are interesting.
+        if room in connected or str(room).startswith("user_"):
+            continue
+        lines.append(_format_sample("kjb_socket_room_members", {"room": room}, len(members)))
+    return lines
+
+
+def _outbound_gauges(socketio):
+    sockets = list(socketio.server.eio.sockets.values()) if socketio.server is not None else []
+    depths = [socket.queue.qsize() for socket in sockets]
+    return [
+        "# HELP kjb_socket_outbound_queued_frames Frames waiting to be written to clients.",
+        "# TYPE kjb_socket_outbound_queued_frames gauge",
+        _format_sample("kjb_socket_outbound_queued_frames", {}, sum(depths)),
+        "# HELP kjb_socket_outbound_queue_max Longest outbound queue of a single client.",
+        "# TYPE kjb_socket_outbound_queue_max gauge",
+        _format_sample("kjb_socket_outbound_queue_max", {}, max(depths, default=0)),
+    ]
+
+
+def render_metrics(socketio):
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(_format_sample(name, labels, value) for name, labels, value in metric.samples())
+    lines.extend(_room_gauges(socketio))
+    lines.extend(_outbound_gauges(socketio))
+    return "\n".join(lines) + "\n"
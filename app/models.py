@@ -1,6 +1,6 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from .extensions import db
+from .passwords import hash_password, needs_rehash, verify_password
 
 
 class Follow(db.Model):
@@ -9,6 +9,8 @@ class Follow(db.Model):
     followed_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index("ix_follows_followed_follower", "followed_id", "follower_id"),)
+
 
 class User(db.Model):
     __tablename__ = "users"
@@ -22,6 +24,8 @@ class User(db.Model):
     kc_points = db.Column(db.Integer, default=0)
     bio = db.Column(db.String(280), default="")
     avatar_url = db.Column(db.String(255), default="/static/images/default-avatar.svg")
+    follower_count = db.Column(db.Integer, default=0, nullable=False)
+    following_count = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     emoji_permissions = db.relationship(
@@ -42,10 +46,13 @@ class User(db.Model):
     )
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self) -> bool:
+        return needs_rehash(self.password_hash)
 
 
 class Channel(db.Model):
@@ -58,6 +65,7 @@ class Channel(db.Model):
     default_can_view = db.Column(db.Boolean, default=True)
     default_can_read = db.Column(db.Boolean, default=True)
     default_can_send = db.Column(db.Boolean, default=True)
+    slow_mode_seconds = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
@@ -85,11 +93,41 @@ class Message(db.Model):
     is_deleted = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=True, onupdate=datetime.utcnow)
+    client_id = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (
+        db.Index("uq_message_user_client", "user_id", "client_id", unique=True),
+        # Ids must never be reused: archived rows keep theirs (see app/archive.py).
+        {"sqlite_autoincrement": True},
+    )
 
     user = db.relationship("User", backref="messages")
     reply_to = db.relationship("Message", remote_side=[id])
 
 
+# Cold tier of ``messages`` (see app/archive.py); same columns, no foreign keys
+# so it can live in a separate SQLite file.
+class MessageArchive(db.Model):
+    __tablename__ = "message_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    channel_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    reply_to_id = db.Column(db.Integer)
+    is_deleted = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    client_id = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_message_archive_channel_id_id", "channel_id", "id"),
+        db.Index("ix_message_archive_user_id", "user_id"),
+        # Mapped to the attached archive database or to the main one by the
+        # engine's schema_translate_map (see config.py).
+        {"schema": "archive"},
+    )
+
+
 class UserChannelRead(db.Model):
     __tablename__ = "user_channel_reads"
     id = db.Column(db.Integer, primary_key=True)
@@ -176,6 +214,8 @@ class KCLog(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     delta = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(255), nullable=False)
+    transfer_id = db.Column(db.String(32), index=True)
+    counterparty_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
@@ -197,8 +237,52 @@ class ShopRequest(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     item_id = db.Column(db.Integer, db.ForeignKey("shop_items.id"), nullable=False)
     status = db.Column(db.String(20), default="pending")
+    reserved = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime)
 
+    __table_args__ = (db.Index("ix_shop_requests_status_id", "status", "id"),)
+
     user = db.relationship("User")
     item = db.relationship("ShopItem")
+
+
+class SchemaVersion(db.Model):
+    __tablename__ = "schema_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_buckets"
+    key = db.Column(db.String(160), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(80), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+        db.Index("ix_jobs_name_status", "name", "status"),
+    )
+
+
+class JobLease(db.Model):
+    __tablename__ = "job_leases"
+    name = db.Column(db.String(40), primary_key=True)
+    holder = db.Column(db.String(80), nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)
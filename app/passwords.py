@@ -0,0 +1,91 @@
+"""Password hashing that keeps PBKDF2/scrypt work off the eventlet hub.
+
+Werkzeug's hashes take tens of milliseconds of pure CPU. Under the eventlet
+server every request and socket shares one OS thread, so hashing inline would
+stall all chat delivery on the worker; instead each hash runs on eventlet's
+native thread pool, with at most ``PASSWORD_HASH_MAX_PENDING`` in flight.
+"""
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .extensions import socketio
+
+
+_slot_state = {"semaphore": None, "size": None}
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are queued; the caller should ask the user to retry."""
+
+
+def _on_hub_thread():
+    from eventlet import patcher
+
+    # The patched ``threading`` reports greenlets, not OS threads, once
+    # monkey_patch() has run; ask the original module which thread this is.
+    native_threading = patcher.original("threading")
+    return native_threading.current_thread() is native_threading.main_thread()
+
+
+def _offload_enabled():
+    # eventlet is only imported once the socket server has chosen it.
+    return (
+        current_app.config["PASSWORD_HASH_OFFLOAD"]
+        and socketio.async_mode == "eventlet"
+        and _on_hub_thread()
+    )
+
+
+def _slots():
+    from eventlet.semaphore import Semaphore
+
+    size = current_app.config["PASSWORD_HASH_MAX_PENDING"]
+    if _slot_state["size"] != size:
+        _slot_state["semaphore"] = Semaphore(size)
+        _slot_state["size"] = size
+    return _slot_state["semaphore"]
+
+
+def _run(func, *args):
+    if not _offload_enabled():
+        return func(*args)
+    from eventlet import tpool
+
+    slots = _slots()
+    if not slots.acquire(timeout=current_app.config["PASSWORD_HASH_QUEUE_TIMEOUT"]):
+        raise PasswordHasherBusy()
+    try:
+        return tpool.execute(func, *args)
+    finally:
+        slots.release()
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"); hash once to learn the form.
+    return generate_password_hash("", method, salt_length=1).split("$", 1)[0]
+
+
+def hash_password(password):
+    config = current_app.config
+    return _run(
+        generate_password_hash,
+        password,
+        config["PASSWORD_HASH_METHOD"],
+        config["PASSWORD_HASH_SALT_LENGTH"],
+    )
+
+
+def verify_password(pwhash, password):
+    if not pwhash:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True when ``pwhash`` was made with other parameters than the configured ones."""
+    if not pwhash or "$" not in pwhash:
+        return False
+    return pwhash.split("$", 1)[0] != _method_prefix(current_app.config["PASSWORD_HASH_METHOD"])
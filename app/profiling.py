@@ -0,0 +1,224 @@
+"""On-demand sampling profiler and eventlet hub-blocking detector.
+
+Both run on native OS threads (``eventlet.patcher.original``), so they keep
+working when the hub itself is stuck. The sampler reads the hub thread's
+current stack every ``PROFILE_SAMPLE_INTERVAL`` seconds and folds the samples
+into flamegraph-compatible collapsed stacks (``frame;frame;frame count``),
+each prefixed with the socket event or view endpoint that was running.
+
+The hub monitor keeps a heartbeat greenlet ticking every
+``HUB_BLOCK_THRESHOLD / 4``; a watchdog thread grabs the hub's stack when the
+heartbeat goes quiet for longer than the threshold, and the heartbeat logs the
+stall with that stack once the hub is free again.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app
+
+
+_profile_lock = threading.Lock()
+_monitor_state = {"started": False}
+
+
+def _native(module_name):
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return __import__(module_name)
+    return patcher.original(module_name)
+
+
+def run_in_scope(scope, func, *args, **kwargs):
+    """Call ``func``; stack samples taken meanwhile are attributed to ``scope``."""
+    return func(*args, **kwargs)
+
+
+_SCOPE_CODE = run_in_scope.__code__
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def scoped_views(app):
+    """Wrap every registered view so samples inside it carry its endpoint name."""
+    for endpoint, view in list(app.view_functions.items()):
+        if getattr(view, "_profile_scoped", False):
+            continue
+
+        def make_wrapper(endpoint, view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                return run_in_scope(endpoint, view, *args, **kwargs)
+
+            wrapper._profile_scoped = True
+            return wrapper
+
+        app.view_functions[endpoint] = make_wrapper(endpoint, view)
+
+
+def _frame_label(code):
+    path = code.co_filename
+    if path.startswith(_APP_ROOT):
+        path = os.path.relpath(path, _APP_ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def _walk_stack(frame):
+    """Return ``(scope, labels)`` for ``frame``, outermost frame first."""
+    labels = []
+    scope = None
+    while frame is not None:
+        if frame.f_code is _SCOPE_CODE and scope is None:
+            scope = frame.f_locals.get("scope")
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return scope or "(idle)", labels
+
+
+def _hub_thread_id():
+    return _native("threading").main_thread().ident
+
+
+class StackSampler:
+    """Collects collapsed stacks of one thread until :meth:`stop` is called."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = _native("threading").Event()
+        self._thread = _native("threading").Thread(target=self._run, name="kjb-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            scope, labels = _walk_stack(frame)
+            self.samples[";".join([scope] + labels)] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def profile_window(seconds, interval=None, sleep=None):
+    """Sample the hub thread for ``seconds``; returns collapsed stacks, or None if busy.
+
+    ``sleep`` should yield to other greenlets (``socketio.sleep``) when called
+    from a request, so the work being profiled keeps running.
+    """
+    config = current_app.config
+    seconds = max(0.1, min(seconds, config["PROFILE_MAX_SECONDS"]))
+    interval = interval or config["PROFILE_SAMPLE_INTERVAL"]
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = StackSampler(_hub_thread_id(), interval).start()
+        (sleep or time.sleep)(seconds)
+        return sampler.stop().collapsed()
+    finally:
+        _profile_lock.release()
+
+
+def _write_profile(output_dir, collapsed):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(collapsed)
+    return path
+
+
+def _profile_on_signal(app, seconds, interval):
+    if not _profile_lock.acquire(blocking=False):
+        return
+    try:
+        sampler = StackSampler(_hub_thread_id(), interval).start()
+        _native("time").sleep(seconds)
+        path = _write_profile(app.config["PROFILE_OUTPUT_DIR"], sampler.stop().collapsed())
+        app.logger.warning("Wrote %s samples to %s", sampler.sample_count, path)
+    finally:
+        _profile_lock.release()
+
+
+def install_profile_signal(app):
+    """``kill -USR2 <pid>`` profiles the worker for ``PROFILE_SIGNAL_SECONDS``."""
+    if not hasattr(signal, "SIGUSR2"):
+        return
+    native_threading = _native("threading")
+    if native_threading.current_thread() is not native_threading.main_thread():
+        return
+    seconds = app.config["PROFILE_SIGNAL_SECONDS"]
+    interval = app.config["PROFILE_SAMPLE_INTERVAL"]
+
+    def handler(signum, frame):
+        _native("threading").Thread(
+            target=_profile_on_signal, args=(app, seconds, interval), name="kjb-profiler", daemon=True
+        ).start()
+
+    signal.signal(signal.SIGUSR2, handler)
+
+
+class HubMonitor:
+    def __init__(self, app, threshold):
+        self.app = app
+        self.threshold = threshold
+        self.tick = threshold / 4
+        self.last_beat = time.monotonic()
+        self.captured = None
+        self.hub_thread_id = None
+
+    def heartbeat(self, sleep):
+        self.hub_thread_id = _native("threading").get_ident()
+        while True:
+            before = time.monotonic()
+            self.last_beat = before
+            sleep(self.tick)
+            stalled = time.monotonic() - before - self.tick
+            if stalled >= self.threshold:
+                scope, stack = self.captured or ("(unknown)", "(stack not captured)")
+                self.app.logger.warning(
+                    "Hub blocked for %.0f ms in %s:\n%s", stalled * 1000, scope, stack
+                )
+            self.captured = None
+
+    def watchdog(self):
+        native_time = _native("time")
+        while True:
+            native_time.sleep(self.tick)
+            if self.captured is not None or self.hub_thread_id is None:
+                continue
+            if time.monotonic() - self.last_beat - self.tick < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.hub_thread_id)
+            if frame is not None:
+                scope, labels = _walk_stack(frame)
+                self.captured = (scope, "\n".join(f"  {label}" for label in labels[-25:]))
+
+
+def start_hub_monitor(app, socketio):
+    """Log greenlets that hold the hub longer than ``HUB_BLOCK_THRESHOLD`` seconds."""
+    threshold = app.config["HUB_BLOCK_THRESHOLD"]
+    if not threshold or _monitor_state["started"]:
+        return
+    _monitor_state["started"] = True
+    monitor = HubMonitor(app, threshold)
+    socketio.start_background_task(monitor.heartbeat, socketio.sleep)
+    _native("threading").Thread(target=monitor.watchdog, name="kjb-hub-watchdog", daemon=True).start()
@@ -0,0 +1,61 @@
+"""Per-user push events over each socket's ``user_{id}`` room.
+
+Pushes queued during a transaction are held on the session and emitted only
+after it commits, so a rolled-back KC change never reaches the client.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .extensions import db, socketio
+
+
+_PENDING_KEY = "user_pushes"
+_listener_state = {"registered": False}
+
+
+def user_room(user_id):
+    return f"user_{user_id}"
+
+
+def push_to_user(user_id, event_name, payload):
+    """Emit immediately; use for state that is not tied to the current transaction."""
+    socketio.emit(event_name, payload, to=user_room(user_id))
+
+
+def queue_user_push(user_id, event_name, payload, coalesce=False):
+    """Emit ``event_name`` to ``user_id`` once the current transaction commits.
+
+    With ``coalesce`` only the last payload per (user, event) is sent.
+    """
+    pending = db.session.info.setdefault(_PENDING_KEY, {})
+    key = (user_id, event_name) if coalesce else (user_id, event_name, len(pending))
+    pending.pop(key, None)
+    pending[key] = payload
+
+
+def push_unread_update(user_id, channel_id, last_read_message_id):
+    push_to_user(
+        user_id,
+        "unread_update",
+        {"channel_id": channel_id, "last_read_message_id": last_read_message_id, "unread": False},
+    )
+
+
+def _emit_pending(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for key, payload in pending.items():
+        push_to_user(key[0], key[1], payload)
+
+
+def _discard_pending(session, previous_transaction=None):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_push_listeners():
+    if _listener_state["registered"]:
+        return
+    _listener_state["registered"] = True
+    event.listen(Session, "after_commit", _emit_pending)
+    event.listen(Session, "after_soft_rollback", _discard_pending)
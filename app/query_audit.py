@@ -0,0 +1,137 @@
+"""Debug/test-mode N+1 detection and per-endpoint query budgets.
+
+With ``QUERY_AUDIT`` on, every HTTP request and Socket.IO event counts its SQL
+statements by shape (the statement text with placeholders normalized and
+``IN (?, ?, ...)`` lists collapsed). A shape repeated
+``QUERY_AUDIT_REPEAT_THRESHOLD`` times is logged with the application call
+stack that issued it, which is what a lazy relationship loaded inside a loop
+looks like. ``QUERY_BUDGETS`` caps the statement count per scope
+(``views.chat``, ``socket:send_message``, ...) and can be overridden from the
+environment variable of the same name; going over is logged and, with
+``QUERY_BUDGET_STRICT``, raised as :class:`QueryBudgetExceeded` so tests fail.
+"""
+import os
+import re
+import traceback
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# qmark, format, pyformat, named and numeric paramstyles, so shapes compare
+# the same on every driver; parameter names shift with IN-list length too.
+PLACEHOLDER_PATTERN = re.compile(r"\?|%s|%\(\w+\)s|(?<![:\w]):\w+|\$\d+")
+IN_LIST_PATTERN = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+STACK_DEPTH = 12
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_audit_state = {"listening": False}
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, scope, count, budget):
+        super().__init__(f"{scope} issued {count} SQL statements (budget {budget})")
+        self.scope = scope
+        self.count = count
+        self.budget = budget
+
+
+def parse_budgets(value):
+    """Parse ``"views.chat=20,socket:send_message=15"`` into a dict."""
+    budgets = {}
+    for part in (value or "").split(","):
+        scope, _, limit = part.strip().rpartition("=")
+        if scope and limit.isdigit():
+            budgets[scope] = int(limit)
+    return budgets
+
+
+def statement_shape(statement):
+    statement = PLACEHOLDER_PATTERN.sub("?", " ".join(statement.split()))
+    return IN_LIST_PATTERN.sub("(?)", statement)
+
+
+def _app_stack():
+    frames = [
+        frame
+        for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(_APP_DIR)
+        and os.path.basename(frame.filename) not in ("query_audit.py", "metrics.py")
+    ]
+    return "".join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+def begin_audit(scope):
+    if has_app_context() and current_app.config["QUERY_AUDIT"]:
+        g.query_audit = {"scope": scope, "total": 0, "shapes": {}}
+
+
+def record_statement(statement):
+    if not has_app_context():
+        return
+    audit = g.get("query_audit")
+    if audit is None:
+        return
+    audit["total"] += 1
+    shape = statement_shape(statement)
+    repeats = audit["shapes"].get(shape, 0) + 1
+    audit["shapes"][shape] = repeats
+    if repeats == current_app.config["QUERY_AUDIT_REPEAT_THRESHOLD"]:
+        current_app.logger.warning(
+            "Possible N+1 in %s: statement repeated %d times\n  %s\nIssued from:\n%s",
+            audit["scope"],
+            repeats,
+            shape,
+            _app_stack(),
+        )
+
+
+def query_budget(scope):
+    config = current_app.config
+    return config["QUERY_BUDGETS"].get(scope, config["QUERY_BUDGET_DEFAULT"])
+
+
+def finish_audit():
+    """Close the current scope; returns its statement count (None when not auditing)."""
+    audit = g.pop("query_audit", None)
+    if audit is None:
+        return None
+    budget = query_budget(audit["scope"])
+    if budget is not None and audit["total"] > budget:
+        top = sorted(audit["shapes"].items(), key=lambda item: item[1], reverse=True)[:3]
+        current_app.logger.error(
+            "%s issued %d SQL statements (budget %d); most repeated:\n%s",
+            audit["scope"],
+            audit["total"],
+            budget,
+            "\n".join(f"  {count}x {shape}" for shape, count in top),
+        )
+        if current_app.config["QUERY_BUDGET_STRICT"]:
+            raise QueryBudgetExceeded(audit["scope"], audit["total"], budget)
+    return audit["total"]
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_statement(statement)
+
+
+def init_query_audit(app):
+    if not app.config["QUERY_AUDIT"]:
+        return
+    app.config["QUERY_BUDGETS"] = {
+        **app.config["QUERY_BUDGETS"],
+        **parse_budgets(app.config["QUERY_BUDGET_OVERRIDES"]),
+    }
+    if not _audit_state["listening"]:
+        _audit_state["listening"] = True
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_query_audit():
+        begin_audit(request.endpoint or "unmatched")
+
+    @app.after_request
+    def check_query_budget(response):
+        finish_audit()
+        return response
@@ -0,0 +1,142 @@
+"""Token-bucket rate limits for chat actions and per-channel slow mode.
+
+``RATE_LIMITS`` gives each action a ``(capacity, seconds)`` budget per user
+and optionally per channel: ``{"send_message": {"user": (8, 10)}}`` allows a
+burst of 8 messages and refills the bucket over 10 seconds. Slow mode is a
+one-token bucket per (user, channel) refilled every
+``Channel.slow_mode_seconds``; admins are exempt from it.
+
+Buckets live in the store named by ``RATE_LIMIT_BACKEND``: ``memory`` (per
+worker), ``database`` (one row per bucket, shared by every worker on the same
+database) or a ``module:Class`` import path. A store is built with the app and
+implements ``take(key, capacity, refill_rate, now)``, returning 0 when a token
+was spent and otherwise the seconds until one is available.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.utils import import_string
+
+from .extensions import db
+from .models import RateLimitBucket
+
+
+SLOW_MODE_ACTIONS = {"send_message"}
+DATABASE_PRUNE_EVERY = 1000
+DATABASE_IDLE_SECONDS = 86400
+
+
+class MemoryBucketStore:
+    def __init__(self, app):
+        self.max_keys = app.config["RATE_LIMIT_MAX_KEYS"]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate, now):
+        with self._lock:
+            tokens, updated_at, _, _ = self._buckets.get(key, (capacity, now, None, None))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, capacity, refill_rate)
+                return (1 - tokens) / refill_rate
+            self._buckets[key] = (tokens - 1, now, capacity, refill_rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0.0
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket.
+        self._buckets = {
+            key: bucket
+            for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[3] < bucket[2]
+        }
+
+
+class DatabaseBucketStore:
+    def __init__(self, app):
+        self._takes = 0
+
+    def _upsert(self, key, capacity, refill_rate, now):
+        table = RateLimitBucket.__table__
+        dialect = db.engine.dialect.name
+        if dialect == "sqlite":
+            stmt = sqlite_insert(table)
+            refilled = func.min(capacity, table.c.tokens + (now - table.c.updated_at) * refill_rate)
+        elif dialect == "postgresql":
+            stmt = postgresql_insert(table)
+            refilled = func.least(capacity, table.c.tokens + (now - table.c.updated_at) * refill_rate)
+        else:
+            raise RuntimeError(f"The database rate-limit backend does not support {dialect}")
+        return (
+            stmt.values(key=key, tokens=capacity - 1, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={"tokens": refilled - 1, "updated_at": now},
+                where=refilled >= 1,
+            )
+            .returning(table.c.tokens)
+        )
+
+    def take(self, key, capacity, refill_rate, now):
+        table = RateLimitBucket.__table__
+        # Own connection so the caller's session transaction is not committed early.
+        with db.engine.begin() as connection:
+            if connection.execute(self._upsert(key, capacity, refill_rate, now)).first():
+                self._takes += 1
+                if self._takes % DATABASE_PRUNE_EVERY == 0:
+                    connection.execute(
+                        delete(table).where(table.c.updated_at < now - DATABASE_IDLE_SECONDS)
+                    )
+                return 0.0
+            tokens, updated_at = connection.execute(
+                select(table.c.tokens, table.c.updated_at).where(table.c.key == key)
+            ).one()
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        return max(0.0, (1 - tokens) / refill_rate)
+
+
+BACKENDS = {"memory": MemoryBucketStore, "database": DatabaseBucketStore}
+
+
+def get_bucket_store():
+    app = current_app._get_current_object()
+    store = app.extensions.get("kjb_rate_limit")
+    if store is None:
+        backend = app.config["RATE_LIMIT_BACKEND"]
+        store_class = BACKENDS.get(backend) or import_string(backend)
+        store = app.extensions["kjb_rate_limit"] = store_class(app)
+    return store
+
+
+def rate_limited_error(scope, retry_after):
+    return {"ok": False, "error": "rate_limited", "scope": scope, "retry_after": round(retry_after, 2)}
+
+
+def check_rate_limit(action, user, channel=None):
+    """Spend a token for ``action``; returns None, or a ``rate_limited`` error dict."""
+    config = current_app.config
+    if not config["RATE_LIMIT_ENABLED"]:
+        return None
+    budgets = config["RATE_LIMITS"].get(action, {})
+    buckets = []
+    if "user" in budgets:
+        buckets.append(("user", f"{action}:user:{user.id}", budgets["user"]))
+    if channel is not None and "channel" in budgets:
+        buckets.append(("channel", f"{action}:channel:{channel.id}", budgets["channel"]))
+    # Last, so a rejection by a short bucket does not burn the long slow-mode wait.
+    if channel is not None and action in SLOW_MODE_ACTIONS and channel.slow_mode_seconds and not user.is_admin:
+        buckets.append(("slow_mode", f"slow:{channel.id}:{user.id}", (1, channel.slow_mode_seconds)))
+    if not buckets:
+        return None
+    store = get_bucket_store()
+    now = time.time()
+    for scope, key, (capacity, seconds) in buckets:
+        retry_after = store.take(key, capacity, capacity / seconds, now)
+        if retry_after > 0:
+            return rate_limited_error(scope, retry_after)
+    return None
@@ -0,0 +1,126 @@
+"""In-memory read-receipt buffer flushed to ``user_channel_reads`` in batches."""
+import atexit
+import threading
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from .extensions import db
+from .models import UserChannelRead
+
+
+FLUSH_CHUNK_SIZE = 500
+
+pending_reads = {}
+_pending_lock = threading.Lock()
+_flusher_state = {"started": False}
+
+
+def record_read(user_id, channel_id, message_id):
+    """Remember the highest message id ``user_id`` has seen in ``channel_id``."""
+    if not user_id or not channel_id or not message_id:
+        return
+    key = (user_id, channel_id)
+    with _pending_lock:
+        if pending_reads.get(key, 0) < message_id:
+            pending_reads[key] = message_id
+
+
+def pending_reads_for(user_id, channel_ids):
+    with _pending_lock:
+        return {
+            channel_id: pending_reads[(user_id, channel_id)]
+            for channel_id in channel_ids
+            if (user_id, channel_id) in pending_reads
+        }
+
+
+def _upsert_statement(rows):
+    table = UserChannelRead.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite_insert(table).values(rows)
+        highest = func.max(table.c.last_read_message_id, stmt.excluded.last_read_message_id)
+    elif dialect == "postgresql":
+        stmt = postgresql_insert(table).values(rows)
+        highest = func.greatest(table.c.last_read_message_id, stmt.excluded.last_read_message_id)
+    else:
+        return None
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.channel_id],
+        set_={"last_read_message_id": highest, "updated_at": stmt.excluded.updated_at},
+    )
+
+
+def _merge_rows(rows):
+    for row in rows:
+        state = UserChannelRead.query.filter_by(
+            user_id=row["user_id"], channel_id=row["channel_id"]
+        ).first()
+        if not state:
+            db.session.add(UserChannelRead(**row))
+        elif (state.last_read_message_id or 0) < row["last_read_message_id"]:
+            state.last_read_message_id = row["last_read_message_id"]
+
+
+def flush_reads():
+    """Write all buffered read positions in one transaction. Returns the row count."""
+    with _pending_lock:
+        if not pending_reads:
+            return 0
+        batch = dict(pending_reads)
+        pending_reads.clear()
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "last_read_message_id": message_id,
+            "updated_at": now,
+        }
+        for (user_id, channel_id), message_id in batch.items()
+    ]
+    try:
+        for start in range(0, len(rows), FLUSH_CHUNK_SIZE):
+            chunk = rows[start : start + FLUSH_CHUNK_SIZE]
+            stmt = _upsert_statement(chunk)
+            if stmt is None:
+                _merge_rows(chunk)
+            else:
+                db.session.execute(stmt)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        with _pending_lock:
+            for key, message_id in batch.items():
+                if pending_reads.get(key, 0) < message_id:
+                    pending_reads[key] = message_id
+        raise
+    return len(rows)
+
+
+def _flush_in_context(app):
+    with app.app_context():
+        try:
+            flush_reads()
+        except SQLAlchemyError:
+            app.logger.exception("Failed to flush read state")
+
+
+def _flush_loop(app, socketio, interval):
+    while True:
+        socketio.sleep(interval)
+        _flush_in_context(app)
+
+
+def start_read_flusher(app, socketio):
+    """Flush the buffer every ``READ_STATE_FLUSH_INTERVAL`` seconds and at exit."""
+    if _flusher_state["started"]:
+        return
+    _flusher_state["started"] = True
+    interval = app.config["READ_STATE_FLUSH_INTERVAL"]
+    socketio.start_background_task(_flush_loop, app, socketio, interval)
+    atexit.register(_flush_in_context, app)
@@ -1,5 +1,4 @@
-from datetime import datetime
-from sqlalchemy.orm import joinedload
+import math
 from flask import (
     Blueprint,
     render_template,
@@ -7,9 +6,14 @@ from flask import (
     redirect,
     url_for,
     flash,
-    send_from_directory,
+    current_app,
+    stream_with_context,
 )
-from ..extensions import db
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from ..archive import delete_archived_messages, latest_message_ids
+from ..channel_transfer import iter_channel_export, iter_gzip
+from ..extensions import db, socketio
 from ..models import (
     User,
     Channel,
@@ -36,12 +40,31 @@ from ..utils import (
     adjust_kc,
     to_kst,
     save_upload,
-    resolve_channel_permissions,
     build_channel_permission_map,
+    get_channel_listing,
+    get_visible_channels,
     parse_int,
 )
+from ..jobs import JOB_REGISTRY, current_leader, enqueue, recent_jobs, retry_job
+from ..ledger import InsufficientKCError, transfer_kc
+from ..media import send_media, send_static_asset
+from ..metrics import render_metrics
+from ..passwords import PasswordHasherBusy
+from ..profiling import profile_window
+from ..push import push_unread_update
+from ..rate_limit import check_rate_limit
+from ..read_state import pending_reads_for, record_read
+from ..search import remove_messages_by, search_message_ids
+from ..shop import (
+    approve_request,
+    claim_request,
+    deny_request,
+    pending_queue,
+    place_request,
+    process_pending_requests,
+)
 from ..sockets import online_users
-from ..sockets import serialize_messages
+from ..sockets import channel_event_state, query_serialized_messages
 
 bp = Blueprint("views", __name__)
 
@@ -51,18 +74,14 @@ def _compute_unread_channel_ids(user, channels):
     channel_ids = [channel.id for channel in channels]
     if not channel_ids:
         return set()
-    latest_rows = (
-        db.session.query(Message.channel_id, db.func.max(Message.id))
-        .filter(Message.channel_id.in_(channel_ids), Message.is_deleted.is_(False))
-        .group_by(Message.channel_id)
-        .all()
-    )
-    latest_map = {channel_id: max_id for channel_id, max_id in latest_rows if max_id}
+    latest_map = latest_message_ids(channel_ids)
     read_rows = UserChannelRead.query.filter(
         UserChannelRead.user_id == user.id,
         UserChannelRead.channel_id.in_(channel_ids),
     ).all()
     read_map = {row.channel_id: row.last_read_message_id for row in read_rows}
+    for channel_id, message_id in pending_reads_for(user.id, channel_ids).items():
+        read_map[channel_id] = max(read_map.get(channel_id) or 0, message_id)
     return {
         channel_id
         for channel_id, max_id in latest_map.items()
@@ -70,17 +89,35 @@ def _compute_unread_channel_ids(user, channels):
     }
 
 
-def _mark_channel_read(user, channel_id, message_id):
-    if not user or not channel_id or not message_id:
-        return
-    state = UserChannelRead.query.filter_by(user_id=user.id, channel_id=channel_id).first()
-    if not state:
-        state = UserChannelRead(
-            user_id=user.id, channel_id=channel_id, last_read_message_id=message_id
-        )
-        db.session.add(state)
-    elif state.last_read_message_id < message_id:
-        state.last_read_message_id = message_id
+FOLLOW_PAGE_SIZE = 50
+
+
+def _adjust_follow_counts(follower_id, followed_id, delta):
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id == followed_id)
+        .values(follower_count=users.c.follower_count + delta)
+    )
+    db.session.execute(
+        update(users)
+        .where(users.c.id == follower_id)
+        .values(following_count=users.c.following_count + delta)
+    )
+
+
+def _release_follow_counts(user_id):
+    users = User.__table__
+    db.session.execute(
+        update(users)
+        .where(users.c.id.in_(select(Follow.followed_id).where(Follow.follower_id == user_id)))
+        .values(follower_count=users.c.follower_count - 1)
+    )
+    db.session.execute(
+        update(users)
+        .where(users.c.id.in_(select(Follow.follower_id).where(Follow.followed_id == user_id)))
+        .values(following_count=users.c.following_count - 1)
+    )
 
 
 @bp.before_app_request
@@ -91,12 +128,9 @@ def load_user():
 @bp.route("/")
 def index():
     if get_current_user():
-        current = get_current_user()
-        channels = Channel.query.order_by(Channel.priority.desc(), Channel.name.asc()).all()
-        permission_map = build_channel_permission_map(current, channels)
-        for channel in channels:
-            if permission_map[channel.id]["can_view"]:
-                return redirect(url_for("views.chat", id=channel.slug))
+        visible_channels = get_visible_channels()
+        if visible_channels:
+            return redirect(url_for("views.chat", id=visible_channels[0].slug))
     return render_template("index.html")
 
 
@@ -107,7 +141,15 @@ def signin():
         password = request.form.get("password", "")
         remember = request.form.get("remember") == "on"
         user = User.query.filter_by(email=email).first()
-        if not user or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+            if valid and user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash("로그인 요청이 많습니다. 잠시 후 다시 시도해주세요.")
+            return redirect(url_for("views.signin"))
+        if not valid:
             flash("이메일 또는 비밀번호가 올바르지 않습니다.")
             return redirect(url_for("views.signin"))
         set_login(user, remember)
@@ -145,7 +187,11 @@ def signup():
             username=username,
             is_admin=is_first,
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            flash("가입 요청이 많습니다. 잠시 후 다시 시도해주세요.")
+            return redirect(url_for("views.signup"))
         db.session.add(user)
         db.session.commit()
         set_login(user, True)
@@ -165,44 +211,35 @@ def logout():
 def chat():
     channel_slug = request.args.get("id")
     current = get_current_user()
-    all_channels = Channel.query.order_by(Channel.priority.desc(), Channel.name.asc()).all()
-    permission_map = build_channel_permission_map(current, all_channels)
-    visible_channels = [ch for ch in all_channels if permission_map[ch.id]["can_view"]]
+    all_channels, permission_map = get_channel_listing()
+    visible_channels = get_visible_channels()
 
     if not channel_slug:
         if visible_channels:
             return redirect(url_for("views.chat", id=visible_channels[0].slug))
 
-    channel = Channel.query.filter_by(slug=channel_slug).first()
+    channel = next((ch for ch in all_channels if ch.slug == channel_slug), None)
     if not channel:
         flash("채널을 찾을 수 없습니다.")
         return redirect(url_for("views.index"))
 
-    permissions = permission_map.get(channel.id, resolve_channel_permissions(current, channel))
+    permissions = permission_map[channel.id]
     if not permissions["can_view"]:
         if visible_channels:
             return redirect(url_for("views.chat", id=visible_channels[0].slug))
         flash("접근 가능한 채널이 없습니다.")
         return redirect(url_for("views.index"))
 
-    messages = []
     serialized_messages = []
     if permissions["can_read"]:
-        latest_messages = (
-            Message.query.options(
-                joinedload(Message.user),
-                joinedload(Message.reply_to),
-            )
-            .filter_by(channel_id=channel.id)
-            .order_by(Message.id.desc())
-            .limit(200)
-            .all()
+        latest_messages = query_serialized_messages(
+            Message.channel_id == channel.id, newest_first=True, limit=200, include_archive=True
         )
-        messages = list(reversed(latest_messages))
-        serialized_messages = serialize_messages(messages)
-        if messages:
-            _mark_channel_read(current, channel.id, messages[-1].id)
-            db.session.commit()
+        serialized_messages = list(reversed(latest_messages))
+        if serialized_messages:
+            last_message_id = serialized_messages[-1]["id"]
+            record_read(current.id, channel.id, last_message_id)
+            push_unread_update(current.id, channel.id, last_message_id)
 
     unread_channel_ids = _compute_unread_channel_ids(current, visible_channels)
     return render_template(
@@ -212,6 +249,7 @@ def chat():
         can_send=permissions["can_send"],
         can_read=permissions["can_read"],
         unread_channel_ids=unread_channel_ids,
+        event_state=channel_event_state(channel.id),
     )
 
 
@@ -219,20 +257,61 @@ def chat():
 @login_required
 def mark_chat_read():
     current = get_current_user()
-    channel_slug = request.form.get("channel", "")
-    message_id = parse_int(request.form.get("message_id"))
-    if not channel_slug or not message_id:
-        return ("", 204)
-    channel = Channel.query.filter_by(slug=channel_slug).first()
-    if not channel:
-        return ("", 204)
-    if not resolve_channel_permissions(current, channel)["can_read"]:
-        return ("", 204)
-    _mark_channel_read(current, channel.id, message_id)
-    db.session.commit()
+    limited = check_rate_limit("chat_read", current)
+    if limited:
+        return limited, 429, {"Retry-After": str(math.ceil(limited["retry_after"]))}
+    payload = request.get_json(silent=True) or {}
+    reads = {}
+    for entry in payload.get("reads") or []:
+        if not isinstance(entry, dict):
+            continue
+        channel_id = parse_int(entry.get("channel_id"))
+        message_id = parse_int(entry.get("message_id"))
+        if channel_id and message_id:
+            reads[channel_id] = max(reads.get(channel_id, 0), message_id)
+    if reads:
+        channels = Channel.query.filter(Channel.id.in_(reads.keys())).all()
+    else:
+        # Form posts from pages loaded before batching: one channel slug per call.
+        channel_slug = request.form.get("channel", "")
+        message_id = parse_int(request.form.get("message_id"))
+        if not channel_slug or not message_id:
+            return ("", 204)
+        channels = Channel.query.filter_by(slug=channel_slug).all()
+        reads = {channel.id: message_id for channel in channels}
+    permission_map = build_channel_permission_map(current, channels)
+    for channel in channels:
+        if permission_map[channel.id]["can_read"]:
+            record_read(current.id, channel.id, reads[channel.id])
+            push_unread_update(current.id, channel.id, reads[channel.id])
     return ("", 204)
 
 
+@bp.route("/search")
+@login_required
+def search():
+    current = get_current_user()
+    query = request.args.get("q", "").strip()
+    before_id = parse_int(request.args.get("before"))
+    results = []
+    next_before = None
+    if query:
+        channels = Channel.query.all()
+        permission_map = build_channel_permission_map(current, channels)
+        readable = {ch.id: ch for ch in channels if permission_map[ch.id]["can_read"]}
+        message_ids, has_more = search_message_ids(query, readable.keys(), before_id)
+        if message_ids:
+            results = [
+                dict(item, channel=readable[item["channel_id"]])
+                for item in query_serialized_messages(
+                    Message.id.in_(message_ids), newest_first=True, include_archive=True
+                )
+            ]
+        if has_more:
+            next_before = message_ids[-1]
+    return render_template("search.html", query=query, results=results, next_before=next_before)
+
+
 @bp.route("/profile")
 @login_required
 def profile():
@@ -243,19 +322,52 @@ def profile():
         return redirect(url_for("views.index"))
     current = get_current_user()
     is_following = False
-    if current:
-        is_following = (
-            Follow.query.filter_by(follower_id=current.id, followed_id=user.id).first()
-            is not None
-        )
-    follower_count = Follow.query.filter_by(followed_id=user.id).count()
-    following_count = Follow.query.filter_by(follower_id=user.id).count()
+    if current and current.id != user.id:
+        is_following = db.session.get(Follow, (current.id, user.id)) is not None
     return render_template(
         "profile.html",
         profile_user=user,
         is_following=is_following,
-        follower_count=follower_count,
-        following_count=following_count,
+        follower_count=user.follower_count,
+        following_count=user.following_count,
+    )
+
+
+@bp.route("/profile/<direction>")
+@login_required
+def follow_list(direction):
+    if direction not in ("followers", "following"):
+        return redirect(url_for("views.index"))
+    prefix = request.args.get("usr", "")
+    user = User.query.filter_by(email_prefix=prefix).first()
+    if not user:
+        flash("사용자를 찾을 수 없습니다.")
+        return redirect(url_for("views.index"))
+    after_id = parse_int(request.args.get("after")) or 0
+    if direction == "followers":
+        key_column, owner_column = Follow.follower_id, Follow.followed_id
+    else:
+        key_column, owner_column = Follow.followed_id, Follow.follower_id
+    page_ids = (
+        db.session.query(key_column)
+        .filter(owner_column == user.id, key_column > after_id)
+        .order_by(key_column.asc())
+        .limit(FOLLOW_PAGE_SIZE + 1)
+        .all()
+    )
+    page_ids = [row[0] for row in page_ids]
+    next_after = page_ids[FOLLOW_PAGE_SIZE - 1] if len(page_ids) > FOLLOW_PAGE_SIZE else None
+    page_ids = page_ids[:FOLLOW_PAGE_SIZE]
+    users_by_id = {
+        row.id: row
+        for row in User.query.filter(User.id.in_(page_ids)).all()
+    } if page_ids else {}
+    return render_template(
+        "follow_list.html",
+        profile_user=user,
+        direction=direction,
+        users=[users_by_id[user_id] for user_id in page_ids if user_id in users_by_id],
+        next_after=next_after,
     )
 
 
@@ -266,15 +378,15 @@ def follow(prefix):
     current = get_current_user()
     if current.id == target.id:
         return redirect(url_for("views.profile", usr=prefix))
-    existing = Follow.query.filter_by(
-        follower_id=current.id, followed_id=target.id
-    ).first()
+    existing = db.session.get(Follow, (current.id, target.id))
     if existing:
         db.session.delete(existing)
+        _adjust_follow_counts(current.id, target.id, -1)
         adjust_kc(target, -50, "팔로워 감소", db, KCLog, Notification)
         notify(target.id, "팔로우", f"{current.name}님이 언팔로우했습니다.", db, Notification)
     else:
         db.session.add(Follow(follower_id=current.id, followed_id=target.id))
+        _adjust_follow_counts(current.id, target.id, 1)
         adjust_kc(target, 50, "팔로워 증가", db, KCLog, Notification)
         notify(target.id, "팔로우", f"{current.name}님이 팔로우했습니다.", db, Notification)
     db.session.commit()
@@ -294,6 +406,7 @@ def mypage():
                 avatar_file,
                 current_app.config["UPLOAD_FOLDER"],
                 current_app.config["ALLOWED_EXTENSIONS"],
+                derivative_kind="avatar",
             )
             if not upload_name:
                 flash("지원하지 않는 파일 형식입니다.")
@@ -316,12 +429,10 @@ def shop():
         if not item:
             flash("상품을 찾을 수 없습니다.")
             return redirect(url_for("views.shop"))
-        if item.quantity is not None and item.quantity <= 0:
+        if not place_request(current.id, item):
+            db.session.rollback()
             flash("품절된 상품입니다.")
             return redirect(url_for("views.shop"))
-        request_entry = ShopRequest(user_id=current.id, item_id=item.id)
-        db.session.add(request_entry)
-        notify(current.id, "상점", f"{item.name} 구매 요청을 접수했습니다.", db, Notification)
         db.session.commit()
         flash("구매 요청이 접수되었습니다.")
         return redirect(url_for("views.shop"))
@@ -350,8 +461,12 @@ def sendkc():
             flash("수신자를 찾을 수 없습니다. 송금이 취소됩니다.")
             db.session.commit()
             return redirect(url_for("views.sendkc"))
-        adjust_kc(current, -amount, "KC 송금", db, KCLog, Notification)
-        adjust_kc(recipient, amount, "KC 수신", db, KCLog, Notification)
+        try:
+            transfer_kc(current.id, recipient.id, amount, "KC 송금", "KC 수신")
+        except InsufficientKCError:
+            db.session.rollback()
+            flash("KC가 부족합니다.")
+            return redirect(url_for("views.sendkc"))
         notify(recipient.id, "송금", f"{current.name}님에게서 {amount} KC를 받았습니다.", db, Notification)
         db.session.commit()
         flash("송금이 완료되었습니다.")
@@ -383,7 +498,59 @@ def clear_mailbox():
 
 @bp.route("/media/<path:filename>")
 def media(filename):
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename)
+    return send_media(filename)
+
+
+@bp.route("/assets/<digest>/<path:filename>")
+def asset(digest, filename):
+    return send_static_asset(digest, filename)
+
+
+@bp.route("/metrics")
+@admin_required
+def metrics():
+    return (
+        render_metrics(socketio),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+@bp.route("/admin/profile")
+@admin_required
+def admin_profile():
+    """Sample the worker for ``?seconds=`` and return collapsed stacks.
+
+    Feed the download to ``flamegraph.pl`` or speedscope.
+    """
+    seconds = request.args.get("seconds", 10.0, type=float)
+    interval = request.args.get("interval", type=float)
+    collapsed = profile_window(seconds, interval, sleep=socketio.sleep)
+    if collapsed is None:
+        return "A profile is already running in this worker.\n", 409, {"Content-Type": "text/plain; charset=utf-8"}
+    return (
+        collapsed,
+        200,
+        {
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Disposition": "attachment; filename=profile.folded",
+        },
+    )
+
+
+@bp.route("/admin/channels/<slug>/export")
+@admin_required
+def admin_channel_export(slug):
+    """Stream the channel's full history as gzip-compressed NDJSON."""
+    channel = Channel.query.filter_by(slug=slug).first_or_404()
+    return (
+        stream_with_context(iter_gzip(iter_channel_export(channel))),
+        200,
+        {
+            "Content-Type": "application/gzip",
+            "Content-Disposition": f"attachment; filename={channel.slug}.ndjson.gz",
+        },
+    )
 
 
 @bp.route("/admin", methods=["GET", "POST"])
@@ -408,40 +575,15 @@ def admin():
             decision = request.form.get("decision")
             shop_request = ShopRequest.query.get(request_id)
             if shop_request and shop_request.status == "pending":
+                item = shop_request.item
                 if decision == "approve":
-                    item = shop_request.item
-                    if shop_request.user.kc_points >= item.kc_cost:
-                        adjust_kc(shop_request.user, -item.kc_cost, "상점 구매", db, KCLog, Notification)
-                        shop_request.status = "approved"
-                        shop_request.processed_at = datetime.utcnow()
-                        if item.quantity is not None:
-                            item.quantity = max(0, item.quantity - 1)
-                        notify(
-                            shop_request.user.id,
-                            "상점",
-                            f"{item.name} 구매가 승인되었습니다.",
-                            db,
-                            Notification,
-                        )
-                    else:
-                        shop_request.status = "denied"
-                        notify(
-                            shop_request.user.id,
-                            "상점",
-                            f"KC 부족으로 {item.name} 구매가 거절되었습니다.",
-                            db,
-                            Notification,
-                        )
-                else:
-                    shop_request.status = "denied"
-                    notify(
-                        shop_request.user.id,
-                        "상점",
-                        f"{shop_request.item.name} 구매가 거절되었습니다.",
-                        db,
-                        Notification,
-                    )
+                    approve_request(shop_request, item)
+                elif claim_request(shop_request):
+                    deny_request(shop_request, item, f"{item.name} 구매가 거절되었습니다.")
                 db.session.commit()
+        elif action == "shop_auto_approve":
+            counts = process_pending_requests()
+            flash(f"대기 요청을 처리했습니다. (승인 {counts['approved']}건, 거절 {counts['denied']}건)")
         elif action == "channel_create":
             slug = request.form.get("slug", "").strip()
             name = request.form.get("name", "").strip()
@@ -450,6 +592,7 @@ def admin():
             default_can_view = request.form.get("default_can_view") == "on"
             default_can_read = request.form.get("default_can_read") == "on"
             default_can_send = request.form.get("default_can_send") == "on"
+            slow_mode_seconds = max(0, parse_int(request.form.get("slow_mode_seconds")) or 0)
             if slug and name and not Channel.query.filter_by(slug=slug).first():
                 db.session.add(
                     Channel(
@@ -460,6 +603,7 @@ def admin():
                         default_can_view=default_can_view,
                         default_can_read=default_can_read,
                         default_can_send=default_can_send,
+                        slow_mode_seconds=slow_mode_seconds,
                     )
                 )
                 db.session.commit()
@@ -487,12 +631,17 @@ def admin():
                 channel.default_can_send = (
                     request.form.get("default_can_send") == "on"
                 )
+                channel.slow_mode_seconds = max(
+                    0, parse_int(request.form.get("slow_mode_seconds")) or 0
+                )
                 db.session.commit()
         elif action == "channel_delete":
             channel_id = request.form.get("channel_id")
             channel = Channel.query.get(channel_id)
             if channel:
                 Message.query.filter_by(channel_id=channel.id).delete()
+                delete_archived_messages(channel_id=channel.id)
+                remove_messages_by(channel_id=channel.id)
                 ChannelPermission.query.filter_by(channel_id=channel.id).delete()
                 db.session.delete(channel)
                 db.session.commit()
@@ -566,6 +715,9 @@ def admin():
             target = User.query.filter_by(email_prefix=prefix).first()
             if target and target.id != current.id:
                 Message.query.filter_by(user_id=target.id).delete()
+                delete_archived_messages(user_id=target.id)
+                remove_messages_by(user_id=target.id)
+                _release_follow_counts(target.id)
                 Follow.query.filter_by(follower_id=target.id).delete()
                 Follow.query.filter_by(followed_id=target.id).delete()
                 ChannelPermission.query.filter_by(user_id=target.id).delete()
@@ -591,6 +743,7 @@ def admin():
                 image_file,
                 current_app.config["UPLOAD_FOLDER"],
                 current_app.config["ALLOWED_EXTENSIONS"],
+                derivative_kind="emoji",
             )
             if not upload_name:
                 flash("지원하지 않는 이미지 형식입니다.")
@@ -645,6 +798,7 @@ def admin():
                 image_file,
                 current_app.config["UPLOAD_FOLDER"],
                 current_app.config["ALLOWED_EXTENSIONS"],
+                derivative_kind="accessory",
             )
             if not upload_name:
                 flash("지원하지 않는 이미지 형식입니다.")
@@ -694,30 +848,49 @@ def admin():
             if permission:
                 db.session.delete(permission)
                 db.session.commit()
+        elif action == "job_run":
+            name = request.form.get("name")
+            if name in JOB_REGISTRY:
+                enqueue(name)
+                db.session.commit()
+                flash(f"{name} 작업을 대기열에 추가했습니다.")
+        elif action == "job_retry":
+            if retry_job(parse_int(request.form.get("job_id"))):
+                db.session.commit()
     stats = {
         "user_count": User.query.count(),
         "channel_count": Channel.query.count(),
         "online_count": len(online_users),
     }
-    shop_requests = (
-        ShopRequest.query.filter_by(status="pending")
-        .order_by(ShopRequest.created_at.desc())
-        .all()
-    )
+    # The template reads these relationships for every row; load them in the same query.
+    shop_requests = pending_queue().options(joinedload(ShopRequest.user), joinedload(ShopRequest.item)).all()
     items = ShopItem.query.order_by(ShopItem.priority.desc(), ShopItem.name.asc()).all()
     channels = Channel.query.order_by(Channel.priority.desc(), Channel.name.asc()).all()
     users = User.query.order_by(User.created_at.desc()).all()
-    channel_permissions = ChannelPermission.query.order_by(
-        ChannelPermission.created_at.desc()
-    ).all()
+    channel_permissions = (
+        ChannelPermission.query.options(
+            joinedload(ChannelPermission.user), joinedload(ChannelPermission.channel)
+        )
+        .order_by(ChannelPermission.created_at.desc())
+        .all()
+    )
     emojis = Emoji.query.order_by(Emoji.name.asc()).all()
-    emoji_permissions = UserEmojiPermission.query.order_by(
-        UserEmojiPermission.created_at.desc()
-    ).all()
+    emoji_permissions = (
+        UserEmojiPermission.query.options(
+            joinedload(UserEmojiPermission.user), joinedload(UserEmojiPermission.emoji)
+        )
+        .order_by(UserEmojiPermission.created_at.desc())
+        .all()
+    )
     accessories = Accessory.query.order_by(Accessory.created_at.desc()).all()
-    accessory_permissions = UserAccessoryPermission.query.order_by(
-        UserAccessoryPermission.created_at.desc()
-    ).all()
+    accessory_permissions = (
+        UserAccessoryPermission.query.options(
+            joinedload(UserAccessoryPermission.user), joinedload(UserAccessoryPermission.accessory)
+        )
+        .order_by(UserAccessoryPermission.created_at.desc())
+        .all()
+    )
+    jobs_enabled = current_app.config["JOBS_ENABLED"]
     return render_template(
         "admin.html",
         stats=stats,
@@ -730,6 +903,10 @@ def admin():
         accessories=accessories,
         accessory_permissions=accessory_permissions,
         users=users,
+        jobs_enabled=jobs_enabled,
+        job_names=sorted(JOB_REGISTRY),
+        jobs=recent_jobs() if jobs_enabled else [],
+        job_leader=current_leader() if jobs_enabled else None,
     )
 
 
@@ -0,0 +1,194 @@
+"""Schema provisioning and the cached schema-version check.
+
+``provision_schema`` creates tables, applies the in-place column upgrades and
+seeds the default channel; ``flask kjb init`` runs it once per deploy. Worker
+startup only compares the stored version with ``SCHEMA_VERSION`` (one query,
+remembered per database for the life of the process). Bump ``SCHEMA_VERSION``
+whenever an upgrade step is added below.
+"""
+from flask import current_app
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from .extensions import db
+from .models import Channel, Message, MessageArchive, SchemaVersion
+from .search import backfill_search_index, ensure_search_index
+
+
+SCHEMA_VERSION = 10
+
+_verified_databases = set()
+
+
+def _upgrade_columns(inspector):
+    emoji_columns = {column["name"] for column in inspector.get_columns("emojis")}
+    if "is_public" not in emoji_columns:
+        db.session.execute(
+            text("ALTER TABLE emojis ADD COLUMN is_public BOOLEAN NOT NULL DEFAULT 0")
+        )
+        db.session.commit()
+    message_columns = {column["name"] for column in inspector.get_columns("messages")}
+    if "client_id" not in message_columns:
+        db.session.execute(text("ALTER TABLE messages ADD COLUMN client_id VARCHAR(64)"))
+        db.session.execute(
+            text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_message_user_client "
+                "ON messages (user_id, client_id)"
+            )
+        )
+        db.session.commit()
+    kc_log_columns = {column["name"] for column in inspector.get_columns("kc_logs")}
+    if "transfer_id" not in kc_log_columns:
+        db.session.execute(text("ALTER TABLE kc_logs ADD COLUMN transfer_id VARCHAR(32)"))
+        db.session.execute(text("ALTER TABLE kc_logs ADD COLUMN counterparty_id INTEGER"))
+        db.session.execute(
+            text("CREATE INDEX IF NOT EXISTS ix_kc_logs_transfer_id ON kc_logs (transfer_id)")
+        )
+        db.session.commit()
+    shop_request_columns = {column["name"] for column in inspector.get_columns("shop_requests")}
+    if "reserved" not in shop_request_columns:
+        db.session.execute(
+            text("ALTER TABLE shop_requests ADD COLUMN reserved BOOLEAN NOT NULL DEFAULT 0")
+        )
+        db.session.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_shop_requests_status_id "
+                "ON shop_requests (status, id)"
+            )
+        )
+        db.session.commit()
+    user_columns = {column["name"] for column in inspector.get_columns("users")}
+    if "follower_count" not in user_columns:
+        db.session.execute(
+            text("ALTER TABLE users ADD COLUMN follower_count INTEGER NOT NULL DEFAULT 0")
+        )
+        db.session.execute(
+            text("ALTER TABLE users ADD COLUMN following_count INTEGER NOT NULL DEFAULT 0")
+        )
+        db.session.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_follows_followed_follower "
+                "ON follows (followed_id, follower_id)"
+            )
+        )
+        db.session.execute(
+            text(
+                "UPDATE users SET "
+                "follower_count = (SELECT COUNT(*) FROM follows WHERE followed_id = users.id), "
+                "following_count = (SELECT COUNT(*) FROM follows WHERE follower_id = users.id)"
+            )
+        )
+        db.session.commit()
+    channel_columns = {column["name"] for column in inspector.get_columns("channels")}
+    if "slow_mode_seconds" not in channel_columns:
+        db.session.execute(
+            text("ALTER TABLE channels ADD COLUMN slow_mode_seconds INTEGER NOT NULL DEFAULT 0")
+        )
+        db.session.commit()
+
+
+def _rebuild_messages_table():
+    """Recreate ``messages`` from the model (SQLite cannot add AUTOINCREMENT in place)."""
+    messages = Message.__table__
+    dialect = db.engine.dialect
+    create = str(CreateTable(messages).compile(dialect=dialect)).replace(
+        "CREATE TABLE messages ", "CREATE TABLE messages_rebuild ", 1
+    )
+    columns = ", ".join(column.name for column in messages.columns)
+    db.session.execute(text("DROP TABLE IF EXISTS messages_rebuild"))
+    db.session.execute(text(create))
+    db.session.execute(
+        text(f"INSERT INTO messages_rebuild ({columns}) SELECT {columns} FROM messages")
+    )
+    db.session.execute(text("DROP TABLE messages"))
+    db.session.execute(text("ALTER TABLE messages_rebuild RENAME TO messages"))
+    for index in messages.indexes:
+        db.session.execute(text(str(CreateIndex(index).compile(dialect=dialect))))
+    db.session.commit()
+
+
+def _upgrade_message_ids():
+    """Keep SQLite message ids unique across the hot and archive tiers.
+
+    Without AUTOINCREMENT SQLite numbers a new row after the largest id left in
+    ``messages``, so ids of archived or deleted rows came back once the hot
+    table emptied. The sequence is also raised to the archive's largest id,
+    which matters for a fresh main database next to an existing archive file.
+    """
+    if db.engine.dialect.name != "sqlite":
+        return
+    create = db.session.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")
+    ).scalar()
+    if "AUTOINCREMENT" not in create.upper():
+        _rebuild_messages_table()
+    floor = max(
+        db.session.execute(select(func.max(Message.id))).scalar() or 0,
+        db.session.execute(select(func.max(MessageArchive.id))).scalar() or 0,
+    )
+    sequence = db.session.execute(
+        text("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")
+    ).scalar()
+    if (sequence or 0) < floor:
+        db.session.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+        db.session.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"),
+            {"seq": floor},
+        )
+        db.session.commit()
+
+
+def current_schema_version():
+    """The stored schema version, or 0 for a database that was never provisioned."""
+    try:
+        version = db.session.execute(select(SchemaVersion.version).limit(1)).scalar()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return 0
+    return version or 0
+
+
+def provision_schema():
+    """Bring the database up to ``SCHEMA_VERSION``; safe to run repeatedly."""
+    db.create_all()
+    _upgrade_columns(inspect(db.engine))
+    _upgrade_message_ids()
+    if ensure_search_index():
+        indexed = backfill_search_index()
+        if indexed:
+            current_app.logger.info("Indexed %d existing message(s) for search", indexed)
+    if not Channel.query.first():
+        db.session.add(Channel(slug="general", name="# general", description="기본 채널"))
+    state = db.session.get(SchemaVersion, 1)
+    if state is None:
+        db.session.add(SchemaVersion(id=1, version=SCHEMA_VERSION))
+    elif state.version < SCHEMA_VERSION:
+        state.version = SCHEMA_VERSION
+    db.session.commit()
+    _verified_databases.add(db.engine.url.render_as_string())
+    return SCHEMA_VERSION
+
+
+def ensure_schema(provision=False):
+    """Check the schema version once per process and database.
+
+    An outdated schema is provisioned when ``provision`` is set, otherwise a
+    warning asks for ``flask kjb init``. Returns True when the schema is current.
+    """
+    key = db.engine.url.render_as_string()
+    if key in _verified_databases:
+        return True
+    version = current_schema_version()
+    if version >= SCHEMA_VERSION:
+        _verified_databases.add(key)
+        return True
+    if provision:
+        provision_schema()
+        return True
+    current_app.logger.warning(
+        "Database schema is at version %s, expected %s; run `flask kjb init`.",
+        version,
+        SCHEMA_VERSION,
+    )
+    return False
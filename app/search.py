@@ -0,0 +1,164 @@
+"""Full-text message search backed by an SQLite FTS5 index."""
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from .extensions import db
+from .models import Message, MessageArchive
+
+
+SEARCH_TABLE = "message_search"
+SEARCH_PAGE_SIZE = 20
+REINDEX_BATCH_SIZE = 1000
+MAX_QUERY_TERMS = 8
+
+_search_state = {"available": None}
+
+
+def search_available():
+    if _search_state["available"] is None:
+        _search_state["available"] = db.engine.dialect.name == "sqlite"
+    return _search_state["available"]
+
+
+def ensure_search_index():
+    """Create the FTS5 table. Returns False when the database cannot host it."""
+    if not search_available():
+        return False
+    try:
+        db.session.execute(
+            text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "content, channel_id UNINDEXED, user_id UNINDEXED, tokenize='unicode61')"
+            )
+        )
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+        _search_state["available"] = False
+        return False
+    return True
+
+
+def index_message(message):
+    """Add or replace ``message`` in the index inside the caller's transaction."""
+    if not search_available() or message.id is None:
+        return
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": message.id})
+    if message.is_deleted:
+        return
+    db.session.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, content, channel_id, user_id) "
+            "VALUES (:id, :content, :channel_id, :user_id)"
+        ),
+        {
+            "id": message.id,
+            "content": message.content,
+            "channel_id": message.channel_id,
+            "user_id": message.user_id,
+        },
+    )
+
+
+def index_rows(rows):
+    """Bulk-add message dicts (``id``, ``content``, ``channel_id``, ``user_id``) to the index."""
+    if not search_available() or not rows:
+        return
+    db.session.execute(
+        text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, content, channel_id, user_id) "
+            "VALUES (:id, :content, :channel_id, :user_id)"
+        ),
+        [
+            {key: row[key] for key in ("id", "content", "channel_id", "user_id")}
+            for row in rows
+        ],
+    )
+
+
+def remove_message(message_id):
+    if not search_available() or not message_id:
+        return
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": message_id})
+
+
+def remove_messages_by(channel_id=None, user_id=None):
+    """Drop index rows for a deleted channel or user (bulk deletes skip index_message)."""
+    if not search_available():
+        return
+    if channel_id is not None:
+        db.session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE channel_id = :channel_id"),
+            {"channel_id": channel_id},
+        )
+    if user_id is not None:
+        db.session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE user_id = :user_id"), {"user_id": user_id}
+        )
+
+
+def build_match_query(raw_query):
+    """Turn free text into an FTS5 expression of quoted prefix terms (AND-ed)."""
+    terms = [term for term in (raw_query or "").split() if term][:MAX_QUERY_TERMS]
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def search_message_ids(raw_query, channel_ids, before_id=None, limit=SEARCH_PAGE_SIZE):
+    """Return up to ``limit`` matching message ids (newest first) and whether more exist."""
+    match = build_match_query(raw_query)
+    channel_ids = list(channel_ids)
+    if not match or not channel_ids or not search_available():
+        return [], False
+    channel_params = {f"c{index}": channel_id for index, channel_id in enumerate(channel_ids)}
+    channel_clause = ", ".join(f":{name}" for name in channel_params)
+    before_clause = "AND rowid < :before_id" if before_id else ""
+    rows = db.session.execute(
+        text(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match "
+            f"AND channel_id IN ({channel_clause}) {before_clause} "
+            "ORDER BY rowid DESC LIMIT :limit"
+        ),
+        {"match": match, "before_id": before_id, "limit": limit + 1, **channel_params},
+    ).all()
+    ids = [row[0] for row in rows]
+    return ids[:limit], len(ids) > limit
+
+
+def backfill_search_index():
+    """Rebuild an empty index when there are messages to search; returns the indexed count.
+
+    Upgraded databases get the FTS table next to existing history, which the
+    per-message hooks never indexed.
+    """
+    if not search_available():
+        return 0
+    if db.session.execute(text(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 1")).first():
+        return 0
+    for table in (Message.__table__, MessageArchive.__table__):
+        if db.session.execute(select(table.c.id).where(table.c.is_deleted.is_(False)).limit(1)).first():
+            return rebuild_search_index()
+    return 0
+
+
+def rebuild_search_index(batch_size=REINDEX_BATCH_SIZE):
+    """Rebuild the index from both message tiers in id-ordered batches."""
+    if not ensure_search_index():
+        return 0
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    indexed = 0
+    for table in (MessageArchive.__table__, Message.__table__):
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, table.c.content, table.c.channel_id, table.c.user_id)
+                .where(table.c.id > last_id, table.c.is_deleted.is_(False))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            index_rows([row._asdict() for row in rows])
+            indexed += len(rows)
+            last_id = rows[-1][0]
+    db.session.commit()
+    return indexed
@@ -0,0 +1,150 @@
+"""Shop purchase queue: atomic stock reservation and FIFO approval."""
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .extensions import db
+from .ledger import InsufficientKCError, apply_kc_delta
+from .models import Notification, ShopItem, ShopRequest
+from .utils import notify
+
+
+AUTO_APPROVE_BATCH_SIZE = 100
+
+
+def reserve_stock(item_id):
+    """Take one unit of a limited item; returns False when it is sold out.
+
+    Unlimited items (``quantity`` is NULL) always succeed without a write.
+    """
+    items = ShopItem.__table__
+    result = db.session.execute(
+        update(items)
+        .where(items.c.id == item_id, items.c.quantity.isnot(None), items.c.quantity > 0)
+        .values(quantity=items.c.quantity - 1)
+    )
+    if result.rowcount:
+        return True
+    quantity = db.session.query(ShopItem.quantity).filter(ShopItem.id == item_id).scalar()
+    return quantity is None
+
+
+def release_stock(item_id):
+    items = ShopItem.__table__
+    db.session.execute(
+        update(items)
+        .where(items.c.id == item_id, items.c.quantity.isnot(None))
+        .values(quantity=items.c.quantity + 1)
+    )
+
+
+def place_request(user_id, item):
+    """Queue a purchase with its unit reserved; returns None when sold out."""
+    if not reserve_stock(item.id):
+        return None
+    request_entry = ShopRequest(user_id=user_id, item_id=item.id, reserved=item.quantity is not None)
+    db.session.add(request_entry)
+    notify(user_id, "상점", f"{item.name} 구매 요청을 접수했습니다.", db, Notification)
+    return request_entry
+
+
+def claim_request(shop_request):
+    """Move a pending request to ``processing``; False when someone else took it.
+
+    The conditional UPDATE is the lock: of two admins (or an admin and the
+    bulk approver) racing on one request only one sees a rowcount of 1, so
+    the buyer is charged and the stock released at most once. The claim
+    shares the caller's transaction and is replaced by the final status
+    before commit.
+    """
+    requests = ShopRequest.__table__
+    result = db.session.execute(
+        update(requests)
+        .where(requests.c.id == shop_request.id, requests.c.status == "pending")
+        .values(status="processing")
+    )
+    if result.rowcount != 1:
+        return False
+    set_committed_value(shop_request, "status", "processing")
+    return True
+
+
+def deny_request(shop_request, item, message):
+    shop_request.status = "denied"
+    shop_request.processed_at = datetime.utcnow()
+    if shop_request.reserved:
+        release_stock(item.id)
+        shop_request.reserved = False
+    notify(shop_request.user_id, "상점", message, db, Notification)
+
+
+def approve_request(shop_request, item):
+    """Charge the buyer through the ledger; returns the final status.
+
+    Returns None without touching the request when it is no longer pending.
+    """
+    if not claim_request(shop_request):
+        return None
+    if not shop_request.reserved and item.quantity is not None:
+        # Requests queued before reservations existed take their unit now.
+        if not reserve_stock(item.id):
+            deny_request(shop_request, item, f"품절로 {item.name} 구매가 거절되었습니다.")
+            return shop_request.status
+        shop_request.reserved = True
+    try:
+        apply_kc_delta(shop_request.user_id, -item.kc_cost, "상점 구매", min_balance=0)
+    except InsufficientKCError:
+        deny_request(shop_request, item, f"KC 부족으로 {item.name} 구매가 거절되었습니다.")
+        return shop_request.status
+    shop_request.status = "approved"
+    shop_request.processed_at = datetime.utcnow()
+    notify(shop_request.user_id, "상점", f"{item.name} 구매가 승인되었습니다.", db, Notification)
+    return shop_request.status
+
+
+def pending_queue(limit=None):
+    query = ShopRequest.query.filter_by(status="pending").order_by(ShopRequest.id.asc())
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def process_pending_requests(batch_size=AUTO_APPROVE_BATCH_SIZE, max_batches=None):
+    """Approve pending requests oldest-first, committing every ``batch_size``.
+
+    Returns ``{"approved": n, "denied": n}``.
+    """
+    counts = {"approved": 0, "denied": 0}
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        requests = (
+            ShopRequest.query.filter(ShopRequest.status == "pending", ShopRequest.id > last_id)
+            .order_by(ShopRequest.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not requests:
+            break
+        items = {
+            item.id: item
+            for item in ShopItem.query.filter(
+                ShopItem.id.in_({request.item_id for request in requests})
+            )
+        }
+        for shop_request in requests:
+            item = items.get(shop_request.item_id)
+            if item is None:
+                if claim_request(shop_request):
+                    shop_request.status = "denied"
+                    shop_request.processed_at = datetime.utcnow()
+                    counts["denied"] += 1
+                continue
+            status = approve_request(shop_request, item)
+            if status is not None:
+                counts[status] += 1
+        last_id = requests[-1].id
+        db.session.commit()
+        batches += 1
+    return counts
@@ -1,27 +1,50 @@
+import time
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 
-from flask import session
+from flask import current_app, session
 from flask_socketio import emit, join_room, leave_room
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 
+from .archive import archived_message, mark_archived_deleted, on_archive, update_archived_content
 from .extensions import db
+from .metrics import instrumented_on
 from .models import (
+    Accessory,
     Channel,
     Emoji,
     KCLog,
     Message,
+    MessageArchive,
     Notification,
     User,
     UserAccessoryPermission,
-    UserChannelRead,
     UserEmojiPermission,
 )
-from .utils import adjust_kc, media_url, render_chat_content, resolve_channel_permissions, to_kst
+from .push import push_unread_update, user_room
+from .rate_limit import check_rate_limit
+from .read_state import record_read
+from .search import index_message, index_rows, remove_message
+from .utils import (
+    adjust_kc,
+    media_url,
+    parse_int,
+    render_chat_content,
+    resolve_channel_permissions,
+    to_kst,
+)
 
 online_users = set()
 channel_typing_users = {}
 connected_user_profiles = {}
 public_emoji_cache = {"expires_at": None, "map": {}}
+recent_send_acks = OrderedDict()
+SERVER_EPOCH = uuid.uuid4().hex[:12]
+channel_event_seq = {}
+channel_event_logs = {}
 
 
 def _current_user():
@@ -31,17 +54,73 @@ def _current_user():
     return User.query.get(user_id)
 
 
-def _mark_channel_read(user_id, channel_id, message_id):
-    if not user_id or not channel_id or not message_id:
-        return
-    state = UserChannelRead.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-    if not state:
-        db.session.add(
-            UserChannelRead(user_id=user_id, channel_id=channel_id, last_read_message_id=message_id)
-        )
-        return
-    if state.last_read_message_id < message_id:
-        state.last_read_message_id = message_id
+def _normalize_client_id(value):
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value or len(value) > 64:
+        return None
+    return value
+
+
+def _recent_send_ack(user_id, client_id):
+    now = time.monotonic()
+    while recent_send_acks:
+        oldest_key, (_, expires_at) = next(iter(recent_send_acks.items()))
+        if expires_at > now:
+            break
+        recent_send_acks.pop(oldest_key, None)
+    entry = recent_send_acks.get((user_id, client_id))
+    return entry[0] if entry else None
+
+
+def _remember_send_ack(user_id, client_id, ack):
+    config = current_app.config
+    recent_send_acks[(user_id, client_id)] = (ack, time.monotonic() + config["SEND_DEDUPE_WINDOW"])
+    recent_send_acks.move_to_end((user_id, client_id))
+    while len(recent_send_acks) > config["SEND_DEDUPE_MAX_ENTRIES"]:
+        recent_send_acks.popitem(last=False)
+
+
+def channel_event_state(channel_id):
+    return {"epoch": SERVER_EPOCH, "seq": channel_event_seq.get(channel_id, 0)}
+
+
+def _broadcast_channel_event(channel_id, channel_slug, event, payload):
+    seq = channel_event_seq.get(channel_id, 0) + 1
+    channel_event_seq[channel_id] = seq
+    payload = dict(payload, channel_id=channel_id, seq=seq, epoch=SERVER_EPOCH)
+    log = channel_event_logs.get(channel_id)
+    if log is None:
+        log = deque(maxlen=current_app.config["RESUME_BUFFER_SIZE"])
+        channel_event_logs[channel_id] = log
+    log.append((seq, event, payload))
+    emit(event, payload, room=channel_slug)
+
+
+def _replay_channel_events(channel, epoch, last_seq, last_message_id):
+    """Re-send events a reconnecting client missed; returns the replayed count or None on overflow."""
+    current_seq = channel_event_seq.get(channel.id, 0)
+    log = channel_event_logs.get(channel.id)
+    if epoch == SERVER_EPOCH and last_seq is not None:
+        if last_seq >= current_seq:
+            return 0
+        if log and log[0][0] <= last_seq + 1:
+            missed = [(event, payload) for seq, event, payload in log if seq > last_seq]
+            for event, payload in missed:
+                emit(event, payload)
+            return len(missed)
+    if not last_message_id:
+        return 0
+    limit = current_app.config["RESUME_MAX_MESSAGES"]
+    messages = query_serialized_messages(
+        Message.channel_id == channel.id, Message.id > last_message_id, limit=limit + 1
+    )
+    if len(messages) > limit:
+        return None
+    for payload in messages:
+        emit("new_message", dict(payload, seq=current_seq, epoch=SERVER_EPOCH))
+    return len(messages)
 
 
 def _emit_typing_update(channel_slug):
@@ -85,88 +164,134 @@ def _active_accessory_map(user_ids):
     return result
 
 
-def _emoji_scope_map(messages):
+def _message_row_select(messages):
+    authors = User.__table__
+    replies = Message.__table__.alias("reply_messages")
+    archived_replies = MessageArchive.__table__.alias("archived_reply_messages")
+    permissions = UserAccessoryPermission.__table__
+    accessories = Accessory.__table__
+    active_permissions = (
+        select(permissions.c.user_id, func.max(permissions.c.id).label("permission_id"))
+        .where(permissions.c.is_active.is_(True))
+        .group_by(permissions.c.user_id)
+        .subquery("active_permissions")
+    )
+    return (
+        select(
+            messages.c.id,
+            messages.c.channel_id,
+            messages.c.user_id,
+            messages.c.content,
+            messages.c.is_deleted,
+            messages.c.created_at,
+            messages.c.updated_at,
+            authors.c.name.label("user_name"),
+            authors.c.email_prefix.label("user_prefix"),
+            authors.c.avatar_url,
+            func.coalesce(replies.c.content, archived_replies.c.content).label("reply_content"),
+            accessories.c.text_color.label("accessory_color"),
+            accessories.c.image_url.label("accessory_image"),
+        )
+        .join(authors, authors.c.id == messages.c.user_id)
+        .outerjoin(replies, replies.c.id == messages.c.reply_to_id)
+        .outerjoin(archived_replies, archived_replies.c.id == messages.c.reply_to_id)
+        .outerjoin(active_permissions, active_permissions.c.user_id == messages.c.user_id)
+        .outerjoin(permissions, permissions.c.id == active_permissions.c.permission_id)
+        .outerjoin(accessories, accessories.c.id == permissions.c.accessory_id)
+    )
+
+
+def _emoji_scope_map_for_users(user_ids):
     base_emoji_map = _public_emoji_map()
-    user_ids = {message.user_id for message in messages}
     if not user_ids:
         return base_emoji_map, {}
-    users = User.query.options(
-        joinedload(User.emoji_permissions).joinedload(UserEmojiPermission.emoji)
-    ).filter(User.id.in_(user_ids))
+    rows = db.session.execute(
+        select(UserEmojiPermission.user_id, Emoji.name, Emoji.image_url)
+        .join(Emoji, Emoji.id == UserEmojiPermission.emoji_id)
+        .where(UserEmojiPermission.user_id.in_(user_ids))
+    ).all()
     per_user_map = {}
-    for user in users:
-        scoped = dict(base_emoji_map)
-        scoped.update(
-            {
-                permission.emoji.name: permission.emoji.image_url
-                for permission in user.emoji_permissions
-                if permission.emoji
-            }
-        )
-        per_user_map[user.id] = scoped
+    for user_id, name, image_url in rows:
+        scoped = per_user_map.get(user_id)
+        if scoped is None:
+            scoped = per_user_map[user_id] = dict(base_emoji_map)
+        scoped[name] = image_url
     return base_emoji_map, per_user_map
 
 
-def _serialize_message_with_context(message, emoji_map, active_accessory):
-    created_at = to_kst(message.created_at)
-    updated_at = to_kst(message.updated_at) if message.updated_at else None
+def _serialize_message_row(row, emoji_map):
+    created_at = to_kst(row.created_at)
+    updated_at = to_kst(row.updated_at) if row.updated_at else None
     return {
-        "id": message.id,
-        "channel_id": message.channel_id,
-        "user_id": message.user_id,
-        "user_name": message.user.name,
-        "user_prefix": message.user.email_prefix,
-        "avatar": media_url(message.user.avatar_url),
-        "content": message.content,
-        "rendered_content": str(render_chat_content(message.content, emoji_map)),
-        "reply_to": message.reply_to.content if message.reply_to else None,
-        "is_deleted": message.is_deleted,
-        "name_color": (
-            active_accessory.accessory.text_color if active_accessory and active_accessory.accessory else None
-        ),
+        "id": row.id,
+        "channel_id": row.channel_id,
+        "user_id": row.user_id,
+        "user_name": row.user_name,
+        "user_prefix": row.user_prefix,
+        "avatar": media_url(row.avatar_url, "avatar64"),
+        "content": row.content,
+        "rendered_content": str(render_chat_content(row.content, emoji_map)),
+        "reply_to": row.reply_content,
+        "is_deleted": row.is_deleted,
+        "name_color": row.accessory_color,
         "accessory_image": (
-            media_url(active_accessory.accessory.image_url)
-            if active_accessory and active_accessory.accessory
-            else None
+            media_url(row.accessory_image, "accessory32") if row.accessory_image else None
         ),
         "created_at": created_at.strftime("%Y-%m-%d %H:%M"),
         "updated_at": updated_at.strftime("%Y-%m-%d %H:%M") if updated_at else None,
     }
 
 
-def serialize_messages(messages):
-    if not messages:
+def _query_message_rows(messages, criterion, newest_first, limit):
+    stmt = _message_row_select(messages).where(criterion).order_by(
+        messages.c.id.desc() if newest_first else messages.c.id.asc()
+    )
+    if limit:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def query_serialized_messages(*criteria, newest_first=False, limit=None, include_archive=False):
+    """Serialize messages matching ``criteria`` from plain row tuples.
+
+    One joined query fetches message, author, reply preview and active
+    accessory columns; a second resolves per-author emoji scopes. Nothing is
+    added to the session's identity map. ``criteria`` use ``Message`` columns;
+    with ``include_archive`` they are also run against the cold tier when the
+    hot one cannot answer alone (see :mod:`.archive`).
+    """
+    criterion = and_(*criteria)
+    rows = _query_message_rows(Message.__table__, criterion, newest_first, limit)
+    # Archived ids are all older than hot ones, so a full newest-first page is complete.
+    if include_archive and not (newest_first and limit and len(rows) >= limit):
+        archived = _query_message_rows(
+            MessageArchive.__table__, on_archive(criterion), newest_first, limit
+        )
+        if archived:
+            rows = sorted(rows + archived, key=lambda row: row.id, reverse=newest_first)[:limit]
+    if not rows:
         return []
-    user_ids = {message.user_id for message in messages}
-    accessory_map = _active_accessory_map(user_ids)
-    base_emoji_map, per_user_emoji = _emoji_scope_map(messages)
+    base_emoji_map, per_user_emoji = _emoji_scope_map_for_users({row.user_id for row in rows})
     return [
-        _serialize_message_with_context(
-            message,
-            per_user_emoji.get(message.user_id, base_emoji_map),
-            accessory_map.get(message.user_id),
-        )
-        for message in messages
+        _serialize_message_row(row, per_user_emoji.get(row.user_id, base_emoji_map))
+        for row in rows
     ]
 
 
-def serialize_message(message):
-    return serialize_messages([message])[0]
-
-
-
 def register_socket_handlers(socketio):
-    @socketio.on("connect")
+    on = instrumented_on(socketio)
+
+    @on("connect")
     def handle_connect():
         user = _current_user()
         if not user:
             return False
         online_users.add(user.id)
         connected_user_profiles[user.id] = {"id": user.id, "name": user.name}
-        join_room(f"user_{user.id}")
+        join_room(user_room(user.id))
         emit("online_update", _online_payload(), broadcast=True)
 
-    @socketio.on("disconnect")
+    @on("disconnect")
     def handle_disconnect():
         user = _current_user()
         if user and user.id in online_users:
@@ -182,7 +307,7 @@ def register_socket_handlers(socketio):
                         channel_typing_users.pop(channel_slug, None)
                     _emit_typing_update(channel_slug)
 
-    @socketio.on("join")
+    @on("join")
     def handle_join(data):
         user = _current_user()
         if not user:
@@ -193,11 +318,23 @@ def register_socket_handlers(socketio):
         channel = Channel.query.filter_by(slug=channel_slug).first()
         if not channel:
             return
-        if not resolve_channel_permissions(user, channel)["can_view"]:
+        permissions = resolve_channel_permissions(user, channel)
+        if not permissions["can_view"]:
             return
         join_room(channel_slug)
-
-    @socketio.on("leave")
+        replayed = 0
+        if permissions["can_read"]:
+            replayed = _replay_channel_events(
+                channel,
+                data.get("epoch"),
+                parse_int(data.get("last_seq")),
+                parse_int(data.get("last_message_id")),
+            )
+            if replayed is None:
+                emit("resume_reset", {"channel": channel.slug, "channel_id": channel.id})
+        return dict(channel_event_state(channel.id), ok=True, replayed=replayed or 0)
+
+    @on("leave")
     def handle_leave(data):
         user = _current_user()
         channel_slug = data.get("channel")
@@ -212,35 +349,76 @@ def register_socket_handlers(socketio):
                     channel_typing_users.pop(channel_slug, None)
                 _emit_typing_update(channel_slug)
 
-    @socketio.on("send_message")
+    @on("send_message")
     def handle_send_message(data):
         user = _current_user()
         if not user:
             return {"ok": False, "error": "unauthorized"}
+        user_id = user.id
 
         channel_slug = data.get("channel")
         content = (data.get("content") or "").strip()
         reply_to_id = data.get("reply_to")
+        client_id = _normalize_client_id(data.get("client_id"))
         if not channel_slug or not content:
             return {"ok": False, "error": "invalid_request"}
+        if client_id:
+            cached_ack = _recent_send_ack(user_id, client_id)
+            if cached_ack:
+                return cached_ack
+            # A retry that missed this worker's cache (another worker, or
+            # evicted) is answered from the row before it can spend a token.
+            existing_id = (
+                db.session.query(Message.id).filter_by(user_id=user_id, client_id=client_id).scalar()
+            )
+            if existing_id:
+                ack = {"ok": True, "message_id": existing_id}
+                _remember_send_ack(user_id, client_id, ack)
+                return ack
 
         channel = Channel.query.filter_by(slug=channel_slug).first()
         if not channel:
             return {"ok": False, "error": "channel_not_found"}
         if not resolve_channel_permissions(user, channel)["can_send"]:
             return {"ok": False, "error": "permission_denied"}
-
-        message = Message(channel_id=channel.id, user_id=user.id, content=content, reply_to_id=reply_to_id)
+        limited = check_rate_limit("send_message", user, channel)
+        if limited:
+            return limited
+
+        channel_id = channel.id
+        message = Message(
+            channel_id=channel_id,
+            user_id=user_id,
+            content=content,
+            reply_to_id=reply_to_id,
+            client_id=client_id,
+        )
         db.session.add(message)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            existing = Message.query.filter_by(user_id=user_id, client_id=client_id).first()
+            if not client_id or not existing:
+                raise
+            ack = {"ok": True, "message_id": existing.id}
+            _remember_send_ack(user_id, client_id, ack)
+            return ack
+        index_message(message)
         adjust_kc(user, 1, "채팅 보상", db, KCLog, Notification)
-        _mark_channel_read(user.id, channel.id, message.id)
+        message_id = message.id
         db.session.commit()
+        record_read(user_id, channel_id, message_id)
+        push_unread_update(user_id, channel_id, message_id)
 
-        payload = serialize_message(message)
-        emit("new_message", payload, room=channel_slug)
-        return {"ok": True, "message_id": message.id}
+        payload = query_serialized_messages(Message.id == message_id)[0]
+        _broadcast_channel_event(channel_id, channel_slug, "new_message", payload)
+        ack = {"ok": True, "message_id": message_id}
+        if client_id:
+            _remember_send_ack(user_id, client_id, ack)
+        return ack
 
-    @socketio.on("typing")
+    @on("typing")
     def handle_typing(data):
         user = _current_user()
         if not user:
@@ -254,6 +432,11 @@ def register_socket_handlers(socketio):
             return
         if not resolve_channel_permissions(user, channel)["can_view"]:
             return
+        # Stopping is never limited so an indicator cannot get stuck on.
+        if is_typing:
+            limited = check_rate_limit("typing", user, channel)
+            if limited:
+                return limited
         typers = channel_typing_users.setdefault(channel_slug, set())
         if is_typing:
             typers.add(user.id)
@@ -263,7 +446,7 @@ def register_socket_handlers(socketio):
             channel_typing_users.pop(channel_slug, None)
         _emit_typing_update(channel_slug)
 
-    @socketio.on("edit_message")
+    @on("edit_message")
     def handle_edit_message(data):
         user = _current_user()
         if not user:
@@ -272,17 +455,25 @@ def register_socket_handlers(socketio):
         content = (data.get("content") or "").strip()
         if not message_id or not content:
             return
+        limited = check_rate_limit("edit_message", user)
+        if limited:
+            return limited
         message = Message.query.get(message_id)
-        if not message or message.is_deleted:
+        if not message:
+            _edit_archived_message(user, message_id, content)
             return
-        if message.user_id != user.id:
+        if message.is_deleted or message.user_id != user.id:
             return
         message.content = content
         message.updated_at = datetime.utcnow()
+        index_message(message)
+        message_id, channel_id = message.id, message.channel_id
+        channel_slug = _channel_slug(message)
         db.session.commit()
-        emit("message_updated", serialize_message(message), room=_channel_slug(message))
+        payload = query_serialized_messages(Message.id == message_id)[0]
+        _broadcast_channel_event(channel_id, channel_slug, "message_updated", payload)
 
-    @socketio.on("delete_message")
+    @on("delete_message")
     def handle_delete_message(data):
         user = _current_user()
         if not user:
@@ -290,13 +481,54 @@ def register_socket_handlers(socketio):
         message_id = data.get("message_id")
         message = Message.query.get(message_id)
         if not message:
+            _delete_archived_message(user, message_id)
             return
         if message.user_id != user.id and not user.is_admin:
             return
         message.is_deleted = True
         message.content = "[삭제됨]"
+        remove_message(message.id)
+        message_id, channel_id = message.id, message.channel_id
+        channel_slug = _channel_slug(message)
         db.session.commit()
-        emit("message_deleted", {"message_id": message.id}, room=_channel_slug(message))
+        _broadcast_channel_event(channel_id, channel_slug, "message_deleted", {"message_id": message_id})
+
+
+def _edit_archived_message(user, message_id, content):
+    archived = archived_message(message_id)
+    if not archived or archived.is_deleted or archived.user_id != user.id:
+        return
+    update_archived_content(archived.id, content)
+    remove_message(archived.id)
+    index_rows(
+        [
+            {
+                "id": archived.id,
+                "content": content,
+                "channel_id": archived.channel_id,
+                "user_id": archived.user_id,
+            }
+        ]
+    )
+    channel = db.session.get(Channel, archived.channel_id)
+    db.session.commit()
+    if channel:
+        payload = query_serialized_messages(Message.id == archived.id, include_archive=True)[0]
+        _broadcast_channel_event(channel.id, channel.slug, "message_updated", payload)
+
+
+def _delete_archived_message(user, message_id):
+    archived = archived_message(message_id) if message_id else None
+    if not archived or archived.is_deleted:
+        return
+    if archived.user_id != user.id and not user.is_admin:
+        return
+    mark_archived_deleted(archived.id, "[삭제됨]")
+    remove_message(archived.id)
+    channel = db.session.get(Channel, archived.channel_id)
+    db.session.commit()
+    if channel:
+        _broadcast_channel_event(channel.id, channel.slug, "message_deleted", {"message_id": archived.id})
 
 
 def _online_payload():
@@ -310,14 +542,14 @@ def _online_payload():
                 "id": user.id,
                 "name": user.name,
                 "email_prefix": user.email_prefix,
-                "avatar": media_url(user.avatar_url),
+                "avatar": media_url(user.avatar_url, "avatar64"),
                 "name_color": (
                     active_accessory.accessory.text_color
                     if active_accessory and active_accessory.accessory
                     else None
                 ),
                 "accessory_image": (
-                    media_url(active_accessory.accessory.image_url)
+                    media_url(active_accessory.accessory.image_url, "accessory32")
                     if active_accessory and active_accessory.accessory
                     else None
                 ),
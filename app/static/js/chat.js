@@ -23,13 +23,38 @@ let contextUserId = null;
 let typing = false;
 let typingTimer = null;
 let readTimer = null;
-let latestReadMessageId = null;
-let lastFlushedReadMessageId = null;
+let readTimerStartedAt = null;
+const pendingReads = new Map();
+const flushedReads = new Map();
+const READ_FLUSH_DELAY = 1500;
+const READ_FLUSH_MAX_WAIT = 5000;
 let sendInFlight = false;
 let isSocketConnected = false;
 
 const channelItems = Array.from(document.querySelectorAll('[data-channel-slug][data-channel-id]'));
-const joinedChannelSlugs = new Set(channelItems.map((item) => item.dataset.channelSlug).filter(Boolean));
+const joinedChannels = new Map(
+  channelItems
+    .filter((item) => item.dataset.channelSlug)
+    .map((item) => [item.dataset.channelSlug, parseInt(item.dataset.channelId, 10)]),
+);
+const resumeState = new Map();
+resumeState.set(channelId, {
+  epoch: chatMain.dataset.eventEpoch,
+  seq: parseInt(chatMain.dataset.eventSeq, 10) || 0,
+  messageId: 0,
+});
+
+function trackResumeState(payload, messageId = 0) {
+  if (!payload || !payload.channel_id) return;
+  const state = resumeState.get(payload.channel_id) || { epoch: null, seq: 0, messageId: 0 };
+  if (payload.epoch && payload.epoch !== state.epoch) {
+    state.epoch = payload.epoch;
+    state.seq = 0;
+  }
+  state.seq = Math.max(state.seq, payload.seq || 0);
+  state.messageId = Math.max(state.messageId, messageId || 0);
+  resumeState.set(payload.channel_id, state);
+}
 
 function refreshSendButtonState() {
   if (!sendButton) return;
@@ -60,28 +85,47 @@ function setUnreadDot(targetChannelId, isUnread) {
 }
 
 function flushReadState() {
-  if (!latestReadMessageId || latestReadMessageId === lastFlushedReadMessageId) return;
-  const body = new URLSearchParams({ channel, message_id: latestReadMessageId.toString() });
+  if (readTimer) {
+    clearTimeout(readTimer);
+    readTimer = null;
+  }
+  readTimerStartedAt = null;
+  if (!pendingReads.size) return;
+  const reads = Array.from(pendingReads, ([readChannelId, messageId]) => ({
+    channel_id: readChannelId,
+    message_id: messageId,
+  }));
+  pendingReads.clear();
   fetch('/chat/read', {
     method: 'POST',
-    headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-    body: body.toString(),
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ reads }),
     keepalive: true,
   })
     .then(() => {
-      lastFlushedReadMessageId = latestReadMessageId;
-      setUnreadDot(channelId, false);
+      reads.forEach((read) => {
+        flushedReads.set(read.channel_id, Math.max(flushedReads.get(read.channel_id) || 0, read.message_id));
+        setUnreadDot(read.channel_id, false);
+      });
     })
-    .catch(() => {});
+    .catch(() => {
+      reads.forEach((read) => queueMarkChannelRead(read.message_id, read.channel_id));
+    });
 }
 
-function queueMarkChannelRead(messageId) {
-  if (!messageId) return;
-  latestReadMessageId = Math.max(latestReadMessageId || 0, messageId);
+function queueMarkChannelRead(messageId, readChannelId = channelId) {
+  if (!messageId || !readChannelId) return;
+  if ((flushedReads.get(readChannelId) || 0) >= messageId) return;
+  pendingReads.set(readChannelId, Math.max(pendingReads.get(readChannelId) || 0, messageId));
+  const now = Date.now();
+  if (!readTimerStartedAt) {
+    readTimerStartedAt = now;
+  }
   if (readTimer) {
     clearTimeout(readTimer);
   }
-  readTimer = setTimeout(flushReadState, 400);
+  const delay = Math.min(READ_FLUSH_DELAY, Math.max(0, readTimerStartedAt + READ_FLUSH_MAX_WAIT - now));
+  readTimer = setTimeout(flushReadState, delay);
 }
 
 function updateTypingState(nextState) {
@@ -150,12 +194,30 @@ function updateOnlineList(users) {
 
 socket.on('connect', () => {
   isSocketConnected = true;
-  joinedChannelSlugs.forEach((slug) => {
-    socket.emit('join', { channel: slug });
+  joinedChannels.forEach((joinedChannelId, slug) => {
+    const state = resumeState.get(joinedChannelId) || {};
+    socket.emit(
+      'join',
+      { channel: slug, epoch: state.epoch, last_seq: state.seq, last_message_id: state.messageId },
+      (response) => {
+        if (response && response.ok) {
+          trackResumeState({ channel_id: joinedChannelId, epoch: response.epoch, seq: response.seq });
+        }
+      },
+    );
   });
   refreshSendButtonState();
 });
 
+socket.on('resume_reset', (payload) => {
+  if (!payload) return;
+  if (payload.channel_id === channelId) {
+    window.location.reload();
+    return;
+  }
+  setUnreadDot(payload.channel_id, true);
+});
+
 socket.on('disconnect', () => {
   isSocketConnected = false;
   setSendingState(false);
@@ -167,6 +229,29 @@ socket.on('connect_error', () => {
   setSendingState(false);
 });
 
+let liveNotificationCount = 0;
+
+socket.on('notification', () => {
+  liveNotificationCount += 1;
+  document.querySelectorAll('[data-notification-badge]').forEach((badge) => {
+    badge.textContent = liveNotificationCount > 99 ? '99+' : liveNotificationCount.toString();
+    badge.classList.remove('hidden');
+  });
+});
+
+socket.on('kc_balance', (payload) => {
+  if (!payload || typeof payload.kc_points !== 'number') return;
+  document.querySelectorAll('[data-kc-balance]').forEach((balance) => {
+    balance.textContent = payload.kc_points.toString();
+  });
+});
+
+socket.on('unread_update', (payload) => {
+  if (!payload || !payload.channel_id) return;
+  flushedReads.set(payload.channel_id, Math.max(flushedReads.get(payload.channel_id) || 0, payload.last_read_message_id || 0));
+  setUnreadDot(payload.channel_id, Boolean(payload.unread));
+});
+
 socket.on('online_update', (users) => {
   updateOnlineList(users);
 });
@@ -185,14 +270,17 @@ socket.on('typing_update', (payload) => {
 });
 
 socket.on('new_message', (message) => {
+  trackResumeState(message, message.id);
   if (message.channel_id !== channelId) {
     setUnreadDot(message.channel_id, true);
     return;
   }
+  if (messageList.querySelector(`[data-message-id="${message.id}"]`)) return;
   appendMessage(message);
 });
 
 socket.on('message_updated', (message) => {
+  trackResumeState(message);
   const element = messageList.querySelector(`[data-message-id="${message.id}"]`);
   if (!element) return;
   element.querySelector('.message-content').textContent = message.content;
@@ -209,19 +297,32 @@ socket.on('message_updated', (message) => {
 });
 
 socket.on('message_deleted', (payload) => {
+  trackResumeState(payload);
   const element = messageList.querySelector(`[data-message-id="${payload.message_id}"]`);
   if (!element) return;
   element.querySelector('.message-content').textContent = '[삭제됨]';
 });
 
+function newClientId() {
+  if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
 function emitSendMessage(payload, hasRetried = false) {
   socket.timeout(12000).emit('send_message', payload, (err, response) => {
-    if ((err || !response || !response.ok) && !hasRetried && socket.connected) {
+    const rateLimited = response && response.error === 'rate_limited';
+    if ((err || !response || !response.ok) && !rateLimited && !hasRetried && socket.connected) {
       emitSendMessage(payload, true);
       return;
     }
 
     setSendingState(false);
+    if (rateLimited) {
+      alert(`너무 빠르게 보내고 있습니다. ${Math.ceil(response.retry_after)}초 후 다시 시도해주세요.`);
+      return;
+    }
     if (err || !response || !response.ok) {
       alert('메시지 전송이 지연되거나 실패했습니다. 네트워크 상태를 확인해주세요.');
       return;
@@ -241,7 +342,7 @@ sendButton.addEventListener('click', () => {
 
   const pendingReplyId = replyToId;
   setSendingState(true);
-  emitSendMessage({ channel, content, reply_to: pendingReplyId });
+  emitSendMessage({ channel, content, reply_to: pendingReplyId, client_id: newClientId() });
 });
 
 input.addEventListener('input', () => {
@@ -283,6 +384,12 @@ window.addEventListener('click', () => {
   contextMenu.classList.add('hidden');
 });
 
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'hidden') {
+    flushReadState();
+  }
+});
+
 window.addEventListener('beforeunload', () => {
   socket.emit('typing', { channel, is_typing: false });
   socket.emit('leave', { channel });
@@ -315,7 +422,9 @@ contextMenu.addEventListener('click', (event) => {
 
 const lastMessage = messageList.querySelector('.message:last-of-type');
 if (lastMessage) {
-  queueMarkChannelRead(parseInt(lastMessage.dataset.messageId, 10));
+  const lastMessageId = parseInt(lastMessage.dataset.messageId, 10);
+  trackResumeState({ channel_id: channelId }, lastMessageId);
+  queueMarkChannelRead(lastMessageId);
 }
 setUnreadDot(channelId, false);
 refreshSendButtonState();
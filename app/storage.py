@@ -0,0 +1,104 @@
+"""Content-addressed upload storage with deduplication and garbage collection."""
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from .models import Accessory, Emoji, ShopItem, User
+
+
+CHUNK_SIZE = 64 * 1024
+TEMP_DIRNAME = ".tmp"
+DERIVATIVE_PATTERN = re.compile(r"^(?P<stem>.+)\.[a-z]+[0-9]+\.[a-z0-9]+$")
+
+
+def content_path(digest, ext):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def store_stream(stream, upload_folder, ext):
+    """Stream ``stream`` to disk while hashing it; identical content is stored once.
+
+    Returns ``(relative_name, created)`` where ``created`` is False when the
+    content already existed.
+    """
+    temp_dir = os.path.join(upload_folder, TEMP_DIRNAME)
+    os.makedirs(temp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                handle.write(chunk)
+        name = content_path(digest.hexdigest(), ext)
+        target = os.path.join(upload_folder, name)
+        if os.path.exists(target):
+            os.utime(target)
+            return name, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+        return name, True
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def source_name(relative_name):
+    """Map a stored file (original or derivative) to the upload it belongs to."""
+    match = DERIVATIVE_PATTERN.match(os.path.basename(relative_name))
+    if not match:
+        return relative_name
+    directory = os.path.dirname(relative_name)
+    stem = match.group("stem")
+    return f"{directory}/{stem}" if directory else stem
+
+
+def _stem(name):
+    return name.rsplit(".", 1)[0]
+
+
+def referenced_uploads():
+    columns = [User.avatar_url, Emoji.image_url, Accessory.image_url, ShopItem.image_url]
+    names = set()
+    for column in columns:
+        for (value,) in column.class_.query.with_entities(column).distinct():
+            if value and not value.startswith(("http://", "https://", "/")):
+                names.add(value)
+    return names
+
+
+def collect_garbage(upload_folder, referenced, grace_seconds=3600, dry_run=False):
+    """Remove stored files that no row references any more.
+
+    Files younger than ``grace_seconds`` are kept so uploads whose row has not
+    been committed yet are not collected. Returns the removed relative names.
+    """
+    referenced_stems = {_stem(name) for name in referenced}
+    temp_dir = os.path.join(upload_folder, TEMP_DIRNAME)
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for root, _, files in os.walk(upload_folder, topdown=False):
+        for filename in files:
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, upload_folder).replace(os.sep, "/")
+            owner = source_name(relative)
+            if owner in referenced or (owner != relative and owner in referenced_stems):
+                continue
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(relative)
+        if dry_run or root in (upload_folder, temp_dir):
+            continue
+        if not os.listdir(root):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+    return removed
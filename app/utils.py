@@ -1,13 +1,15 @@
 from functools import wraps
 from datetime import timedelta, timezone
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
-import os
-import uuid
 import re
 from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename
 from flask import session, redirect, url_for, g, current_app
-from .models import User, ChannelPermission
+from .ledger import apply_kc_delta
+from .media import queue_derivatives, resolve_derivative
+from .models import User, Channel, ChannelPermission
+from .push import queue_user_push
+from .storage import store_stream
 
 
 EMOJI_PATTERN = re.compile(r":([a-zA-Z0-9_\-]+):")
@@ -65,12 +67,11 @@ def logout_user():
 def notify(user_id, title, body, db, Notification):
     notification = Notification(user_id=user_id, title=title, body=body)
     db.session.add(notification)
+    queue_user_push(user_id, "notification", {"title": title, "body": body})
 
 
-def adjust_kc(user, delta, reason, db, KCLog, Notification):
-    user.kc_points += delta
-    db.session.add(KCLog(user_id=user.id, delta=delta, reason=reason))
-    notify(user.id, "KC 변동", f"{reason} ({delta:+d} KC)", db, Notification)
+def adjust_kc(user, delta, reason, db, KCLog, Notification, min_balance=None):
+    return apply_kc_delta(user.id, delta, reason, min_balance=min_balance)
 
 
 _KST_TZ = None
@@ -101,25 +102,25 @@ def allowed_file(filename, allowed_extensions):
     return ext in allowed_extensions
 
 
-def save_upload(file_storage, upload_folder, allowed_extensions):
+def save_upload(file_storage, upload_folder, allowed_extensions, derivative_kind=None):
     if not file_storage or not file_storage.filename:
         return None
     filename = secure_filename(file_storage.filename)
     if not allowed_file(filename, allowed_extensions):
         return None
     ext = filename.rsplit(".", 1)[1].lower()
-    new_name = f"{uuid.uuid4().hex}.{ext}"
-    os.makedirs(upload_folder, exist_ok=True)
-    file_storage.save(os.path.join(upload_folder, new_name))
+    new_name, _ = store_stream(file_storage.stream, upload_folder, ext)
+    if derivative_kind:
+        queue_derivatives(upload_folder, new_name, derivative_kind)
     return new_name
 
 
-def media_url(value):
+def media_url(value, variant=None):
     if not value:
         return ""
     if value.startswith(("http://", "https://", "/")):
         return value
-    return f"/media/{value}"
+    return f"/media/{resolve_derivative(value, variant)}"
 
 
 def build_channel_permission_map(user, channels):
@@ -159,6 +160,27 @@ def build_channel_permission_map(user, channels):
     return permission_map
 
 
+def get_channel_listing():
+    """All channels in sidebar order plus the current user's permission map.
+
+    Resolved at most once per request and shared by views and templates.
+    """
+    if "channel_listing" not in g:
+        channels = Channel.query.order_by(Channel.priority.desc(), Channel.name.asc()).all()
+        g.channel_listing = (channels, build_channel_permission_map(get_current_user(), channels))
+    return g.channel_listing
+
+
+def get_visible_channels():
+    if "visible_channels" not in g:
+        user = get_current_user()
+        channels, permission_map = get_channel_listing()
+        if user and not user.is_admin:
+            channels = [channel for channel in channels if permission_map[channel.id]["can_view"]]
+        g.visible_channels = channels
+    return g.visible_channels
+
+
 def resolve_channel_permissions(user, channel):
     return build_channel_permission_map(user, [channel]).get(
         channel.id, {"can_view": False, "can_read": False, "can_send": False}
@@ -186,7 +208,7 @@ def render_chat_content(content, emoji_map):
         if emoji_url:
             parts.append(
                 Markup(
-                    f'<img class="inline-emoji" src="{escape(media_url(emoji_url))}" alt=":{escape(key)}:" title=":{escape(key)}:">'
+                    f'<img class="inline-emoji" src="{escape(media_url(emoji_url, "emoji80"))}" alt=":{escape(key)}:" title=":{escape(key)}:">'
                 )
             )
         else:
@@ -0,0 +1,133 @@
+"""Channel export/import throughput and memory benchmark.
+
+Seeds one channel with ``--messages`` messages (``--archived`` of them moved
+to the archive tier), exports it to .ndjson.gz and imports the file into a
+fresh database. Peak RSS growth is reported per phase; flat growth across
+sizes means the phase streams.
+
+Usage: python -m benchmarks.channel_transfer_bench [--messages 1000000] [--archived 0.5]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+WORDS = (
+    "안녕하세요 오늘 회의 자료 공유 드립니다 확인 부탁 점심 메뉴 추천 배포 완료 "
+    "hello deploy review merge ship lunch coffee meeting update thanks soon later"
+).split()
+SEED_CHUNK = 5000
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _seed(args, channel_id, user_ids, rng):
+    from app.extensions import db
+    from app.models import Message, MessageArchive
+
+    base = datetime(2024, 1, 1)
+    archived = int(args.messages * args.archived)
+    for start in range(0, args.messages, SEED_CHUNK):
+        rows = []
+        for offset in range(start, min(args.messages, start + SEED_CHUNK)):
+            rows.append(
+                {
+                    "id": offset + 1,
+                    "channel_id": channel_id,
+                    "user_id": rng.choice(user_ids),
+                    "content": " ".join(rng.choices(WORDS, k=rng.randint(3, 18))),
+                    "reply_to_id": rng.randint(1, offset) if offset and rng.random() < 0.1 else None,
+                    "is_deleted": rng.random() < 0.02,
+                    "created_at": base + timedelta(seconds=offset * 5),
+                }
+            )
+        head = [row for row in rows if row["id"] <= archived]
+        tail = [row for row in rows if row["id"] > archived]
+        if head:
+            db.session.execute(insert(MessageArchive), head)
+        if tail:
+            db.session.execute(insert(Message), tail)
+        db.session.commit()
+
+
+def _create_app(path):
+    from app import create_app
+    from config import Config
+
+    return create_app(type("BenchConfig", (Config,), {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--archived", type=float, default=0.5, help="Fraction seeded into the archive tier.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-transfer-bench-")
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+    os.environ["MESSAGE_HOT_DAYS"] = "0"
+    export_path = os.path.join(workdir, "bench.ndjson.gz")
+
+    from app.channel_transfer import export_channel, import_channel_file
+    from app.extensions import db
+    from app.models import Channel, User
+
+    rng = random.Random(args.seed)
+    source = _create_app(os.path.join(workdir, "source.db"))
+    with source.app_context():
+        users = [
+            User(
+                email=f"user{i}@bench.test",
+                email_prefix=f"user{i}",
+                name=f"user {i}",
+                username=f"user{i}",
+                password_hash="!",
+            )
+            for i in range(args.users)
+        ]
+        channel = Channel(slug="bench", name="# bench")
+        db.session.add_all(users + [channel])
+        db.session.commit()
+        started = time.perf_counter()
+        _seed(args, channel.id, [user.id for user in users], rng)
+        print(f"seed:   {args.messages:,} messages in {time.perf_counter() - started:.1f}s")
+
+        rss = _peak_rss_mb()
+        started = time.perf_counter()
+        written = export_channel(channel, export_path)
+        elapsed = time.perf_counter() - started
+        print(
+            f"export: {args.messages:,} messages in {elapsed:.1f}s "
+            f"({args.messages / elapsed:,.0f} msg/s), {written / 1e6:.1f} MB gzip, "
+            f"peak RSS +{_peak_rss_mb() - rss:.0f} MB"
+        )
+
+    target = _create_app(os.path.join(workdir, "target.db"))
+    with target.app_context():
+        rss = _peak_rss_mb()
+        started = time.perf_counter()
+        imported = import_channel_file(export_path, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(
+            f"import: {imported:,} messages in {elapsed:.1f}s "
+            f"({imported / elapsed:,.0f} msg/s, batch {args.batch_size}), "
+            f"peak RSS +{_peak_rss_mb() - rss:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Concurrency stress test for the KC ledger.
+
+Many threads run random transfers, chat-style rewards and purchase-style
+debits against a file-backed SQLite database at the same time. Afterwards the
+script checks that no balance went negative, that the total equals the
+initial grants plus system credits minus system debits, and that every
+balance equals the sum of its KCLog entries.
+
+Usage: python -m benchmarks.kc_ledger_stress [--threads 8] [--operations 500]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=500, help="operations per thread")
+    parser.add_argument("--initial", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-ledger-stress-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'stress.db')}"
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+
+    from app import create_app
+    from app.extensions import db
+    from app.ledger import InsufficientKCError, apply_kc_delta, apply_transfers, transfer_kc
+    from app.models import KCLog, User
+
+    app = create_app()
+    with app.app_context():
+        users = []
+        for index in range(args.users):
+            user = User(
+                email=f"stress{index}@kjb",
+                email_prefix=f"stress{index}",
+                name=f"Stress {index}",
+                username=f"stress{index}",
+                kc_points=0,
+            )
+            user.password_hash = "!"
+            users.append(user)
+        db.session.add_all(users)
+        db.session.flush()
+        user_ids = [user.id for user in users]
+        for user_id in user_ids:
+            apply_kc_delta(user_id, args.initial, "초기 지급", notify=False)
+        db.session.commit()
+
+    lock = threading.Lock()
+    totals = {"system": 0, "rejected": 0, "retries": 0, "operations": 0}
+
+    def worker(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(args.operations):
+                kind = rng.random()
+                system_delta = 0
+                while True:
+                    try:
+                        if kind < 0.6:
+                            sender, recipient = rng.sample(user_ids, 2)
+                            transfer_kc(sender, recipient, rng.randint(1, 40), "송금", "수신", notify=False)
+                        elif kind < 0.75:
+                            batch = []
+                            for _ in range(rng.randint(2, 5)):
+                                sender, recipient = rng.sample(user_ids, 2)
+                                batch.append((sender, recipient, rng.randint(1, 20), "송금", "수신"))
+                            apply_transfers(batch, notify=False)
+                        elif kind < 0.9:
+                            system_delta = 1
+                            apply_kc_delta(rng.choice(user_ids), 1, "채팅 보상", notify=False)
+                        else:
+                            system_delta = -rng.randint(5, 60)
+                            apply_kc_delta(
+                                rng.choice(user_ids), system_delta, "상점 구매", min_balance=0, notify=False
+                            )
+                        db.session.commit()
+                        with lock:
+                            totals["system"] += system_delta
+                            totals["operations"] += 1
+                        break
+                    except InsufficientKCError:
+                        db.session.rollback()
+                        with lock:
+                            totals["rejected"] += 1
+                        break
+                    except OperationalError:
+                        db.session.rollback()
+                        with lock:
+                            totals["retries"] += 1
+                        time.sleep(rng.random() / 100)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(args.seed + index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        balances = dict(db.session.query(User.id, User.kc_points).filter(User.id.in_(user_ids)).all())
+        logged = dict(
+            db.session.query(KCLog.user_id, func.sum(KCLog.delta))
+            .filter(KCLog.user_id.in_(user_ids))
+            .group_by(KCLog.user_id)
+            .all()
+        )
+    expected_total = args.initial * args.users + totals["system"]
+    actual_total = sum(balances.values())
+    negative = {user_id: balance for user_id, balance in balances.items() if balance < 0}
+    mismatched = {
+        user_id: (balance, logged.get(user_id, 0))
+        for user_id, balance in balances.items()
+        if balance != logged.get(user_id, 0)
+    }
+    print(
+        f"{totals['operations']} committed, {totals['rejected']} rejected, {totals['retries']} lock retries "
+        f"in {elapsed:.2f}s ({totals['operations'] / elapsed:,.0f} ops/s)"
+    )
+    print(f"total balance {actual_total} (expected {expected_total})")
+    ok = actual_total == expected_total and not negative and not mismatched
+    if negative:
+        print(f"negative balances: {negative}")
+    if mismatched:
+        print(f"balance/log mismatches: {mismatched}")
+    print("conserved" if ok else "NOT conserved")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
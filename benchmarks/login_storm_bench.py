@@ -0,0 +1,96 @@
+"""Hub latency during a login storm, with password hashing inline vs offloaded.
+
+Socket events on an eventlet worker are delivered by greenlets on one hub, so
+the delay a greenlet sees when it asks to wake every few milliseconds is the
+delay every socket event on that worker sees. The script runs a ticker
+greenlet alongside a burst of concurrent ``POST /signin`` requests and
+reports how late the ticker woke, first with ``PASSWORD_HASH_OFFLOAD`` off and
+then on. The process is monkey-patched first, as under gunicorn's eventlet
+worker.
+
+Usage: python -m benchmarks.login_storm_bench [--logins 40] [--concurrency 10]
+"""
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import statistics  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--tick-ms", type=float, default=5.0)
+    parser.add_argument("--method", default=None, help="override PASSWORD_HASH_METHOD")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-login-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+    if args.method:
+        os.environ["PASSWORD_HASH_METHOD"] = args.method
+
+    from eventlet.greenpool import GreenPool
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        user = User(email="storm@kjb", email_prefix="storm", name="Storm", username="storm")
+        user.set_password("correct horse")
+        db.session.add(user)
+        db.session.commit()
+
+    def login(_):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/signin", data={"email": "storm@kjb", "password": "correct horse"})
+        assert response.status_code == 302 and "/signin" not in response.location
+        return time.perf_counter() - started
+
+    def run(offload):
+        app.config["PASSWORD_HASH_OFFLOAD"] = offload
+        lags = []
+        state = {"running": True}
+        interval = args.tick_ms / 1000
+
+        def ticker():
+            while state["running"]:
+                expected = time.perf_counter() + interval
+                eventlet.sleep(interval)
+                lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+        tick = eventlet.spawn(ticker)
+        eventlet.sleep(0)
+        started = time.perf_counter()
+        durations = list(GreenPool(args.concurrency).imap(login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+        state["running"] = False
+        tick.wait()
+        label = "offloaded" if offload else "inline"
+        print(
+            f"{label:>9}: {args.logins} logins in {elapsed:.2f}s, "
+            f"login p50 {statistics.median(durations) * 1000:.0f} ms; "
+            f"hub lag p50 {statistics.median(lags):.1f} ms, "
+            f"p99 {_percentile(lags, 0.99):.1f} ms, max {max(lags):.1f} ms"
+        )
+
+    run(offload=False)
+    run(offload=True)
+
+
+if __name__ == "__main__":
+    main()
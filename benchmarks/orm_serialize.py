@@ -0,0 +1,78 @@
+"""The ORM message serializer that chat used before ``query_serialized_messages``.
+
+Kept as the baseline for ``serialize_bench`` and the ``serialize_messages``
+entry of the suite: full ``Message`` objects, ``message.user`` and
+``message.reply_to`` relationships (lazy unless the caller eager-loads them)
+and the ``UserAccessoryPermission`` -> ``Accessory`` object graph.
+"""
+from sqlalchemy.orm import joinedload
+
+from app.models import User, UserEmojiPermission
+from app.sockets import _active_accessory_map, _public_emoji_map
+from app.utils import media_url, render_chat_content, to_kst
+
+
+def _emoji_scope_map(messages):
+    base_emoji_map = _public_emoji_map()
+    user_ids = {message.user_id for message in messages}
+    if not user_ids:
+        return base_emoji_map, {}
+    users = User.query.options(
+        joinedload(User.emoji_permissions).joinedload(UserEmojiPermission.emoji)
+    ).filter(User.id.in_(user_ids))
+    per_user_map = {}
+    for user in users:
+        scoped = dict(base_emoji_map)
+        scoped.update(
+            {
+                permission.emoji.name: permission.emoji.image_url
+                for permission in user.emoji_permissions
+                if permission.emoji
+            }
+        )
+        per_user_map[user.id] = scoped
+    return base_emoji_map, per_user_map
+
+
+def _serialize_message_with_context(message, emoji_map, active_accessory):
+    created_at = to_kst(message.created_at)
+    updated_at = to_kst(message.updated_at) if message.updated_at else None
+    return {
+        "id": message.id,
+        "channel_id": message.channel_id,
+        "user_id": message.user_id,
+        "user_name": message.user.name,
+        "user_prefix": message.user.email_prefix,
+        "avatar": media_url(message.user.avatar_url, "avatar64"),
+        "content": message.content,
+        "rendered_content": str(render_chat_content(message.content, emoji_map)),
+        "reply_to": message.reply_to.content if message.reply_to else None,
+        "is_deleted": message.is_deleted,
+        "name_color": (
+            active_accessory.accessory.text_color if active_accessory and active_accessory.accessory else None
+        ),
+        "accessory_image": (
+            media_url(active_accessory.accessory.image_url, "accessory32")
+            if active_accessory and active_accessory.accessory
+            else None
+        ),
+        "created_at": created_at.strftime("%Y-%m-%d %H:%M"),
+        "updated_at": updated_at.strftime("%Y-%m-%d %H:%M") if updated_at else None,
+    }
+
+
+def serialize_messages(messages):
+    """Serialize ``Message`` objects, resolving author and reply through the ORM."""
+    if not messages:
+        return []
+    user_ids = {message.user_id for message in messages}
+    accessory_map = _active_accessory_map(user_ids)
+    base_emoji_map, per_user_emoji = _emoji_scope_map(messages)
+    return [
+        _serialize_message_with_context(
+            message,
+            per_user_emoji.get(message.user_id, base_emoji_map),
+            accessory_map.get(message.user_id),
+        )
+        for message in messages
+    ]
@@ -0,0 +1,97 @@
+"""Search indexing-throughput and query-latency benchmark.
+
+Usage: python -m benchmarks.search_bench [--messages 200000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+WORDS = [
+    "안녕", "안녕하세요", "오늘", "점심", "저녁", "게임", "공부", "시험", "과제", "상점",
+    "채널", "공지", "hello", "world", "kjb", "coffee", "meeting", "deploy", "python", "flask",
+]
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-search-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import Channel, Message, User
+    from app.search import index_message, rebuild_search_index, search_message_ids
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        user = User(email="bench@kjb", email_prefix="bench", name="bench", username="bench")
+        user.password_hash = "!"
+        db.session.add(user)
+        channels = [Channel(slug=f"bench-{i}", name=f"# bench-{i}") for i in range(args.channels)]
+        db.session.add_all(channels)
+        db.session.commit()
+        channel_ids = [channel.id for channel in channels]
+
+        rows = [
+            {
+                "channel_id": rng.choice(channel_ids),
+                "user_id": user.id,
+                "content": " ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+                "is_deleted": False,
+            }
+            for _ in range(args.messages)
+        ]
+        db.session.execute(insert(Message), rows)
+        db.session.commit()
+
+        started = time.perf_counter()
+        indexed = rebuild_search_index()
+        elapsed = time.perf_counter() - started
+        print(f"bulk index:        {indexed} messages in {elapsed:.2f}s ({indexed / elapsed:,.0f} msg/s)")
+
+        incremental = min(5000, args.messages)
+        messages = Message.query.order_by(Message.id.desc()).limit(incremental).all()
+        started = time.perf_counter()
+        for message in messages:
+            index_message(message)
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+        print(f"incremental index: {incremental} messages in {elapsed:.2f}s ({incremental / elapsed:,.0f} msg/s)")
+
+        latencies = []
+        readable = channel_ids[: max(1, len(channel_ids) // 2)]
+        for _ in range(args.queries):
+            query = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+            started = time.perf_counter()
+            ids, has_more = search_message_ids(query, readable)
+            if has_more:
+                search_message_ids(query, readable, before_id=ids[-1])
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(
+            f"query latency:     p50 {statistics.median(latencies):.2f}ms "
+            f"p95 {_percentile(latencies, 0.95):.2f}ms p99 {_percentile(latencies, 0.99):.2f}ms "
+            f"({args.queries} queries, first + second page)"
+        )
+
+
+if __name__ == "__main__":
+    main()
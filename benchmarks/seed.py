@@ -0,0 +1,343 @@
+"""Deterministic synthetic dataset for benchmarks and local load tests.
+
+The same ``--seed`` and sizes always produce the same rows: users (user 1
+is the admin), channels with some restricted by default, per-user channel
+permission overrides, emojis with public and granted ones, accessories with
+one active per owner, follows, notifications, read positions, and a message
+history with markdown, emoji codes, replies and deletions. Rows are bulk
+inserted with Core statements, so millions of messages take minutes, not
+hours.
+
+Every seeded user can sign in as ``<username>@seed.test`` with
+``--password``.
+
+Usage: python -m benchmarks.seed --db /tmp/kjb-seed.db --messages 2000000
+"""
+import argparse
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+
+BASE_TIME = datetime(2024, 1, 1)
+INSERT_CHUNK = 5000
+WORDS = (
+    "안녕하세요 오늘 회의 자료 공유 드립니다 확인 부탁 점심 메뉴 추천 배포 완료 "
+    "hello deploy review merge ship lunch coffee meeting update thanks soon later "
+    "bug fix release chat channel emoji profile shop notice weekend plan"
+).split()
+COLORS = ("#f7f9ff", "#ffd166", "#06d6a0", "#ef476f", "#118ab2", "#c77dff")
+
+
+@dataclass
+class SeedParams:
+    users: int = 2000
+    channels: int = 30
+    messages: int = 200000
+    emojis: int = 60
+    accessories: int = 20
+    follows_per_user: int = 15
+    notifications_per_user: int = 10
+    permission_overrides: int = 3000
+    seed: int = 7
+    password: str = "seed-password"
+
+
+def _insert(table, rows):
+    from app.extensions import db
+
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(table), rows[start : start + INSERT_CHUNK])
+
+
+def _message_content(rng, emoji_names):
+    words = rng.choices(WORDS, k=rng.randint(3, 18))
+    roll = rng.random()
+    if roll < 0.25 and emoji_names:
+        words.insert(rng.randrange(len(words) + 1), f":{rng.choice(emoji_names)}:")
+    elif roll < 0.35:
+        index = rng.randrange(len(words))
+        words[index] = f"**{words[index]}**"
+    elif roll < 0.42:
+        words.append(f"`{rng.choice(WORDS)}()`")
+    elif roll < 0.47:
+        words.append(f"[link](https://example.com/{rng.randint(1, 9999)})")
+    return " ".join(words)
+
+
+def seed_dataset(params):
+    """Insert the dataset into the current app's (freshly provisioned) database.
+
+    Returns a dict of row counts per table.
+    """
+    from werkzeug.security import generate_password_hash
+
+    from app.extensions import db
+    from app.models import (
+        Accessory,
+        Channel,
+        ChannelPermission,
+        Emoji,
+        Follow,
+        Message,
+        Notification,
+        User,
+        UserAccessoryPermission,
+        UserChannelRead,
+        UserEmojiPermission,
+    )
+
+    rng = random.Random(params.seed)
+    counts = {}
+    password_hash = generate_password_hash(params.password, "pbkdf2:sha256:1000")
+
+    users = [
+        {
+            "id": user_id,
+            "email": f"seed{user_id}@seed.test",
+            "email_prefix": f"seed{user_id}",
+            "name": f"Seed User {user_id}",
+            "username": f"seed{user_id}",
+            "password_hash": password_hash,
+            "is_admin": user_id == 1,
+            "kc_points": rng.randint(0, 5000),
+            "bio": "",
+            "avatar_url": "/static/images/default-avatar.svg",
+            "follower_count": 0,
+            "following_count": 0,
+            "created_at": BASE_TIME + timedelta(minutes=user_id),
+        }
+        for user_id in range(1, params.users + 1)
+    ]
+    _insert(User.__table__, users)
+    counts["users"] = len(users)
+
+    db.session.execute(Channel.__table__.delete())
+    channels = []
+    for channel_id in range(1, params.channels + 1):
+        restricted = channel_id > 1 and rng.random() < 0.2
+        channels.append(
+            {
+                "id": channel_id,
+                "slug": "general" if channel_id == 1 else f"channel-{channel_id}",
+                "name": "# general" if channel_id == 1 else f"# channel {channel_id}",
+                "description": "",
+                "priority": params.channels - channel_id,
+                "default_can_view": not restricted,
+                "default_can_read": not restricted,
+                "default_can_send": not restricted,
+                "created_at": BASE_TIME,
+            }
+        )
+    _insert(Channel.__table__, channels)
+    counts["channels"] = len(channels)
+
+    overrides = {}
+    for _ in range(params.permission_overrides):
+        key = (rng.randint(2, params.users), rng.randint(1, params.channels))
+        can_view = rng.random() < 0.7
+        overrides[key] = {
+            "user_id": key[0],
+            "channel_id": key[1],
+            "can_view": can_view,
+            "can_read": can_view and rng.random() < 0.9,
+            "can_send": can_view and rng.random() < 0.6,
+            "created_at": BASE_TIME,
+        }
+    _insert(ChannelPermission.__table__, list(overrides.values()))
+    counts["channel_permissions"] = len(overrides)
+
+    emoji_names = [f"emo{emoji_id}" for emoji_id in range(1, params.emojis + 1)]
+    _insert(
+        Emoji.__table__,
+        [
+            {
+                "id": emoji_id,
+                "name": name,
+                "image_url": f"/static/images/emoji/{name}.png",
+                "is_public": emoji_id % 3 == 0,
+                "created_at": BASE_TIME,
+            }
+            for emoji_id, name in enumerate(emoji_names, start=1)
+        ],
+    )
+    emoji_grants = set()
+    if params.emojis:
+        for _ in range(params.users * 2):
+            emoji_grants.add((rng.randint(1, params.users), rng.randint(1, params.emojis)))
+    _insert(
+        UserEmojiPermission.__table__,
+        [
+            {"user_id": user_id, "emoji_id": emoji_id, "created_at": BASE_TIME}
+            for user_id, emoji_id in sorted(emoji_grants)
+        ],
+    )
+    counts["emojis"] = params.emojis
+    counts["user_emoji_permissions"] = len(emoji_grants)
+
+    _insert(
+        Accessory.__table__,
+        [
+            {
+                "id": accessory_id,
+                "name": f"Accessory {accessory_id}",
+                "image_url": f"/static/images/accessory/{accessory_id}.png",
+                "text_color": COLORS[accessory_id % len(COLORS)],
+                "created_at": BASE_TIME,
+            }
+            for accessory_id in range(1, params.accessories + 1)
+        ],
+    )
+    accessory_rows = []
+    if params.accessories:
+        for user_id in range(1, params.users + 1):
+            if rng.random() < 0.4:
+                owned = rng.sample(range(1, params.accessories + 1), k=min(3, params.accessories))
+                for position, accessory_id in enumerate(owned):
+                    accessory_rows.append(
+                        {
+                            "user_id": user_id,
+                            "accessory_id": accessory_id,
+                            "is_active": position == 0,
+                            "created_at": BASE_TIME,
+                        }
+                    )
+    _insert(UserAccessoryPermission.__table__, accessory_rows)
+    counts["accessories"] = params.accessories
+    counts["user_accessory_permissions"] = len(accessory_rows)
+
+    follows = set()
+    for follower_id in range(1, params.users + 1):
+        for _ in range(params.follows_per_user):
+            followed_id = rng.randint(1, params.users)
+            if followed_id != follower_id:
+                follows.add((follower_id, followed_id))
+    _insert(
+        Follow.__table__,
+        [
+            {"follower_id": follower_id, "followed_id": followed_id, "created_at": BASE_TIME}
+            for follower_id, followed_id in sorted(follows)
+        ],
+    )
+    counts["follows"] = len(follows)
+
+    notifications = [
+        {
+            "user_id": user_id,
+            "title": "알림",
+            "body": f"seeded notification {index}",
+            "created_at": BASE_TIME + timedelta(hours=index),
+            "is_read": rng.random() < 0.6,
+        }
+        for user_id in range(1, params.users + 1)
+        for index in range(params.notifications_per_user)
+    ]
+    _insert(Notification.__table__, notifications)
+    counts["notifications"] = len(notifications)
+
+    # Busier channels get most of the traffic, like a real community.
+    channel_weights = [1 / rank for rank in range(1, params.channels + 1)]
+    channel_ids = list(range(1, params.channels + 1))
+    last_in_channel = {}
+    batch = []
+    for message_id in range(1, params.messages + 1):
+        channel_id = rng.choices(channel_ids, channel_weights)[0]
+        previous = last_in_channel.get(channel_id)
+        batch.append(
+            {
+                "id": message_id,
+                "channel_id": channel_id,
+                "user_id": rng.randint(1, params.users),
+                "content": _message_content(rng, emoji_names),
+                "reply_to_id": previous if previous and rng.random() < 0.05 else None,
+                "is_deleted": rng.random() < 0.01,
+                "created_at": BASE_TIME + timedelta(seconds=message_id * 7),
+                "updated_at": None,
+                "client_id": None,
+            }
+        )
+        last_in_channel[channel_id] = message_id
+        if len(batch) >= INSERT_CHUNK:
+            _insert(Message.__table__, batch)
+            batch = []
+    _insert(Message.__table__, batch)
+    counts["messages"] = params.messages
+
+    reads = [
+        {
+            "user_id": user_id,
+            "channel_id": channel_id,
+            "last_read_message_id": max(0, last_id - rng.randint(0, 50)),
+            "updated_at": BASE_TIME,
+        }
+        for user_id in range(1, params.users + 1)
+        for channel_id, last_id in sorted(last_in_channel.items())
+        if rng.random() < 0.3
+    ]
+    _insert(UserChannelRead.__table__, reads)
+    counts["user_channel_reads"] = len(reads)
+
+    users_table = User.__table__
+    follows_table = Follow.__table__
+    db.session.execute(
+        users_table.update().values(
+            follower_count=select(func.count())
+            .where(follows_table.c.followed_id == users_table.c.id)
+            .scalar_subquery(),
+            following_count=select(func.count())
+            .where(follows_table.c.follower_id == users_table.c.id)
+            .scalar_subquery(),
+        )
+    )
+    db.session.commit()
+    return counts
+
+
+def create_seeded_app(db_path, params, rebuild_search=True):
+    """Build an app on ``db_path``, seeding it first if the file does not exist yet."""
+    fresh = not os.path.exists(db_path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("UPLOAD_FOLDER", os.path.join(os.path.dirname(db_path), "uploads"))
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+
+    from app import create_app
+    from app.search import rebuild_search_index
+
+    app = create_app()
+    if fresh:
+        with app.app_context():
+            started = time.perf_counter()
+            counts = seed_dataset(params)
+            if rebuild_search:
+                rebuild_search_index()
+            print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+    return app
+
+
+def add_seed_arguments(parser):
+    defaults = SeedParams()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+
+def params_from_args(args):
+    return SeedParams(**{name: getattr(args, name) for name in asdict(SeedParams())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="SQLite file to create (must not exist)")
+    parser.add_argument("--skip-search", action="store_true", help="do not build the search index")
+    add_seed_arguments(parser)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        raise SystemExit(f"{args.db} already exists")
+    create_seeded_app(os.path.abspath(args.db), params_from_args(args), rebuild_search=not args.skip_search)
+
+
+if __name__ == "__main__":
+    main()
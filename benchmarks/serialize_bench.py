@@ -0,0 +1,127 @@
+"""ORM vs row-tuple message serialization benchmark.
+
+Usage: python -m benchmarks.serialize_bench [--messages 200] [--rounds 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-serialize-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+
+    from sqlalchemy.orm import joinedload
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import (
+        Accessory,
+        Channel,
+        Emoji,
+        Message,
+        User,
+        UserAccessoryPermission,
+        UserEmojiPermission,
+    )
+    from app.sockets import query_serialized_messages
+
+    from .orm_serialize import serialize_messages
+
+    rng = random.Random(args.seed)
+    app = create_app()
+    with app.app_context():
+        channel = Channel.query.first()
+        users = []
+        for index in range(args.users):
+            user = User(
+                email=f"user{index}@kjb",
+                email_prefix=f"user{index}",
+                name=f"User {index}",
+                username=f"user{index}",
+            )
+            user.password_hash = "!"
+            users.append(user)
+        db.session.add_all(users)
+        accessories = [Accessory(name=f"acc{i}", image_url=f"acc{i}.png") for i in range(5)]
+        emojis = [Emoji(name=f"e{i}", image_url=f"e{i}.png", is_public=i < 3) for i in range(10)]
+        db.session.add_all(accessories + emojis)
+        db.session.flush()
+        for user in users:
+            db.session.add(
+                UserAccessoryPermission(
+                    user_id=user.id, accessory_id=rng.choice(accessories).id, is_active=True
+                )
+            )
+            for emoji in rng.sample(emojis, 3):
+                db.session.add(UserEmojiPermission(user_id=user.id, emoji_id=emoji.id))
+        previous_ids = []
+        for index in range(args.messages):
+            message = Message(
+                channel_id=channel.id,
+                user_id=rng.choice(users).id,
+                content=f"message {index} :e{rng.randrange(10)}: **bold** `code`",
+                reply_to_id=rng.choice(previous_ids) if previous_ids and rng.random() < 0.3 else None,
+            )
+            db.session.add(message)
+            db.session.flush()
+            previous_ids.append(message.id)
+        db.session.commit()
+        channel_id = channel.id
+
+        statements = {"count": 0}
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def count_statement(*_):
+            statements["count"] += 1
+
+        def orm_path():
+            latest = (
+                Message.query.options(joinedload(Message.user), joinedload(Message.reply_to))
+                .filter_by(channel_id=channel_id)
+                .order_by(Message.id.desc())
+                .limit(args.messages)
+                .all()
+            )
+            return serialize_messages(list(reversed(latest)))
+
+        def tuple_path():
+            latest = query_serialized_messages(
+                Message.channel_id == channel_id, newest_first=True, limit=args.messages
+            )
+            return list(reversed(latest))
+
+        db.session.remove()
+        assert orm_path() == tuple_path(), "serializers disagree"
+
+        for label, path in (("orm", orm_path), ("tuple", tuple_path)):
+            timings = []
+            statements["count"] = 0
+            for _ in range(args.rounds):
+                db.session.remove()
+                started = time.perf_counter()
+                path()
+                timings.append((time.perf_counter() - started) * 1000)
+            print(
+                f"{label:>5}: median {statistics.median(timings):.2f}ms "
+                f"min {min(timings):.2f}ms, {statements['count'] / args.rounds:.1f} statements/round "
+                f"({args.messages} messages)"
+            )
+
+
+if __name__ == "__main__":
+    main()
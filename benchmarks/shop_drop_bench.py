@@ -0,0 +1,117 @@
+"""Contended shop drop benchmark.
+
+Hundreds of buyers race for a limited item: every request tries to reserve a
+unit atomically, then the pending queue is bulk-approved through the KC
+ledger. Reports reservation throughput, approval throughput and checks that
+stock was never oversold.
+
+Usage: python -m benchmarks.shop_drop_bench [--buyers 500] [--stock 50] [--threads 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--cost", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-shop-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["UPLOAD_FOLDER"] = os.path.join(workdir, "uploads")
+    os.environ["SCHEMA_AUTO_PROVISION"] = "1"
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import ShopItem, ShopRequest, User
+    from app.shop import place_request, process_pending_requests
+
+    app = create_app()
+    with app.app_context():
+        buyers = []
+        for index in range(args.buyers):
+            user = User(
+                email=f"buyer{index}@kjb",
+                email_prefix=f"buyer{index}",
+                name=f"Buyer {index}",
+                username=f"buyer{index}",
+                # every fifth buyer cannot afford the item
+                kc_points=0 if index % 5 == 0 else args.cost * 2,
+            )
+            user.password_hash = "!"
+            buyers.append(user)
+        db.session.add_all(buyers)
+        item = ShopItem(name="flash drop", kc_cost=args.cost, quantity=args.stock)
+        db.session.add(item)
+        db.session.commit()
+        buyer_ids = [user.id for user in buyers]
+        item_id = item.id
+
+    outcomes = {"reserved": 0, "sold_out": 0, "retries": 0}
+    lock = threading.Lock()
+    queue = list(buyer_ids)
+
+    def worker():
+        with app.app_context():
+            item = db.session.get(ShopItem, item_id)
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    buyer_id = queue.pop()
+                while True:
+                    try:
+                        placed = place_request(buyer_id, item)
+                        if placed:
+                            db.session.commit()
+                        else:
+                            db.session.rollback()
+                        with lock:
+                            outcomes["reserved" if placed else "sold_out"] += 1
+                        break
+                    except OperationalError:
+                        db.session.rollback()
+                        with lock:
+                            outcomes["retries"] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reserve_elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        started = time.perf_counter()
+        counts = process_pending_requests()
+        approve_elapsed = time.perf_counter() - started
+        remaining = db.session.query(ShopItem.quantity).filter(ShopItem.id == item_id).scalar()
+        approved = ShopRequest.query.filter_by(status="approved").count()
+
+    print(
+        f"reservations: {args.buyers} buyers in {reserve_elapsed:.2f}s "
+        f"({args.buyers / reserve_elapsed:,.0f} req/s), {outcomes['reserved']} reserved, "
+        f"{outcomes['sold_out']} sold out, {outcomes['retries']} lock retries"
+    )
+    print(
+        f"bulk approve: {counts['approved']} approved, {counts['denied']} denied "
+        f"in {approve_elapsed * 1000:.1f}ms"
+    )
+    print(f"stock left {remaining}, approved {approved} of {args.stock}")
+    oversold = outcomes["reserved"] > args.stock or approved + remaining != args.stock
+    print("OVERSOLD" if oversold else "no oversell")
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == "__main__":
+    main()
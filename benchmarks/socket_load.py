@@ -0,0 +1,255 @@
+"""Socket.IO load generator: N simulated chat users against a running server.
+
+Each synthetic user signs in through ``/signin`` (signing up first when the
+account does not exist yet), opens a Socket.IO connection with that session,
+joins the channel and then, until ``--duration`` runs out, performs a random
+action from ``--mix`` at ``--rate`` actions per second on average:
+
+* ``send``   - ``send_message``; every receiver records send->receive latency
+* ``typing`` - a ``typing`` start/stop pair
+* ``edit``   - ``edit_message`` on one of the user's own earlier messages
+* ``rejoin`` - ``leave`` followed by ``join``
+
+Ack latency is recorded for every action. At the end the script prints
+latency percentiles plus sent and received frames per second.
+
+Needs the client packages in benchmarks/requirements.txt
+(``pip install -r benchmarks/requirements.txt``).
+Sends over the server's ``RATE_LIMITS`` come back as ``rate_limited`` and are
+counted separately; start the server with ``RATE_LIMIT_ENABLED=0`` to measure
+unthrottled throughput. Run the server locally first, e.g. ``python run.py``
+with SQLite, then:
+
+    python -m benchmarks.socket_load --url http://127.0.0.1:5000 --users 50 --duration 60
+"""
+import argparse
+import random
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+import socketio
+
+
+TOKEN_PATTERN = re.compile(r"\[load:([0-9a-f]{32})\]")
+DEFAULT_MIX = "send=60,typing=25,edit=10,rejoin=5"
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("send", "typing", "edit", "rejoin"):
+            raise argparse.ArgumentTypeError(f"unknown action: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.sent_at = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.latencies[name].append(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def mark_sent(self, token):
+        with self.lock:
+            self.sent_at[token] = time.perf_counter()
+
+    def mark_received(self, content):
+        match = TOKEN_PATTERN.search(content or "")
+        if not match:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            started = self.sent_at.get(match.group(1))
+            if started is not None:
+                self.latencies["send->receive"].append(now - started)
+
+
+class SimulatedUser:
+    def __init__(self, index, args, stats):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.random = random.Random(args.seed + index)
+        self.http = requests.Session()
+        self.client = None
+        self.own_message_ids = []
+
+    @property
+    def email(self):
+        return f"{self.args.prefix}{self.index}@load.test"
+
+    def login(self):
+        url = self.args.url.rstrip("/")
+        form = {"email": self.email, "password": self.args.password}
+        response = self.http.post(f"{url}/signin", data=form)
+        if response.url.rstrip("/").endswith("/signin"):
+            self.http.post(
+                f"{url}/signup",
+                data={
+                    "email": self.email,
+                    "name": f"Load {self.index}",
+                    "username": f"{self.args.prefix}{self.index}",
+                    "password": self.args.password,
+                    "password_confirm": self.args.password,
+                },
+            )
+            response = self.http.post(f"{url}/signin", data=form)
+        if response.url.rstrip("/").endswith("/signin"):
+            raise RuntimeError(f"could not sign in {self.email}")
+
+    def connect(self):
+        client = socketio.Client(http_session=self.http, reconnection=False)
+
+        @client.on("*")
+        def on_any(event, *args):
+            self.stats.count("received")
+
+        @client.on("new_message")
+        def on_new_message(payload):
+            self.stats.count("received")
+            self.stats.mark_received(payload.get("content"))
+
+        client.connect(self.args.url, transports=[self.args.transport])
+        self.client = client
+        self._call("join", {"channel": self.args.channel})
+
+    def _call(self, event, payload):
+        started = time.perf_counter()
+        try:
+            ack = self.client.call(event, payload, timeout=self.args.ack_timeout)
+        except socketio.exceptions.TimeoutError:
+            self.stats.count("timeouts")
+            return None
+        finally:
+            self.stats.count("sent")
+        self.stats.record(f"ack {event}", time.perf_counter() - started)
+        return ack
+
+    def send(self):
+        token = uuid.uuid4().hex
+        self.stats.mark_sent(token)
+        ack = self._call(
+            "send_message",
+            {
+                "channel": self.args.channel,
+                "content": f"[load:{token}] message from user {self.index}",
+                "client_id": token,
+            },
+        )
+        if ack and ack.get("ok"):
+            self.own_message_ids.append(ack["message_id"])
+            del self.own_message_ids[:-20]
+        elif ack and ack.get("error") == "rate_limited":
+            self.stats.count(f"sends rate limited ({ack.get('scope')})")
+        else:
+            self.stats.count("send errors")
+
+    def typing(self):
+        self._call("typing", {"channel": self.args.channel, "is_typing": True})
+        self._call("typing", {"channel": self.args.channel, "is_typing": False})
+
+    def edit(self):
+        if not self.own_message_ids:
+            return self.send()
+        message_id = self.random.choice(self.own_message_ids)
+        self._call("edit_message", {"message_id": message_id, "content": f"edited by user {self.index}"})
+
+    def rejoin(self):
+        self._call("leave", {"channel": self.args.channel})
+        self._call("join", {"channel": self.args.channel})
+
+    def run(self, deadline, actions, weights):
+        while time.perf_counter() < deadline:
+            action = self.random.choices(actions, weights)[0]
+            getattr(self, action)()
+            self.stats.count(f"action {action}")
+            time.sleep(self.random.expovariate(self.args.rate))
+
+    def close(self):
+        if self.client is not None:
+            self.client.disconnect()
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+    return (
+        f"n={len(ordered):>6}  p50 {at(0.5):7.1f}  p90 {at(0.9):7.1f}  "
+        f"p99 {at(0.99):7.1f}  max {ordered[-1] * 1000:7.1f}  mean {statistics.fmean(ordered) * 1000:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after all users connect")
+    parser.add_argument("--rate", type=float, default=0.5, help="actions per second per user")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--channel", default="general")
+    parser.add_argument("--transport", choices=["websocket", "polling"], default="websocket")
+    parser.add_argument("--prefix", default="loaduser")
+    parser.add_argument("--password", default="load-test-password")
+    parser.add_argument("--ack-timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    stats = LoadStats()
+    users = [SimulatedUser(index, args, stats) for index in range(args.users)]
+    connect_started = time.perf_counter()
+    for user in users:
+        user.login()
+        user.connect()
+    print(f"{len(users)} users signed in and connected in {time.perf_counter() - connect_started:.1f}s")
+
+    actions = list(args.mix)
+    weights = [args.mix[action] for action in actions]
+    with stats.lock:
+        stats.counters.clear()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=user.run, args=(deadline, actions, weights), daemon=True)
+        for user in users
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    time.sleep(min(2.0, args.ack_timeout))  # let in-flight broadcasts arrive
+    for user in users:
+        user.close()
+
+    print(f"ran {elapsed:.1f}s with mix {args.mix}")
+    for name in sorted(stats.latencies):
+        print(f"  {name:>18}: {_percentiles(stats.latencies[name])}")
+    print(
+        f"  frames/s: sent {stats.counters['sent'] / elapsed:.1f}, "
+        f"received {stats.counters['received'] / elapsed:.1f}"
+    )
+    extras = {name: count for name, count in sorted(stats.counters.items()) if name not in ("sent", "received")}
+    print(f"  counters: {extras}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Worker startup cost: time-to-first-request and SQL issued while booting.
+
+Provisions a file-backed SQLite database once, then starts ``--workers``
+fresh interpreter processes at the same moment, the way a rolling restart
+does. Each process times ``import app``, ``create_app()`` and its first
+``GET /signin``, and counts the SQL statements executed before that request
+is served.
+
+Usage: python -m benchmarks.startup_bench [--workers 8]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+WORKER_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+boot_statements = len(statements)
+response = application.test_client().get("/signin")
+served = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": served - created,
+    "total": served - started,
+    "boot_statements": boot_statements,
+}))
+"""
+
+
+def _summary(samples, key):
+    values = [sample[key] for sample in samples]
+    return f"p50 {statistics.median(values) * 1000:.0f} ms, max {max(values) * 1000:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kjb-startup-bench-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        UPLOAD_FOLDER=os.path.join(workdir, "uploads"),
+        SCHEMA_AUTO_PROVISION="1",
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run(
+        [sys.executable, "-c", "import app; app.create_app()"], cwd=root, env=env, check=True
+    )
+
+    started = time.perf_counter()
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER_SCRIPT], cwd=root, env=env, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(args.workers)
+    ]
+    samples = []
+    for worker in workers:
+        output, _ = worker.communicate()
+        if worker.returncode != 0:
+            raise SystemExit(f"worker exited with {worker.returncode}")
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.workers} workers ready in {elapsed:.2f}s")
+    for key in ("import", "create_app", "first_request", "total"):
+        print(f"  {key:>13}: {_summary(samples, key)}")
+    statements = [sample["boot_statements"] for sample in samples]
+    print(f"  SQL statements before first request: {max(statements)} per worker")
+
+
+if __name__ == "__main__":
+    main()
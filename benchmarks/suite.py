@@ -0,0 +1,253 @@
+"""Hot-path micro-benchmark suite over a seeded dataset, with JSON results.
+
+Benchmarks:
+
+* ``render_chat_content``          - 500 seeded message bodies with the emoji map
+* ``serialize_messages``           - ORM serialization of the busiest channel's latest 200
+* ``query_serialized_messages``    - the row-tuple path used by chat for the same page
+* ``build_channel_permission_map`` - a user with overrides, across all channels
+* ``compute_unread_channel_ids``   - unread state for that user's visible channels
+* ``online_payload``               - 200 users online
+* ``views.chat``                   - full ``GET /chat`` render of that user's first channel
+* ``views.admin``                  - full ``GET /admin`` render
+* ``handle_send_message``          - ``send_message`` through the Socket.IO test client
+
+Results are written as JSON (``--output``, default
+``benchmarks/results/<commit>.json``); pass ``--compare`` with an earlier file
+to print median changes against it. ``--db`` reuses a seeded database between
+runs so only the first run pays for seeding.
+
+Usage: python -m benchmarks.suite [--messages 200000] [--rounds 30] [--compare OLD.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+from benchmarks.seed import add_seed_arguments, create_seeded_app, params_from_args
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(RESULTS_DIR),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _measure(func, rounds, warmup):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    ordered = sorted(timings)
+    return {
+        "rounds": rounds,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p90_ms": ordered[min(rounds - 1, int(rounds * 0.9))] * 1000,
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def build_benchmarks(app):
+    """Return ``{name: callable}``; each callable runs one iteration."""
+    from flask import session
+    from sqlalchemy import func
+
+    from app.extensions import db, socketio
+    from app.models import Channel, ChannelPermission, Emoji, Message, User
+    from app.routes.views import _compute_unread_channel_ids
+    from app.sockets import _online_payload, online_users, query_serialized_messages
+    from app.utils import build_channel_permission_map, get_visible_channels, render_chat_content
+
+    from .orm_serialize import serialize_messages
+
+    with app.app_context():
+        busiest_channel_id = (
+            db.session.query(Message.channel_id)
+            .group_by(Message.channel_id)
+            .order_by(func.count().desc())
+            .limit(1)
+            .scalar()
+        )
+        member_id = (
+            db.session.query(ChannelPermission.user_id)
+            .group_by(ChannelPermission.user_id)
+            .order_by(func.count().desc(), ChannelPermission.user_id)
+            .limit(1)
+            .scalar()
+        )
+        admin_id = User.query.filter_by(is_admin=True).order_by(User.id).first().id
+        member_id = member_id or admin_id
+        online_ids = [row[0] for row in db.session.query(User.id).order_by(User.id).limit(200)]
+        emoji_map = {emoji.name: emoji.image_url for emoji in Emoji.query.all()}
+        contents = [
+            row[0]
+            for row in db.session.query(Message.content).order_by(Message.id.desc()).limit(500)
+        ]
+    with app.test_request_context():
+        session["user_id"] = member_id
+        member_channel_slug = get_visible_channels()[0].slug
+
+    def in_context(func):
+        def run():
+            with app.app_context():
+                func()
+                db.session.remove()
+
+        return run
+
+    def render_contents():
+        for content in contents:
+            render_chat_content(content, emoji_map)
+
+    def serialize_orm():
+        messages = (
+            Message.query.filter_by(channel_id=busiest_channel_id)
+            .order_by(Message.id.desc())
+            .limit(200)
+            .all()
+        )
+        serialize_messages(messages)
+
+    def serialize_rows():
+        query_serialized_messages(
+            Message.channel_id == busiest_channel_id, newest_first=True, limit=200
+        )
+
+    def permission_map():
+        build_channel_permission_map(db.session.get(User, member_id), Channel.query.all())
+
+    def unread_ids():
+        with app.test_request_context():
+            session["user_id"] = member_id
+            _compute_unread_channel_ids(db.session.get(User, member_id), get_visible_channels())
+
+    def online():
+        online_users.clear()
+        online_users.update(online_ids)
+        _online_payload()
+
+    member_client = app.test_client()
+    with member_client.session_transaction() as client_session:
+        client_session["user_id"] = member_id
+    admin_client = app.test_client()
+    with admin_client.session_transaction() as client_session:
+        client_session["user_id"] = admin_id
+    # One client sends every round; time the handler, not the rate limiter.
+    app.config["RATE_LIMIT_ENABLED"] = False
+    socket_client = socketio.test_client(app, flask_test_client=admin_client)
+    socket_client.emit("join", {"channel": "general"}, callback=True)
+
+    def get_page(client, path):
+        def run():
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+
+        return run
+
+    sequence = {"value": 0}
+
+    def send_message():
+        sequence["value"] += 1
+        ack = socket_client.emit(
+            "send_message",
+            {"channel": "general", "content": f"benchmark message {sequence['value']} :emo3:"},
+            callback=True,
+        )
+        assert ack and ack.get("ok"), ack
+        socket_client.get_received()
+
+    return {
+        "render_chat_content": render_contents,
+        "serialize_messages": in_context(serialize_orm),
+        "query_serialized_messages": in_context(serialize_rows),
+        "build_channel_permission_map": in_context(permission_map),
+        "compute_unread_channel_ids": in_context(unread_ids),
+        "online_payload": in_context(online),
+        "views.chat": get_page(member_client, f"/chat?id={member_channel_slug}"),
+        "views.admin": get_page(admin_client, "/admin"),
+        "handle_send_message": send_message,
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    print(f"compared with {baseline['meta'].get('commit')} ({baseline_path}):")
+    for name, result in results["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous:
+            print(f"  {name:>30}: new")
+            continue
+        change = (result["median_ms"] / previous["median_ms"] - 1) * 100 if previous["median_ms"] else 0.0
+        print(f"  {name:>30}: {previous['median_ms']:9.2f} -> {result['median_ms']:9.2f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="seeded SQLite file to reuse (created when missing)")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--only", action="append", help="run only these benchmarks (repeatable)")
+    parser.add_argument("--output", help="JSON results path")
+    parser.add_argument("--compare", help="earlier JSON results to compare medians against")
+    add_seed_arguments(parser)
+    args = parser.parse_args()
+
+    params = params_from_args(args)
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(
+        tempfile.mkdtemp(prefix="kjb-suite-"), "seeded.db"
+    )
+    app = create_seeded_app(db_path, params)
+    benchmarks = build_benchmarks(app)
+
+    commit = _git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "recorded_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": asdict(params),
+            "rounds": args.rounds,
+        },
+        "results": {},
+    }
+    for name, func in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        result = _measure(func, args.rounds, args.warmup)
+        results["results"][name] = result
+        print(f"{name:>30}: median {result['median_ms']:9.2f} ms  p90 {result['p90_ms']:9.2f} ms")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+    print(f"wrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,81 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(BASE_DIR, 'kjb.db')}")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite file attached as the cold message tier; unset keeps it in the main database.
+    MESSAGE_ARCHIVE_DATABASE = os.getenv("MESSAGE_ARCHIVE_DATABASE")
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "execution_options": {
+            "schema_translate_map": {"archive": "archive" if MESSAGE_ARCHIVE_DATABASE else None}
+        }
+    }
+    # Messages older than this move to the cold tier; 0 disables compaction.
+    MESSAGE_HOT_DAYS = int(os.getenv("MESSAGE_HOT_DAYS", 90))
+    MESSAGE_COMPACT_INTERVAL = float(os.getenv("MESSAGE_COMPACT_INTERVAL", 3600))
+    MESSAGE_COMPACT_BATCH_SIZE = int(os.getenv("MESSAGE_COMPACT_BATCH_SIZE", 2000))
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwt-secret")
     UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
     MAX_CONTENT_LENGTH = 20 * 1024 * 1024
     SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
     ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp", "mp4", "mp3", "pdf"}
+    MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", 365 * 24 * 60 * 60))
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX")
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE") == "1"
+    MEDIA_DERIVATIVE_WORKERS = int(os.getenv("MEDIA_DERIVATIVE_WORKERS", 2))
+    READ_STATE_FLUSH_INTERVAL = float(os.getenv("READ_STATE_FLUSH_INTERVAL", 2))
+    SEND_DEDUPE_WINDOW = int(os.getenv("SEND_DEDUPE_WINDOW", 600))
+    SEND_DEDUPE_MAX_ENTRIES = int(os.getenv("SEND_DEDUPE_MAX_ENTRIES", 10000))
+    RESUME_BUFFER_SIZE = int(os.getenv("RESUME_BUFFER_SIZE", 500))
+    RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", 200))
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    PASSWORD_HASH_SALT_LENGTH = int(os.getenv("PASSWORD_HASH_SALT_LENGTH", 16))
+    PASSWORD_HASH_OFFLOAD = os.getenv("PASSWORD_HASH_OFFLOAD", "1") == "1"
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 10))
+    # Deploys run `flask kjb init`; only dev servers (FLASK_DEBUG=1) migrate on startup.
+    SCHEMA_AUTO_PROVISION = os.getenv("SCHEMA_AUTO_PROVISION", os.getenv("FLASK_DEBUG", "0")) == "1"
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    QUERY_AUDIT = os.getenv("QUERY_AUDIT", os.getenv("FLASK_DEBUG", "0")) == "1"
+    QUERY_AUDIT_REPEAT_THRESHOLD = int(os.getenv("QUERY_AUDIT_REPEAT_THRESHOLD", 5))
+    QUERY_BUDGETS = {
+        "views.chat": 12,
+        "views.admin": 20,
+        "socket:send_message": 15,
+        "socket:join": 6,
+    }
+    # "views.chat=20,socket:send_message=15" replaces or adds entries of QUERY_BUDGETS.
+    QUERY_BUDGET_OVERRIDES = os.getenv("QUERY_BUDGETS", "")
+    QUERY_BUDGET_DEFAULT = None
+    QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT") == "1"
+    # Frames queued for one Socket.IO client before it is disconnected; 0 disables.
+    OUTBOUND_MAX_QUEUE = int(os.getenv("OUTBOUND_MAX_QUEUE", 1000))
+    OUTBOUND_COALESCE_EVENTS = ("typing_update", "online_update")
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+    # "memory" (per worker), "database" (shared between workers) or "module:Class".
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+    # action -> {"user" | "channel": (burst capacity, seconds to refill it)}
+    RATE_LIMITS = {
+        "send_message": {"user": (8, 10), "channel": (60, 10)},
+        "typing": {"user": (20, 10)},
+        "edit_message": {"user": (10, 30)},
+        "chat_read": {"user": (60, 60)},
+    }
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+    PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", 30))
+    PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", os.path.join(BASE_DIR, "profiles"))
+    # Seconds a greenlet may hold the eventlet hub before it is logged; 0 disables.
+    HUB_BLOCK_THRESHOLD = float(os.getenv("HUB_BLOCK_THRESHOLD", 0))
+    # Durable background jobs (app/jobs.py); one worker holds the lease and runs singletons.
+    JOBS_ENABLED = os.getenv("JOBS_ENABLED") == "1"
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 5))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 30))
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 900))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 30))
+    JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", 7))
+    # Read notifications older than this are pruned by a job; 0 keeps them forever.
+    NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 30))
+    # Seconds between unreferenced-upload sweeps by a job; 0 disables.
+    UPLOAD_GC_INTERVAL = float(os.getenv("UPLOAD_GC_INTERVAL", 86400))
+    UPLOAD_GC_GRACE = int(os.getenv("UPLOAD_GC_GRACE", 3600))